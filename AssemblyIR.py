@@ -0,0 +1,112 @@
+"""
+A compact binary format for storing the assembly between steps 2 and 3
+Instead of a json list of dicts, each instruction is a fixed size record of its op number, registers, and immediate
+The op numbers are only known while the program runs (see Instructions.op_id), so their names are stored at the end
+
+File layout:
+    header:  magic, format version, record count, op name count, offset of the op names
+    records: one record per instruction (see record_format)
+    ops:     the op names, each as a length and then the utf-8 bytes, in the order of their numbers
+"""
+
+import mmap
+import struct
+from Instructions import InstructionTable, op_id, op_names
+
+# numpy is optional, it reads the records faster but everything works without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+magic = b"LKA\0"
+format_version = 1
+# magic, format version, (unused), number of records, number of op names, where the op names start
+header_format = struct.Struct("<4sHHIIQ")
+# op number, rd, rs1, rs2, (pad), immediate
+record_format = struct.Struct("<Hbbbxq")
+string_length_format = struct.Struct("<I")
+
+
+def write_table(table, filename):
+    """
+    write the instructions to the given file in the binary format
+    @input table: an InstructionTable of the instructions
+    @input filename: the path of the file to write
+    @return: none
+    """
+    names = list(op_names)
+    with open(filename, "wb") as file:
+        ops_offset = header_format.size + len(table) * record_format.size
+        file.write(header_format.pack(magic, format_version, 0, len(table), len(names), ops_offset))
+        records = bytearray(len(table) * record_format.size)
+        for ndx, fields in enumerate(zip(table.op, table.rd, table.rs1, table.rs2, table.imm)):
+            record_format.pack_into(records, ndx * record_format.size, *fields)
+        file.write(records)
+        for name in names:
+            encoded = name.encode("utf-8")
+            file.write(string_length_format.pack(len(encoded)))
+            file.write(encoded)
+
+
+def read_table(filename):
+    """
+    read the instructions out of a file in the binary format, memory mapping it rather than reading it all in
+    @input filename: the path of the file to read
+    @return table: an InstructionTable of the instructions
+    @throw: ValueError if the file isn't in the binary assembly format
+    """
+    table = InstructionTable()
+    with open(filename, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if len(data) < header_format.size:
+                raise ValueError(f"{filename} is too short to be a binary assembly")
+            file_magic, version, _, num_records, num_ops, ops_offset = header_format.unpack_from(data, 0)
+            if file_magic != magic:
+                raise ValueError(f"{filename} is not a binary assembly")
+            if version != format_version:
+                raise ValueError(f"{filename} is binary assembly version {version}, but only version {format_version} is supported")
+            if ops_offset != header_format.size + num_records * record_format.size:
+                raise ValueError(f"{filename} has the wrong number of records for its size")
+            if ops_offset > len(data):
+                raise ValueError(f"{filename} is cut off before the end of its records")
+
+            # the op names at the end, and what each of them is numbered as in this run
+            renumber = []
+            offset = ops_offset
+            for _ in range(num_ops):
+                if offset + string_length_format.size > len(data):
+                    raise ValueError(f"{filename} is cut off before the end of its op names")
+                (length,) = string_length_format.unpack_from(data, offset)
+                offset += string_length_format.size
+                renumber.append(op_id(str(data[offset:offset + length], "utf-8")))
+                offset += length
+
+            view = memoryview(data)
+            try:
+                if numpy:
+                    # every field of every record at once, copied out so nothing points into the map once it's closed
+                    dtype = numpy.dtype([("op", "<u2"), ("rd", "i1"), ("rs1", "i1"), ("rs2", "i1"), ("pad", "u1"), ("imm", "<i8")])
+                    fields = numpy.frombuffer(view[header_format.size:ops_offset], dtype=dtype).copy()
+                else:
+                    fields = list(record_format.iter_unpack(view[header_format.size:ops_offset]))
+            finally:
+                # the map can't be closed while there are views into it
+                del view
+
+    if numpy:
+        if num_records > 0 and int(fields["op"].max()) >= num_ops:
+            raise ValueError(f"{filename} has an instruction with an unknown op")
+        table.op.frombytes(numpy.array(renumber, dtype=numpy.uint16)[fields["op"]].tobytes())
+        for name in ["rd", "rs1", "rs2", "imm"]:
+            getattr(table, name).frombytes(numpy.ascontiguousarray(fields[name]).tobytes())
+    else:
+        for op, rd, rs1, rs2, imm in fields:
+            if op >= num_ops:
+                raise ValueError(f"{filename} has an instruction with an unknown op")
+            table.op.append(renumber[op])
+            table.rd.append(rd)
+            table.rs1.append(rs1)
+            table.rs2.append(rs2)
+            table.imm.append(imm)
+    return table
@@ -0,0 +1,165 @@
+"""
+A content-addressed cache for the results of each compilation step
+Each step's outputs are stored under a hash of its input files, the Luka version, and the tables the steps are built from
+So re-running a step on an unchanged input just copies the outputs back out, instead of redoing the work
+The cache is kept under a size limit by throwing out the least recently used entries
+"""
+
+import hashlib
+import os
+import pickle
+from params import luka_version, default_cache_folder, default_cache_size
+
+# the source files the steps are built from, so changing any of them starts the cache over
+source_files = [
+    "params.py",
+    "Grammar.py",
+    "GrammarIR.py",
+    "Environment.py",
+    "AssemblyIR.py",
+    "Instructions.py",
+    "Encodings.py",
+    "Optimizer.py",
+    "step1compiler.py",
+    "step2assembler.py",
+    "step3encoder.py",
+]
+
+# the fingerprint is the same for the whole run, so only work it out once
+fingerprint_cache = {}
+
+def spec_fingerprint():
+    """
+    hashes the Luka version, the spec tables, and the source of the steps
+    @input: none
+    @return: a hex string that changes if any of them change
+    """
+    if "fingerprint" in fingerprint_cache:
+        return fingerprint_cache["fingerprint"]
+    # imported here, since the steps import this module too
+    import Grammar
+    import Encodings
+    import step3encoder
+
+    hasher = hashlib.sha256()
+    hasher.update(luka_version.encode("utf-8"))
+    # the grammar specs, in priority order
+    for clss in Grammar.priority:
+        hasher.update(repr([str(spec) + repr(spec.symbol) for spec in Grammar.command_specs[clss]]).encode("utf-8"))
+    # the instruction types and their codes
+    for tipe in Encodings.instr_types:
+        hasher.update(repr((tipe.__name__, Encodings.instr_types[tipe], sorted(tipe.instr_codes.items()))).encode("utf-8"))
+    hasher.update(repr(sorted(step3encoder.build_default_specs().items())).encode("utf-8"))
+    # and the code itself
+    folder = os.path.dirname(os.path.abspath(__file__))
+    for filename in source_files:
+        with open(os.path.join(folder, filename), "rb") as file:
+            hasher.update(file.read())
+    fingerprint_cache["fingerprint"] = hasher.hexdigest()
+    return fingerprint_cache["fingerprint"]
+
+
+class BuildCache():
+    """
+    the cache folder, and the lookups and storing into it
+    """
+    def __init__(self, folder=default_cache_folder, max_size=default_cache_size, enabled=True, debug=False):
+        """
+        @input folder: where to keep the cached results
+        @input max_size: the most bytes the cache can take up before old entries get thrown out
+        @input enabled: False to never find or store anything (for --no-cache)
+        @input debug: whether to print the hits and misses
+        """
+        self.folder = folder
+        self.max_size = max_size
+        self.enabled = enabled
+        self.debug = debug
+
+    def key(self, stage, input_files, options=(), fingerprint=True):
+        """
+        works out the key that a stage's results are stored under
+        the files are hashed in chunks, so large inputs don't need to be read in all at once
+        @input stage: the name of the stage (so different stages on the same input don't collide)
+        @input input_files: a list of the paths of the files the stage reads
+        @input options: anything else that changes the outputs, like command line flags
+        @input fingerprint: False to leave out the Luka version and the steps' tables and source,
+            for outputs that only come from the input files (like the compiled processor)
+        @return: the key as a hex string
+        """
+        hasher = hashlib.sha256()
+        if fingerprint: hasher.update(spec_fingerprint().encode("utf-8"))
+        hasher.update(repr((stage, tuple(options))).encode("utf-8"))
+        for filename in input_files:
+            with open(filename, "rb") as file:
+                for chunk in iter(lambda: file.read(1 << 20), b""):
+                    hasher.update(chunk)
+            # mark where one file ends and the next begins
+            hasher.update(b"\0")
+        return hasher.hexdigest()
+
+    def restore(self, key, output_files, warnings):
+        """
+        if the results for the key are stored, write them into the output files
+        @input key: the key from self.key
+        @input output_files: a list of the paths to write each of the stored outputs to
+        @input warnings: a pre-existing list of warnings, the ones from the original run are added on
+        @return: True if they were found and written, False otherwise
+        """
+        if not self.enabled: return False
+        entry = os.path.join(self.folder, key)
+        try:
+            with open(entry, "rb") as file:
+                stored = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            if self.debug: print("Cache miss for", key[:16])
+            return False
+        if len(stored["outputs"]) != len(output_files):
+            return False
+        for filename, contents in zip(output_files, stored["outputs"]):
+            with open(filename, "wb") as file:
+                file.write(contents)
+        warnings += stored["warnings"]
+        # mark it as recently used
+        os.utime(entry)
+        if self.debug: print("Cache hit for", key[:16])
+        return True
+
+    def store(self, key, output_files, warnings):
+        """
+        store the outputs a stage wrote, then throw out old entries if the cache has gotten too big
+        @input key: the key from self.key
+        @input output_files: a list of the paths of the files the stage wrote
+        @input warnings: the warnings the stage gave, to give them again when restoring
+        @return: none
+        """
+        if not self.enabled: return
+        outputs = []
+        for filename in output_files:
+            with open(filename, "rb") as file:
+                outputs.append(file.read())
+        os.makedirs(self.folder, exist_ok=True)
+        entry = os.path.join(self.folder, key)
+        # write it somewhere else first, so nothing can read half an entry
+        with open(entry + ".partial", "wb") as file:
+            pickle.dump({"warnings": list(warnings), "outputs": outputs}, file)
+        os.replace(entry + ".partial", entry)
+        if self.debug: print("Cached the results under", key[:16])
+        self.evict()
+
+    def evict(self):
+        """
+        throws out the least recently used entries until the cache is under its size limit
+        @input: none
+        @return: none
+        """
+        entries = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            stats = os.stat(path)
+            entries.append((stats.st_mtime, stats.st_size, path))
+        total = sum([size for _, size, _ in entries])
+        for _, size, path in sorted(entries):
+            if total <= self.max_size: break
+            os.remove(path)
+            total -= size
+            if self.debug: print("Evicted", os.path.basename(path)[:16], "from the cache")
@@ -5,9 +5,50 @@ So, just create a conversion for each one and then specify where each instructio
 """
 
 from abc import ABC, abstractmethod
+from array import array
+from Instructions import InstructionTable, op_names, no_register, no_immediate
+
+# numpy is optional, it makes encoding big programs faster but everything works without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # will map each instruction type to the instructions that are part of it
 instr_types = {}
+# maps each instruction to (its type, fn3, opcode), so they can be looked up straight away
+op_formats = {}
+
+
+def register_type(tipe, ops):
+    """
+    adds an instruction type and the instructions that are part of it, working out their codes up front
+    @input tipe: the class of the type (a child of base_type)
+    @input ops: a list of the operation names in it
+    @return: none
+    @throw: ValueError if an op is already part of another type, has no codes, or has the same codes as another op
+    """
+    codes = {(fn3, opcode): op for op, (_, fn3, opcode) in op_formats.items()}
+    for op in ops:
+        if op in op_formats:
+            raise ValueError(f"Operation {op} is in both {op_formats[op][0].__name__} and {tipe.__name__}")
+        try:
+            fn3, opcode = tipe.get_opcode(op)
+        except AssertionError as err:
+            raise ValueError(str(err))
+        if (fn3, opcode) in codes:
+            raise ValueError(f"Operation {op} has the same fn3 and opcode as {codes[(fn3, opcode)]}")
+        codes[(fn3, opcode)] = op
+        op_formats[op] = (tipe, fn3, opcode)
+    instr_types[tipe] = list(ops)
+
+
+def opcode_of(op):
+    """
+    @input op: the operation name
+    @return: a tuple (fn3, opcode) for it
+    """
+    return op_formats[op][1:]
 
 def int_to_binary(integer, length=4):
     """
@@ -20,9 +61,11 @@ def int_to_binary(integer, length=4):
         assert len(basic) <= length, f"The bits needed for {integer} are more than the space to store it!"
         return basic.zfill(length)
     else:
-        twos_comp = 1 - integer
-        basic = bin(twos_comp)[2:]
-        assert len(basic) <= length, f"The bits needed for {integer} are more than the space to store it!"
+        # the two's complement is the flipped bits of one less than the size
+        ones_comp = -integer - 1
+        basic = bin(ones_comp)[2:] if ones_comp > 0 else ""
+        # and needs one more bit for the sign
+        assert len(basic) < length, f"The bits needed for {integer} are more than the space to store it!"
         sized = basic.zfill(length)
         return "".join(["1" if char == "0" else "0" for char in sized])
         # raise NotImplementedError("We do not currently support negative binary numbers")
@@ -44,10 +87,11 @@ class base_type(ABC):
     @abstractmethod
     def __str__(self):
         pass
+    @classmethod
     @abstractmethod
-    def get_opcode(self, op=None):
+    def get_opcode(cls, op):
         """
-        for the stored op, find the relevant opcode
+        for the given op, find the relevant opcode
         if there is also a fn3 (and even fn7) return it as well in a tuple
         """
         pass
@@ -73,6 +117,8 @@ class rtype:
         # "sll": "110",
         # "srl": "111",
     }
+    # where each field goes in the binary, for encode_words, as (field, from bit, width, to bit)
+    layout = [("rs2", 0, 4, 11), ("rs1", 0, 4, 7), ("rd", 0, 4, 3)]
 
     def __init__(self, dic):
         """
@@ -89,24 +135,23 @@ class rtype:
         self.rd = dic["rd"]
     def __str__(self):
         return (self.op + " x" + self.rd + ", x" + self.rs1 + ", x" + self.rs2)
-    def get_opcode(self, op=None):
+    @classmethod
+    def get_opcode(cls, op):
         """
-        for the stored op, find the relevant opcode, returning a tuple (fn3, opcode)
+        for the given op, find the relevant opcode, returning a tuple (fn3, opcode)
         """
-        if op is None:
-            op = self.op
-        assert op in self.instr_codes, f"Operation {op} doesn't have an operation code assigned for an R-Type"
-        return (self.instr_codes[op], "001")
+        assert op in cls.instr_codes, f"Operation {op} doesn't have an operation code assigned for an R-Type"
+        return (cls.instr_codes[op], "001")
     def get_binary(self):
         """
         using the internal values, outputs a list of ints representing the binary instruction
         """
-        fn3, optype = self.get_opcode()
+        fn3, optype = opcode_of(self.op)
         rs1 = int_to_binary(self.rs1, 4)
         rs2 = int_to_binary(self.rs2, 4)
         rd = int_to_binary(self.rd, 4)
         return fn3 + "0" + rs2 + rs1 + rd + optype
-instr_types[rtype] = ["add", "sub", "slt", "xor"]
+register_type(rtype, ["add", "sub", "slt", "xor"])
 
 
 class itype:
@@ -135,6 +180,7 @@ class itype:
         "slli": "011",
         "srli": "111",
     }
+    layout = [("imm", 0, 5, 11), ("rs1", 0, 4, 7), ("rd", 0, 4, 3)]
     def __init__(self, dic):
         """
         takes in a dict of the instruction and unwraps the needed values
@@ -150,33 +196,91 @@ class itype:
         self.rd = dic["rd"]
     def __str__(self):
         if self.op in ["lw", "lh", "lb"]:
-            return (self.op + " x" + self.rd + ", " + self.imm + "(" + self.rs1 + ")")
+            return (self.op + " x" + str(self.rd) + ", " + str(self.imm) + "(x" + str(self.rs1) + ")")
         else:
-            return (self.op + " x" + self.rd + ", x" + self.rs1 + ", " + self.imm)
-    def get_opcode(self, op=None):
+            return (self.op + " x" + str(self.rd) + ", x" + str(self.rs1) + ", " + str(self.imm))
+    @classmethod
+    def get_opcode(cls, op):
         """
-        for the stored op, find the relevant opcode, returning a tuple (fn3, opcode)
+        for the given op, find the relevant opcode, returning a tuple (fn3, opcode)
         """
-        if op is None:
-            op = self.op
-        assert op in self.instr_codes, f"Operation {op} doesn't have an operation code assigned for an I-Type"
-        return (self.instr_codes[op], "010")
+        assert op in cls.instr_codes, f"Operation {op} doesn't have an operation code assigned for an I-Type"
+        return (cls.instr_codes[op], "010")
     def get_binary(self):
         """
         using the internal values, outputs a list of ints representing the binary instruction
         """
-        fn3, optype = self.get_opcode()
+        fn3, optype = opcode_of(self.op)
         rs1 = int_to_binary(self.rs1, 4)
         rd = int_to_binary(self.rd, 4)
         imm = int_to_binary(self.imm, 5)
         return fn3 + imm + rs1 + rd + optype
-instr_types[itype] = ["addi", "subi", "xori", "slti", "sltiu"]
+register_type(itype, ["addi", "subi", "xori", "slti", "sltiu"])
 
-# class stype:
-#     """
-#     store type
-#     from a register using a base and offset, but no writeback
-#     """
+class stype:
+    """
+    store type
+    from a register using a base and offset, but no writeback
+    the immediate is split around the registers, going where rd would be for the low bits
+    """
+    instr_codes = {
+        "sw": "101",
+    }
+    # the top bit of the immediate goes before rs2, and the rest where rd would be
+    layout = [("imm", 4, 1, 15), ("rs2", 0, 4, 11), ("rs1", 0, 4, 7), ("imm", 0, 4, 3)]
+    def __init__(self, dic):
+        """
+        takes in a dict of the instruction and unwraps the needed values
+        """
+        # capture the op, for conversion to opcode
+        assert "op" in dic, f"Stype is missing op field, given {dic}"
+        self.op = dic["op"]
+        assert "rs1" in dic, f"Stype {self.op} is missing rs1 field"
+        self.rs1 = dic["rs1"]
+        assert "rs2" in dic, f"Stype {self.op} is missing rs2 field"
+        self.rs2 = dic["rs2"]
+        assert "imm" in dic, f"Stype {self.op} is missing imm field"
+        self.imm = dic["imm"]
+    def __str__(self):
+        return (self.op + " x" + str(self.rs2) + ", " + str(self.imm) + "(x" + str(self.rs1) + ")")
+    @classmethod
+    def get_opcode(cls, op):
+        """
+        for the given op, find the relevant opcode, returning a tuple (fn3, opcode)
+        """
+        assert op in cls.instr_codes, f"Operation {op} doesn't have an operation code assigned for an S-Type"
+        return (cls.instr_codes[op], "011")
+    def get_binary(self):
+        """
+        using the internal values, outputs a list of ints representing the binary instruction
+        """
+        fn3, optype = opcode_of(self.op)
+        rs1 = int_to_binary(self.rs1, 4)
+        rs2 = int_to_binary(self.rs2, 4)
+        # fn3 starting with a 1 is unsigned, so the offset is from 0 to 31
+        assert 0 <= self.imm < 32, f"The offset {self.imm} doesn't fit in a store"
+        imm = int_to_binary(self.imm, 5)
+        return fn3 + imm[0] + rs2 + rs1 + imm[1:] + optype
+register_type(stype, ["sw"])
+
+
+class ltype(itype):
+    """
+    load type
+    from a base register and offset into a register
+    encoded the same as an I-type, but shares the S-type's opcode, using the fn3 to tell them apart
+    """
+    instr_codes = {
+        "lw": "100",
+    }
+    @classmethod
+    def get_opcode(cls, op):
+        """
+        for the given op, find the relevant opcode, returning a tuple (fn3, opcode)
+        """
+        assert op in cls.instr_codes, f"Operation {op} doesn't have an operation code assigned for a load"
+        return (cls.instr_codes[op], "011")
+register_type(ltype, ["lw"])
 
 
 # class btype:
@@ -211,6 +315,7 @@ class atype:
     instr_codes = {
         "prnt": "0",
     }
+    layout = [("rs1", 0, 4, 7)]
     def __init__(self, dic):
         """
         takes in a dict of the instruction and unwraps the needed values
@@ -222,24 +327,23 @@ class atype:
         self.rs1 = dic["rs1"]
     def __str__(self):
         return (self.op + " x" + self.rs1)
-    def get_opcode(self, op=None):
+    @classmethod
+    def get_opcode(cls, op):
         """
-        for the stored op, find the relevant opcode, returning the opcode
+        for the given op, find the relevant opcode, returning the opcode
         """
-        if op is None:
-            op = self.op
-        assert op in self.instr_codes, f"Operation {op} doesn't have an operation code assigned for an A-Type"
-        return (self.instr_codes[op], "111")
+        assert op in cls.instr_codes, f"Operation {op} doesn't have an operation code assigned for an A-Type"
+        return (cls.instr_codes[op], "111")
     def get_binary(self):
         """
         using the internal values, outputs a list of ints representing the binary instruction
         """
-        fn3, optype = self.get_opcode()
+        fn3, optype = opcode_of(self.op)
         rs1 = int_to_binary(self.rs1, 4)
         spacing1 = "".join(["0"] * 7)
         spacing2 = "".join(["0"] * 4)
         return fn3 + spacing1 + rs1 + spacing2 + optype
-instr_types[atype] = ["prnt"]
+register_type(atype, ["prnt"])
 
 
 class ptype:
@@ -249,6 +353,7 @@ class ptype:
     operates only on the immediate with no returns
     """
     instr_codes = {}#"prnti":""}
+    layout = [("imm", 0, 16, 3)]
     def __init__(self, dic):
         """
         takes in a dict of the instruction and unwraps the needed values
@@ -260,22 +365,21 @@ class ptype:
         self.value = dic["imm"]
     def __str__(self):
         return (self.op + " " + self.value)
-    def get_opcode(self, op=None):
+    @classmethod
+    def get_opcode(cls, op):
         """
-        for the stored op, find the relevant opcode, returning just the opcode
+        for the given op, find the relevant opcode, returning just the opcode
         """
-        if op is None:
-            op = self.op
         assert op == "prnti", f"Operation {op} doesn't have an operation code assigned for an P-Type"
         return ("", "000")
     def get_binary(self):
         """
         using the internal values, outputs a list of ints representing the binary instruction
         """
-        _, optype = self.get_opcode()
+        _, optype = opcode_of(self.op)
         value = int_to_binary(self.value, 16)
         return value + optype
-instr_types[ptype] = ["prnti"]
+register_type(ptype, ["prnti"])
 
 
 
@@ -285,10 +389,9 @@ def choose_type(op):
     @input op: a string representing the instruction name
     @return: the class of the type to use (a child of base_type)
     """
-    for tipe in instr_types:
-        if op in instr_types[tipe]:
-            return tipe
-    raise ValueError(f"Unable to find a matching type for op {op}")
+    if op not in op_formats:
+        raise ValueError(f"Unable to find a matching type for op {op}")
+    return op_formats[op][0]
 
 
 def get_all_defined_instrs():
@@ -297,4 +400,102 @@ def get_all_defined_instrs():
     @input: none
     @return: a list of strings
     """
-    return [instr for instr_list in instr_types.values() for instr in instr_list]
\ No newline at end of file
+    return list(op_formats.keys())
+
+
+def immediate_range(op, specs):
+    """
+    the immediates an instruction can hold, going by how the processor decodes them
+    I-types (and loads) are sign extended unless the top bit of their fn3 is a 1, stores are unsigned,
+        and prints get the whole value
+    @input op: the operation name
+    @input specs: the processor specs, like from step3encoder.build_default_specs
+    @return: a range of the allowed immediates, or None if the instruction doesn't have one
+    """
+    imm_w = int(specs["IMM_W"])
+    value_w = int(specs["VALUE_W"])
+    if op not in op_formats: return None
+    tipe, fn3, _ = op_formats[op]
+    if tipe is ptype:
+        return range(-(1 << (value_w - 1)), 1 << value_w)
+    if tipe is stype:
+        return range(0, 1 << imm_w)
+    if tipe in [ltype, itype]:
+        if fn3[0] == "1": return range(0, 1 << imm_w)
+        return range(-(1 << (imm_w - 1)), 1 << (imm_w - 1))
+    return None
+
+
+def encode_words(instructions, instr_w=19):
+    """
+    encodes a list of instructions (as dicts) into integers, see encode_table
+    @input instructions: a list of the instructions as dicts
+    @input instr_w: how many bits an instruction is
+    @return words: the encoded instructions
+    @throw: ValueError if an instruction can't be encoded
+    """
+    return encode_table(InstructionTable.from_dicts(instructions), instr_w)
+
+
+def encode_table(table, instr_w=19):
+    """
+    encodes the instructions straight into integers, packing the fields in with shifts,
+        rather than building and joining strings for each one
+    the instructions are grouped by their format, and each format is packed all at once
+        (using numpy arrays if numpy is installed)
+    @input table: an InstructionTable of the instructions
+    @input instr_w: how many bits an instruction is
+    @return words: the encoded instructions, as a numpy uint32 array (or an array.array of "I"s without numpy)
+    @throw: ValueError if an instruction can't be encoded
+    """
+    # the format, and the fn3 and opcode bits, for each op number used
+    formats = {}
+    for number in (numpy.unique(numpy.frombuffer(table.op, dtype=numpy.uint16)).tolist() if numpy else set(table.op)):
+        op = op_names[number]
+        fn3, opcode = opcode_of(op) if op in op_formats else ("", "")
+        formats[number] = (choose_type(op), (int(fn3, 2) << (instr_w - len(fn3)) if fn3 else 0) | int(opcode or "0", 2))
+
+    def check(tipe, field, values, missing):
+        """make sure the field is there, and fits the same way int_to_binary checks it"""
+        width = sum([w for name, _, w, _ in tipe.layout if name == field])
+        low, high = -(1 << (width - 1)), 1 << width
+        for value in values:
+            if value == missing: raise ValueError(f"{tipe.__name__} is missing {field} field")
+            if not low <= value < high: raise ValueError(f"The bits needed for {value} are more than the space to store it!")
+
+    if numpy:
+        ops = numpy.frombuffer(table.op, dtype=numpy.uint16)
+        columns = {
+            "rd": numpy.frombuffer(table.rd, dtype=numpy.int8).astype(numpy.int64),
+            "rs1": numpy.frombuffer(table.rs1, dtype=numpy.int8).astype(numpy.int64),
+            "rs2": numpy.frombuffer(table.rs2, dtype=numpy.int8).astype(numpy.int64),
+            "imm": numpy.frombuffer(table.imm, dtype=numpy.int64),
+        }
+        bases = numpy.zeros(len(op_names), dtype=numpy.int64)
+        for number, (_, base) in formats.items(): bases[number] = base
+        words = numpy.zeros(len(table), dtype=numpy.uint32)
+        for tipe in set([tipe for tipe, _ in formats.values()]):
+            rows = numpy.isin(ops, [number for number, (other, _) in formats.items() if other is tipe])
+            packed = bases[ops[rows]]
+            for field in set([name for name, _, _, _ in tipe.layout]):
+                values = columns[field][rows]
+                missing = no_immediate if field == "imm" else no_register
+                width = sum([w for name, _, w, _ in tipe.layout if name == field])
+                bad = (values == missing) | (values < -(1 << (width - 1))) | (values >= 1 << width)
+                if bad.any(): check(tipe, field, values[bad].tolist(), missing)
+            for field, start, width, to in tipe.layout:
+                packed |= ((columns[field][rows] >> start) & ((1 << width) - 1)) << to
+            words[rows] = packed
+        return words
+
+    words = array("I", bytes(4 * len(table)))
+    columns = {"rd": table.rd, "rs1": table.rs1, "rs2": table.rs2, "imm": table.imm}
+    for ndx, number in enumerate(table.op):
+        tipe, word = formats[number]
+        for field, start, width, to in tipe.layout:
+            value = columns[field][ndx]
+            if value == (no_immediate if field == "imm" else no_register) or not -(1 << (width - 1)) <= value < 1 << width:
+                check(tipe, field, [value], no_immediate if field == "imm" else no_register)
+            word |= ((value >> start) & ((1 << width) - 1)) << to
+        words[ndx] = word
+    return words
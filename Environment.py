@@ -0,0 +1,171 @@
+"""
+An immutable map from names to values, for the environments that py_eval and type_eval pass from one command to the next
+Storing a value makes a new Environment sharing almost everything with the old one, rather than copying a whole dict,
+    so each value stored takes O(log n) time and memory instead of O(n), and older environments are left unchanged
+
+Small environments are just a plain dict, since copying a few names is faster than building levels of the trie,
+    so they're passed along as dicts (see store) and only made into an Environment once they have more than small_size names
+Either one is looked up the same way, with `name in env` and `env[name]`
+
+The trie is a hash trie: each level of the tree uses the next 5 bits of a name's hash to pick one of its 32 branches
+A branch is empty (None), a (name, value) tuple, a deeper level (a list), or a Collision once the hash runs out
+The lists are copied on the way down to a change, and never changed once they're in an Environment
+"""
+
+branch_bits = 5
+num_branches = 1 << branch_bits
+branch_mask = num_branches - 1
+hash_w = 64
+hash_mask = (1 << hash_w) - 1
+small_size = 32
+
+
+class Collision():
+    """
+    the (name, value) tuples whose names all have the same hash, once there aren't any bits left to branch on
+    """
+    __slots__ = ("pairs",)
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+
+def assoc(node, name, hashed, value, shift):
+    """
+    stores a value, copying only the levels on the way down to it
+    @input node: the level (or Collision) to store it under
+    @input name: the name to store it as
+    @input hashed: the name's hash (masked to hash_w bits)
+    @input value: the value to store
+    @input shift: how many bits of the hash the levels above have used
+    @return: the new level, and whether the name is new (rather than replacing a value)
+    """
+    if node.__class__ is Collision:
+        pairs = tuple([pair for pair in node.pairs if pair[0] != name])
+        return Collision(pairs + ((name, value),)), len(pairs) == len(node.pairs)
+    branch = (hashed >> shift) & branch_mask
+    entry = node[branch]
+    if entry is None:
+        child, added = (name, value), True
+    elif entry.__class__ is not tuple:
+        child, added = assoc(entry, name, hashed, value, shift + branch_bits)
+    elif entry[0] == name:
+        child, added = (name, value), False
+    else:
+        # two names on the same branch, so it splits into another level
+        child, added = split(entry, (name, value), hashed, shift + branch_bits), True
+    node = list(node)
+    node[branch] = child
+    return node, added
+
+
+def split(old, new, new_hash, shift):
+    """
+    makes a new level for two (name, value) tuples whose hashes matched on the levels above
+    @input old, new: the two tuples
+    @input new_hash: the hash of the new one's name (the old one's is found again)
+    @input shift: how many bits of the hash the levels above have used
+    @return: the new level, or a Collision if the hashes are the same all the way down
+    """
+    if shift >= hash_w: return Collision((old, new))
+    node, _ = assoc([None] * num_branches, old[0], hash(old[0]) & hash_mask, old[1], shift)
+    node, _ = assoc(node, new[0], new_hash, new[1], shift)
+    return node
+
+
+def to_trie(values):
+    """
+    @input values: a dict of names and values
+    @return: the top level of a trie holding them
+    """
+    root = [None] * num_branches
+    for name, value in values.items():
+        root, _ = assoc(root, name, hash(name) & hash_mask, value, 0)
+    return root
+
+
+class Environment():
+    """
+    the names in scope and their values (or data types, when type checking), once there are too many to copy as a dict
+    it's looked up like a dict, but is never changed: set gives back a new Environment instead
+    """
+    __slots__ = ("root", "size")
+    def __init__(self, values=None):
+        """
+        @input values: a dict of the names and values to start with, or None for none
+        """
+        # the top level of the trie
+        self.root = to_trie(values or {})
+        self.size = len(values) if values else 0
+
+    def __str__(self):
+        return "Environment(" + ", ".join([f"{name}={value}" for name, value in self.items()]) + ")"
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, name):
+        return self.get(name, self) is not self
+
+    def __getitem__(self, name):
+        value = self.get(name, self)
+        if value is self: raise KeyError(name)
+        return value
+
+    def get(self, name, default=None):
+        """
+        @input name: the name to look up
+        @input default: what to return if it isn't there
+        @return: the name's value, or the default
+        """
+        hashed = hash(name) & hash_mask
+        entry = self.root[hashed & branch_mask]
+        while entry.__class__ is list:
+            hashed >>= branch_bits
+            entry = entry[hashed & branch_mask]
+        if entry.__class__ is tuple:
+            return entry[1] if entry[0] == name else default
+        if entry is None:
+            return default
+        for key, value in entry.pairs:
+            if key == name: return value
+        return default
+
+    def set(self, name, value):
+        """
+        stores a value, leaving this environment as it was
+        @input name: the name to store it as, replacing any value already there
+        @input value: the value to store
+        @return: a new Environment with the value stored
+        """
+        expanded = Environment.__new__(Environment)
+        expanded.root, added = assoc(self.root, name, hash(name) & hash_mask, value, 0)
+        expanded.size = self.size + added
+        return expanded
+
+    def items(self):
+        """
+        @input: none
+        @return: a generator of the (name, value) tuples, in no particular order
+        """
+        to_search = [self.root]
+        while len(to_search) > 0:
+            node = to_search.pop()
+            for entry in node.pairs if node.__class__ is Collision else node:
+                if entry.__class__ is tuple: yield entry
+                elif entry is not None: to_search.append(entry)
+
+
+def store(env, name, value):
+    """
+    stores a value in an environment, leaving the old one as it was
+    @input env: a dict while it's small, or an Environment
+    @input name: the name to store it as, replacing any value already there
+    @input value: the value to store
+    @return: the new environment, a dict again unless it's grown past small_size names
+    """
+    if env.__class__ is not dict:
+        return env.set(name, value)
+    env = env.copy()
+    env[name] = value
+    if len(env) > small_size: return Environment(env)
+    return env
@@ -1,5 +1,8 @@
 from abc import ABC, abstractmethod
 from enum import Enum
+import operator
+import re
+from Environment import store
 
 # the different final data types Luka supports
 type_names = {"void": None}
@@ -39,19 +42,25 @@ class Spec:
     a specification for how to represent a command in Luka
     useful for translating from Luka to the grammar
     """
-    def __init__(self, command, validate, convert):
+    def __init__(self, command, validate=None, convert=None, symbol=None, parse=None):
         # the class for that given command
         self.command_type = command
-        # the function which takes in a string and returns whether it is vaild or not
+        # (for single values) the function which takes in a word and returns whether it is vaild or not
         # @input string: the string to check if it's valid
         # @return boolean: whether it is valid under this Spec or not
         self.validate = validate
-        # the convert function takes in a luka string that is valid under this spec and
+        # (for single values) the convert function takes in a word that is valid under this spec and
         # does the necessary conversions on it, returning a completed Command object
         # @input string: the entire string of the command to convert
         # @return Command: the Command form of that string
-        # @throw: whatever decode_command throws, due to a string found not matching a spec
         self.convert = convert
+        # (optional) the infix symbol splitting two values, ex "+" for Add
+        # the parser binds these tighter the later they appear in the priority table
+        self.symbol = symbol
+        # (optional) the parse function for commands that start with some set of tokens
+        # @input stream: the TokenStream, positioned at where this command might start
+        # @return Command: the parsed Command, or None (without consuming anything) if it doesn't start here
+        self.parse = parse
 
     def __str__(self):
         return str(self.command_type)[16:-2] + "Spec"
@@ -73,88 +82,218 @@ def print_specs():
     
 def function_type_spec(command_type, start, minlen, end):
     """
-    call this to generate the validation and conversion functions for a function type of Command
-    this means it starts with some string, ends with some string, and has some minimum length string in the middle
-    that must recursively be decoded
+    call this to generate the parse function for a function type of Command
+    this means it starts with some string, ends with some string, and has some minimum length expression in the middle
+    that must recursively be parsed
     @input command_type: the class name of the specific command
     @input start: the string that the input should begin with
     @input minlen: the minimum length of the string in the middle
     @input end: the string that the input should end with
-    @return: a created spec with the needed validation and conversion elements
+    @return: a created spec with the needed parse function
     """
-    startlen = len(start)
-    endlen = len(end)
+    # the start and end split up into tokens, filled in on the first parse
+    split_tokens = {}
+    def function_type_parse(stream):
+        if not split_tokens:
+            split_tokens["start"] = [text for _, text in tokenize(start)]
+            split_tokens["end"] = [text for _, text in tokenize(end)]
+        start_tokens = split_tokens["start"]
+        end_tokens = split_tokens["end"]
+        if not stream.matches(start_tokens): return None
+        stream.skip(len(start_tokens))
+        # an empty middle is the only way to be shorter than the minimum
+        if minlen > 0 and stream.matches(end_tokens):
+            raise SyntaxError(f"Command {command_type} expects syntax of {start}<len {minlen}+>{end}")
+        middle = stream.expression()
+        stream.expect(end_tokens)
+        return command_type(middle)
+
+    return Spec(command_type, parse=function_type_parse)
+
+
+def operator_type_spec(command_type, symbol):
+    """
+    call this to generate the spec for a Command that takes in 2 inputs split by some symbol, like Add with "+"
+    the parser uses the symbol directly, so this is all that's needed to add a new operator
+    @input command_type: the class name of the specific command
+    @input symbol: the infix symbol between the two inputs
+    @return: a created spec with the symbol
+    """
+    return Spec(command_type, symbol=symbol)
 
-    def function_type_validation(string):
+
+# symbols that split up tokens, but aren't operators themselves
+punctuation = ["(", ")", ":", "="]
+
+# the tables the parser uses, built from command_specs (see build_parse_tables)
+parse_tables = {"spec_count": -1}
+
+def build_parse_tables():
+    """
+    goes through command_specs in priority order and builds the tables used by the tokenizer and parser
+    only rebuilds if new specs have been added since the last time
+    @input: none
+    @return: a dict of the tables:
+        "operators": maps an infix symbol to (rank, command class), later in the priority table is a higher rank
+        "prefixes": a list of the Specs with parse functions, in priority order
+        "literals": a list of the Specs without symbols or parse functions, in priority order
+        "lexer": the compiled regex to split a string into tokens
+    """
+    global parse_tables
+    spec_count = sum([len(specs) for specs in command_specs.values()])
+    if parse_tables["spec_count"] == spec_count:
+        return parse_tables
+
+    operators = {}
+    prefixes = []
+    literals = []
+    for clss in priority:
+        # within a class, longer symbols split first (so "a >= b > c" is GrEq(a, Gr(b, c))), like the old string matching did
+        specs = sorted(command_specs[clss], key=lambda spec: -len(spec.symbol) if spec.symbol is not None else 0)
+        for spec in specs:
+            if spec.symbol is not None:
+                operators[spec.symbol] = (len(operators), spec.command_type)
+            elif spec.parse is not None:
+                prefixes.append(spec)
+            else:
+                literals.append(spec)
+
+    # longest symbols first, so ">=" isn't split into ">" and "="
+    symbols = sorted(list(operators.keys()) + punctuation, key=len, reverse=True)
+    delimiters = "".join(set([symb[0] for symb in symbols]))
+    lexer = re.compile(
+        r"(\s+)"                                                   # white space, skipped
+        + "|(" + "|".join([re.escape(symb) for symb in symbols]) + ")"  # symbols
+        + r"|([^\s" + re.escape(delimiters) + "]+)"                 # words (numbers, names, ...)
+        + "|(.)"                                                    # anything else isn't recognized
+    )
+
+    parse_tables = {
+        "spec_count": spec_count,
+        "operators": operators,
+        "prefixes": prefixes,
+        "literals": literals,
+        "lexer": lexer,
+    }
+    return parse_tables
+
+
+def tokenize(string):
+    """
+    splits a luka string into its tokens in a single pass
+    @input string: the string to split up
+    @return tokens: a list of (kind, text) tuples, where kind is "symbol" or "word"
+    @throw: SyntaxError if there is a character that can't start any token
+    """
+    tokens = []
+    for match in build_parse_tables()["lexer"].finditer(string):
+        space, symbol, word, unknown = match.groups()
+        if symbol is not None:
+            tokens.append(("symbol", symbol))
+        elif word is not None:
+            tokens.append(("word", word))
+        elif unknown is not None:
+            raise SyntaxError(f"Unrecognized symbol '{unknown}' at position {match.start()}")
+    return tokens
+
+
+class TokenStream():
+    """
+    the tokens of a single command, along with the current position in them
+    parses the tokens into a Command by precedence climbing over the priority table
+    """
+    def __init__(self, string):
         """
-        interpret the given string according to the known specifications,
-        returning the middle string and None otherwise
-        @input string: the string to decode
-        @return middle: the string left over in the middle of the spec after removing and validating the other parts
+        @input string: the command in luka file format
         """
-        # match start
-        if not string.startswith(start):
-            return False
+        self.string = string
+        self.tokens = tokenize(string)
+        self.index = 0
+        self.tables = build_parse_tables()
 
-        # match ending
-        # find the first occurrence of the ending sequence
-        earliest_end = string.find(end)
-        if earliest_end == -1: return False
-        # # make sure it's at the end
-        # if earliest_end != len(string) - endlen:
-        #     return False
+    def peek(self, offset=0):
+        """
+        @input offset: how many tokens past the current one to look
+        @return: the text of that token, or None if past the end
+        """
+        ndx = self.index + offset
+        return self.tokens[ndx][1] if ndx < len(self.tokens) else None
 
-        # middle length
-        middle = len(string) - startlen - endlen
-        if middle < minlen:
-            raise SyntaxError(f"Command {command_type} expects syntax of {start}<len {minlen}+>{end}")
-        
-        return True
+    def peek_kind(self, offset=0):
+        ndx = self.index + offset
+        return self.tokens[ndx][0] if ndx < len(self.tokens) else None
 
-    def function_type_conversion(string):
-        middle = string[startlen:-endlen]
-        return command_type(decode_command(middle))
+    def at_end(self):
+        return self.index >= len(self.tokens)
 
-    return Spec(command_type, function_type_validation, function_type_conversion)
+    def skip(self, count=1):
+        self.index += count
 
+    def matches(self, texts):
+        """
+        checks if the upcoming tokens are exactly the given texts, without consuming them
+        @input texts: a list of token strings
+        @return: a boolean of whether they match
+        """
+        return all([self.peek(i) == text for i, text in enumerate(texts)])
 
-# keep a list of the symbols we have to go by the longest ones first (to not break them up)
-# maps {len(symb) : [symb, othr, more, else]}
-comparison_symbols_list = {}
-def comparison_type_spec(command_type, symbol):
-    """
-    call this to generate the validation and conversion functions for a Comparison Command
-    should have 2 inputs split by some symbol
-    @input command_type: the class name of the specific command
-    @input symbol: the string that the input should search for
-    @return: a created spec with the needed validation and conversion elements
-    """
-    # add this new symbol to the list
-    global symbols_list
-    if len(symbol) in comparison_symbols_list:
-        comparison_symbols_list[len(symbol)].append(symbol)
-    else:
-        comparison_symbols_list[len(symbol)] = [symbol]
-
-    def comparison_type_validation(string):
-        global symbols_list
-        # go through those symbols larger than this one
-        this_len = len(symbol)
-        for othr_len in sorted(comparison_symbols_list.keys(), reverse=True):
-            # stop once we reach this length
-            if othr_len <= this_len: break
-            # make sure the larger symbols doesn't match
-            if any([othr in string for othr in comparison_symbols_list[othr_len]]): return False
-        # check if this symbol matches
-        return symbol in string
-
-    def comparison_type_conversion(string):
-        part1, part2 = tuple(string.rsplit(symbol, 1))
-        part1 = decode_command(part1)
-        part2 = decode_command(part2)
-        return command_type(part1, part2)
-
-    return Spec(command_type, comparison_type_validation, comparison_type_conversion)
+    def expect(self, texts):
+        """
+        consumes the given tokens
+        @input texts: a list of token strings that should be next
+        @throw: SyntaxError if they aren't the next tokens
+        """
+        if not self.matches(texts):
+            found = self.peek()
+            found = "the end" if found is None else f"'{found}'"
+            raise SyntaxError(f"Expected '{''.join(texts)}' but found {found} in '{self.string}'")
+        self.skip(len(texts))
+
+    def word(self):
+        """
+        consumes a word token
+        @return: the text of the word
+        @throw: SyntaxError if the next token isn't a word
+        """
+        if self.peek_kind() != "word":
+            found = self.peek()
+            found = "the end" if found is None else f"'{found}'"
+            raise SyntaxError(f"Expected a name or value but found {found} in '{self.string}'")
+        text = self.peek()
+        self.skip()
+        return text
+
+    def primary(self):
+        """
+        parses a single value, ie anything but an infix operator
+        @return: the Command for it
+        """
+        # commands with their own starting syntax, such as val and print
+        for spec in self.tables["prefixes"]:
+            command = spec.parse(self)
+            if command is not None: return command
+        # otherwise, should be a single word: constants and identifiers
+        text = self.word()
+        for spec in self.tables["literals"]:
+            if spec.validate(text):
+                return spec.convert(text)
+        raise ValueError(f"Unrecognized command '{text}'")
+
+    def expression(self, min_rank=0):
+        """
+        parses values joined by infix operators, only taking operators of at least min_rank
+        operators of the same rank are left associative, like the previous right split did
+        @input min_rank: the lowest operator rank this expression can use
+        @return: the Command for it
+        """
+        left = self.primary()
+        operators = self.tables["operators"]
+        while self.peek() in operators and operators[self.peek()][0] >= min_rank:
+            rank, command_type = operators[self.peek()]
+            self.skip()
+            right = self.expression(rank + 1)
+            left = command_type(left, right)
+        return left
 
 
 def decode_command(string):
@@ -163,20 +302,16 @@ def decode_command(string):
     @input string: the input command in luka file format (a string)
     @return command: the interpreted command as a Command object
     """
-    global command_specs
-
     # clean it up a little bit
     string = string.strip()
 
-    # go in order of the priorities:
-    for clss in priority:
-        # check it against each spec
-        for spec in command_specs[clss]:
-            if spec.validate(string):
-                return spec.convert(string)
-
-    # haven't found anything, not a valid command
-    raise ValueError(f"Unrecognized command '{string}'")
+    stream = TokenStream(string)
+    if stream.at_end():
+        raise ValueError(f"Unrecognized command '{string}'")
+    command = stream.expression()
+    if not stream.at_end():
+        raise SyntaxError(f"Unexpected '{stream.peek()}' in command '{string}'")
+    return command
 
 
 class Program():
@@ -186,8 +321,9 @@ class Program():
     """
     def __init__(self, commands=[]):
         """
-        @input commands: a list of Command objects representing the program
+        @input commands: a list (or any iterable) of Command objects representing the program
         """
+        commands = list(commands)
         self.commands = [comm for comm in commands if isinstance(comm, Command)]
         diff = len(commands) - len(self.commands)
         assert diff == 0, f"Program created with {diff} non-Command item(s)"
@@ -215,12 +351,21 @@ class Program():
         @return: the return value generated
         @throw: RuntimeError if something could not be evaluated
         """
-        # starts with an empty environment
+        # starts with an empty environment (a dict, until it grows, see Environment.store)
         env = {}
         for command in self.commands:
             val, env = command.py_eval(env)
         return val
 
+    def py_compile(self):
+        """
+        compiles the program into a python function, which runs it like py_run without walking the tree or looking up names
+        each variable becomes a local variable of the function (see Command.py_source)
+        @input: none
+        @return: a function taking no inputs, which runs the program and returns the return value generated
+        """
+        return py_compile_commands(self.commands)
+
     def type_check(self, errors, debug_mode=False):
         """
         evaluate the program to ensure all of the data types match and join correctly
@@ -228,20 +373,10 @@ class Program():
         @input - debug_mode: True if we should show/print our process, False to not print anything
         @return: True if there are no errors, False if something failed (info on how stored in the errors list)
         """
-        env = {}
-        for command in self.commands:
-            if debug_mode: print("- " + str(command))
-            try:
-                _, env = command.type_eval(env)
-            # TODO: add other non-fatal exception types to show mutliple type errors at once
-            except Exception as e:
-                err_response = "Data type failure"
-                if command.line_number:
-                    err_response += " for command on line " + str(command.line_number)
-                err_response += ": " + str(e)
-                errors.append(err_response)
-                return False
-        return True
+        num_errors = len(errors)
+        for _ in type_check_commands(self.commands, errors, debug_mode):
+            pass
+        return len(errors) == num_errors
     
     def classes_used(self):
         """
@@ -258,6 +393,115 @@ class Program():
 
 
 
+def type_check_commands(commands, errors, debug_mode=False):
+    """
+    type checks a stream of commands, passing each one along once it's been checked
+    the environment is threaded through from one command to the next, like in Program.type_check
+    @input commands: an iterable of Command objects
+    @input errors: the existing list of errors to append ours to
+    @input debug_mode: True if we should show/print our process, False to not print anything
+    @return: a generator of the checked commands, which stops early if one fails (info on how stored in the errors list)
+    """
+    env = {}
+    for command in commands:
+        if debug_mode: print("- " + str(command))
+        try:
+            _, env = command.type_eval(env)
+        # TODO: add other non-fatal exception types to show mutliple type errors at once
+        except Exception as e:
+            err_response = "Data type failure"
+            if command.line_number:
+                err_response += " for command on line " + str(command.line_number)
+            err_response += ": " + str(e)
+            errors.append(err_response)
+            return
+        yield command
+
+
+def py_run_commands(commands):
+    """
+    runs a stream of commands in python, passing each one along once it's been run
+    the environment is threaded through from one command to the next, like in Program.py_run
+    @input commands: an iterable of Command objects
+    @return: a generator of the commands that have been run
+    @throw: RuntimeError if something could not be evaluated
+    """
+    env = {}
+    for command in commands:
+        _, env = command.py_eval(env)
+        yield command
+
+
+def py_unbound(name):
+    """
+    what a compiled program runs for an identifier that hasn't been stored yet
+    @input name: the identifier's name
+    @return: none
+    @throw: RuntimeError, the same as Ident.py_eval
+    """
+    raise RuntimeError(f"Identifier {name} is not in scope")
+
+
+def py_compile_commands(commands):
+    """
+    compiles a list of commands into a single python function, with a line of python for each command
+    @input commands: a list of Command objects, like Program.commands
+    @return: a function taking no inputs, which runs the commands and returns the return value generated (like Program.py_run)
+    """
+    slots = {}
+    lines = ["def run():"]
+    for command in commands:
+        lines.append("    " + command.py_source(slots))
+    # the last command's value is returned, which is None unless it returns something
+    if len(commands) > 0 and isinstance(commands[-1], ReturnCommand):
+        lines[-1] = "    return " + lines[-1].strip()
+    lines.append("    return None")
+    namespace = {"py_unbound": py_unbound}
+    exec(compile("\n".join(lines), "<luka program>", "exec"), namespace)
+    return namespace["run"]
+
+
+def py_run_compiled_commands(commands):
+    """
+    runs a stream of commands in python like py_run_commands, but all at once by compiling them first (see py_compile_commands)
+    so unlike py_run_commands, nothing is passed along until all of them have been run
+    @input commands: an iterable of Command objects
+    @return: a generator of the commands that have been run
+    @throw: RuntimeError if something could not be evaluated
+    """
+    commands = list(commands)
+    py_compile_commands(commands)()
+    yield from commands
+
+
+def py_operand(command, slots, grouped=()):
+    """
+    gets the python source for one side of an operator, wrapping it in parentheses if it needs them
+    @input command: the Command on that side of the operator
+    @input slots: the variables' slots, like for Command.py_source
+    @input grouped: the classes that can go on that side without parentheses, besides single values
+    @return: a string of the python source
+    """
+    source = command.py_source(slots)
+    if isinstance(command, (Integer, Boolean, Ident) + grouped): return source
+    return "(" + source + ")"
+
+
+def command_classes():
+    """
+    gets every class a Program's grammar could use, for importing them all without looking through the program
+    @input: none
+    @return classes: a Set() object of the classes (as classes, not strings)
+    """
+    classes = set([Program])
+    to_search = [Command]
+    while len(to_search) > 0:
+        clas = to_search.pop()
+        classes.add(clas)
+        to_search += clas.__subclasses__()
+    return classes
+
+
 def merge_2_subclasses(clas, sub1, sub2):
     classes = set([clas])
     sub_classes1 = sub1.classes_used()
@@ -287,16 +531,25 @@ class Command(ABC):
     def py_eval(self, env):
         """
         evaluates the value of this expression in python
-        @input env: the environment under which to evaluate this statement
+        @input env: the Environment under which to evaluate this statement
         @return: the result of the evaluation
         @return: the new environment after evaluation
         """
         pass
     @abstractmethod
+    def py_source(self, slots):
+        """
+        gets this expression as python source, for compiling the program into a python function (see py_compile_commands)
+        each variable is stored in a local variable named after its slot number, rather than in an environment
+        @input slots: a dict of the slot number of each variable stored so far, which gets added to
+        @return: a string of the python source, which evaluates to the same result as py_eval
+        """
+        pass
+    @abstractmethod
     def type_eval(self, env):
         """
         evaluates the data type of this command
-        @input env: the environment under which to evaluate this statement
+        @input env: the Environment (of data types) under which to evaluate this statement
         @return: the result of the evaluation
         @return: the new environment after evaluation
         @throw: throws an exception if there is a type mismatch error
@@ -320,6 +573,8 @@ class NoReturnCommand(Command):
         return "NoReturnCommand"
     def py_eval(self, env):
         return None, env
+    def py_source(self, slots):
+        return "None"
     def type_eval(self, env):
         return None, env
     @abstractmethod
@@ -350,6 +605,8 @@ class Print(NoReturnCommand):
         val, new_env = self.value.py_eval(env)
         print(val)
         return None, new_env
+    def py_source(self, slots):
+        return "print(" + self.value.py_source(slots) + ")"
     def type_eval(self, env):
         tipe, new_env = self.value.type_eval(env)
         assert tipe in type_names.values(), str(tipe) + " is not a printable data type"
@@ -428,6 +685,9 @@ class Integer(Expression):
 
     def py_eval(self, env):
         return self.value, env
+
+    def py_source(self, slots):
+        return repr(self.value)
     
     def type_eval(self, env):
         return Integer, env
@@ -467,6 +727,9 @@ class Boolean(BooleanExpression):
 
     def py_eval(self, env):
         return self.value, env
+
+    def py_source(self, slots):
+        return repr(self.value)
     
     def type_eval(self, env):
         return Boolean, env
@@ -506,6 +769,9 @@ class Add(Expression):
         v1, new_env = self.v1.py_eval(env)
         v2, new_env = self.v2.py_eval(new_env)
         return v1 + v2, new_env
+
+    def py_source(self, slots):
+        return py_operand(self.v1, slots, (Add, Sub)) + " + " + py_operand(self.v2, slots)
         
     def type_eval(self, env):
         tipe1, new_env = self.v1.type_eval(env)
@@ -516,21 +782,7 @@ class Add(Expression):
     
     def classes_used(self):
         return merge_2_subclasses(Add, self.v1, self.v2)
-def add_validate(string):
-    # @input string: the string to check if it's valid
-    # @return boolean: whether it is valid under this Spec or not
-    return "+" in string
-def add_convert(string):
-    # the convert function takes in a luka string that is valid under this spec and
-    # does the necessary conversions on it, returning a completed Command object
-    # @input string: the entire string of the command to convert
-    # @return Command: the Command form of that string
-    # @throw: whatever decode_command throws, due to a string found not matching a spec
-    part1, part2 = tuple(string.rsplit("+", 1))
-    part1 = decode_command(part1)
-    part2 = decode_command(part2)
-    return Add(part1, part2)
-command_specs[priority.a].append(Spec(Add, add_validate, add_convert))
+command_specs[priority.a].append( operator_type_spec(Add, "+") )
 
 
 class Sub(Expression):
@@ -550,6 +802,9 @@ class Sub(Expression):
         v1, new_env = self.v1.py_eval(env)
         v2, new_env = self.v2.py_eval(new_env)
         return v1 - v2, new_env
+
+    def py_source(self, slots):
+        return py_operand(self.v1, slots, (Add, Sub)) + " - " + py_operand(self.v2, slots)
         
     def type_eval(self, env):
         tipe1, new_env = self.v1.type_eval(env)
@@ -560,22 +815,8 @@ class Sub(Expression):
     
     def classes_used(self):
         return merge_2_subclasses(Sub, self.v1, self.v2)
-def sub_validate(string):
-    # @input string: the string to check if it's valid
-    # @return boolean: whether it is valid under this Spec or not
-    # TODO: add something to distinguish between subtraction and negatives
-    return "-" in string
-def sub_convert(string):
-    # the convert function takes in a luka string that is valid under this spec and
-    # does the necessary conversions on it, returning a completed Command object
-    # @input string: the entire string of the command to convert
-    # @return Command: the Command form of that string
-    # @throw: whatever decode_command throws, due to a string found not matching a spec
-    part1, part2 = tuple(string.rsplit("-", 1))
-    part1 = decode_command(part1)
-    part2 = decode_command(part2)
-    return Sub(part1, part2)
-command_specs[priority.a].append(Spec(Sub, sub_validate, sub_convert))
+# TODO: add something to distinguish between subtraction and negatives
+command_specs[priority.a].append( operator_type_spec(Sub, "-") )
 
 
 class Ident(ReturnCommand):
@@ -595,6 +836,12 @@ class Ident(ReturnCommand):
             return env[self.name], env
         else:
             raise RuntimeError(f"Identifier {self.name} is not in scope")
+
+    def py_source(self, slots):
+        # the commands are compiled in the order they run, so a name without a slot yet isn't in scope
+        if self.name not in slots:
+            return f"py_unbound({self.name!r})"
+        return f"v{slots[self.name]}"
         
     def type_eval(self, env):
         if self.name in env:
@@ -634,9 +881,13 @@ class Val(NoReturnCommand):
 
     def py_eval(self, env):
         val, new_env = self.value.py_eval(env)
-        expanded_env = new_env.copy()
-        expanded_env[self.ident.name] = val
-        return None, expanded_env
+        return None, store(new_env, self.ident.name, val)
+
+    def py_source(self, slots):
+        # the value is compiled before the name gets its slot, so it can't see the value being stored
+        value = self.value.py_source(slots)
+        slot = slots.setdefault(self.ident.name, len(slots))
+        return f"v{slot} = {value}"
 
     def type_eval(self, env):
         tipe, new_env = self.value.type_eval(env)
@@ -645,9 +896,7 @@ class Val(NoReturnCommand):
             assert tipe is self.tipe, f"Value '{self.ident.name}' of type {self.tipe} fails to store a value of type {tipe}"
         else:
             self.tipe = tipe
-        expanded_env = new_env.copy()
-        expanded_env[self.ident.name] = tipe
-        return None, expanded_env
+        return None, store(new_env, self.ident.name, tipe)
 
     def classes_used(self):
         classes = set([Val, Ident])
@@ -659,49 +908,25 @@ class Val(NoReturnCommand):
 val_start = "val "
 val_type_split = ":"
 val_equals = "="
-def val_validate(string):
-    # @input string: the string to check if it's valid
-    # @return boolean: whether it is valid under this Spec or not
-    
-    # starts with the right stuff
-    if not string.startswith(val_start): return False
-    string = string[len(val_start):]
-    # split on the first equals sign
-    eq_parts = string.split(val_equals, 1)
-    if len(eq_parts) != 2: return False
-    # split on the type if it exists
-    type_parts = eq_parts[0].split(val_type_split, 1)
-    if len(type_parts) > 2 or len(type_parts) == 0: return False
-    ident = type_parts[0]
-    tipe = type_parts[1].strip() if len(type_parts) == 2 else None
-    # do need to check the identifier here
-    if not ident_validate(ident): return False
-    # and make sure it's a real data type
-    if tipe and tipe not in type_names.keys(): return False
-    # second part will be checked for whatever it ends up being
-    return True
-def val_convert(string):
-    # the convert function takes in a luka string that is valid under this spec and
-    # does the necessary conversions on it, returning a completed Command object
-    # @input string: the entire string of the command to convert
-    # @return Command: the Command form of that string
-    # @throw: whatever decode_command throws, due to a string found not matching a spec
-
-    # cut off the starting "val"
-    string = string[len(val_start):]
-    # then split on the first equals
-    front, value_string = tuple(string.split(val_equals, 1))
-    # then split on the type
-    type_split = front.split(val_type_split, 1)
-    ident_string = type_split[0]
-    type_string = type_split[1].strip() if len(type_split) == 2 else None
-    if type_string == "void": raise Exception("Cannot have a value store a void result")
-    # then decode each of the individual strings
-    ident = decode_command(ident_string) # should be an Ident class
-    tipe = type_names[type_string] if type_string else None # should be a class name
-    value = decode_command(value_string) # should be some ReturnCommand
-    return Val(tipe, ident, value)
-command_specs[priority.v].append(Spec(Val, val_validate, val_convert))
+def val_parse(stream):
+    # @input stream: the TokenStream, positioned at where this command might start
+    # @return Command: the parsed Command, or None (without consuming anything) if it doesn't start here
+    if stream.peek() != val_start.strip() or stream.peek_kind(1) != "word": return None
+    stream.skip()
+    ident_string = stream.word()
+    if not ident_validate(ident_string): raise ValueError(f"Unrecognized command '{ident_string}'")
+    # then the type, if there is one
+    tipe = None
+    if stream.peek() == val_type_split:
+        stream.skip()
+        type_string = stream.word()
+        if type_string == "void": raise Exception("Cannot have a value store a void result")
+        if type_string not in type_names: raise ValueError(f"Unrecognized data type '{type_string}'")
+        tipe = type_names[type_string]
+    stream.expect([val_equals])
+    value = stream.expression() # should be some ReturnCommand
+    return Val(tipe, Ident(ident_string), value)
+command_specs[priority.v].append(Spec(Val, parse=val_parse))
 
 
 class Comparison(BooleanExpression):
@@ -716,7 +941,8 @@ class Comparison(BooleanExpression):
         # the variables to distinguish between each comparison operator
         self.clas = Comparison
         self.name = "Comparison"
-        self.py_op = None # a lambda function
+        self.py_op = None # a function of the two values, from the operator module so it can be pickled
+        self.py_symbol = None # the python operator for it, for compiling
 
     def __str__(self):
         return f"{self.name}({self.v1}, {self.v2})"
@@ -725,6 +951,10 @@ class Comparison(BooleanExpression):
         v1, new_env = self.v1.py_eval(env)
         v2, new_env = self.v2.py_eval(new_env)
         return self.py_op(v1, v2), new_env
+
+    def py_source(self, slots):
+        # comparisons are grouped so python doesn't chain them
+        return py_operand(self.v1, slots, (Add, Sub)) + f" {self.py_symbol} " + py_operand(self.v2, slots, (Add, Sub))
         
     def type_eval(self, env):
         tipe1, new_env = self.v1.type_eval(env)
@@ -745,8 +975,9 @@ class Eq(Comparison):
         super().__init__(v1, v2)
         self.clas = Eq
         self.name = "Eq"
-        self.py_op = lambda a, b: a == b
-command_specs[priority.c].append( comparison_type_spec(Eq, "==") )
+        self.py_op = operator.eq
+        self.py_symbol = "=="
+command_specs[priority.c].append( operator_type_spec(Eq, "==") )
 
 
 class NotEq(Comparison):
@@ -757,8 +988,9 @@ class NotEq(Comparison):
         super().__init__(v1, v2)
         self.clas = NotEq
         self.name = "NotEq"
-        self.py_op = lambda a, b: a != b
-command_specs[priority.c].append( comparison_type_spec(NotEq, "!=") )
+        self.py_op = operator.ne
+        self.py_symbol = "!="
+command_specs[priority.c].append( operator_type_spec(NotEq, "!=") )
 
 
 class Gr(Comparison):
@@ -769,8 +1001,9 @@ class Gr(Comparison):
         super().__init__(v1, v2)
         self.clas = Gr
         self.name = "Gr"
-        self.py_op = lambda a, b: a > b
-command_specs[priority.c].append( comparison_type_spec(Gr, ">") )
+        self.py_op = operator.gt
+        self.py_symbol = ">"
+command_specs[priority.c].append( operator_type_spec(Gr, ">") )
 
 
 class Ls(Comparison):
@@ -781,8 +1014,9 @@ class Ls(Comparison):
         super().__init__(v1, v2)
         self.clas = Ls
         self.name = "Ls"
-        self.py_op = lambda a, b: a < b
-command_specs[priority.c].append( comparison_type_spec(Ls, "<") )
+        self.py_op = operator.lt
+        self.py_symbol = "<"
+command_specs[priority.c].append( operator_type_spec(Ls, "<") )
 
 
 class GrEq(Comparison):
@@ -793,8 +1027,9 @@ class GrEq(Comparison):
         super().__init__(v1, v2)
         self.clas = GrEq
         self.name = "GrEq"
-        self.py_op = lambda a, b: a >= b
-command_specs[priority.c].append( comparison_type_spec(GrEq, ">=") )
+        self.py_op = operator.ge
+        self.py_symbol = ">="
+command_specs[priority.c].append( operator_type_spec(GrEq, ">=") )
 
 
 class LsEq(Comparison):
@@ -805,5 +1040,6 @@ class LsEq(Comparison):
         super().__init__(v1, v2)
         self.clas = LsEq
         self.name = "LsEq"
-        self.py_op = lambda a, b: a <= b
-command_specs[priority.c].append( comparison_type_spec(LsEq, "<=") )
\ No newline at end of file
+        self.py_op = operator.le
+        self.py_symbol = "<="
+command_specs[priority.c].append( operator_type_spec(LsEq, "<=") )
\ No newline at end of file
@@ -0,0 +1,214 @@
+"""
+A compact binary format for storing a Program's grammar between steps 1 and 2
+Instead of writing out python source and importing it, the Command tree is flattened into a table of nodes
+Each node is a fixed size record, and refers to its children by their index in the table
+The children are always written before their parents, so the table can be both written and read in one pass
+
+File layout:
+    header:  magic, format version, node count, string count, offset of the strings
+    nodes:   one record per Command (see node_format)
+    strings: the identifier names, each as a length and then the utf-8 bytes
+"""
+
+import mmap
+import struct
+import Grammar
+
+magic = b"LKG\0"
+format_version = 1
+# magic, format version, (unused), number of nodes, number of strings, where the strings start
+header_format = struct.Struct("<4sHHIIQ")
+# opcode, flags, data type, (pad), line number, child 1, child 2, immediate
+node_format = struct.Struct("<BBBxIiiq")
+string_length_format = struct.Struct("<I")
+
+# node flags
+flag_root = 1 # a top level command of the program, rather than part of another one
+
+# the ways a Command's values can be stored in a node
+# "int": an integer stored in the immediate
+# "bool": a boolean stored in the immediate as 0 or 1
+# "name": a string, stored in the immediate as an index in the strings table
+# "unary": one child Command, stored in value
+# "binary": two child Commands, stored in v1 and v2
+# "val": a data type, with the ident and value as children
+# the opcode of each is its index in this list, so only add new ones onto the end
+node_kinds = [
+    (Grammar.Integer, "int"),
+    (Grammar.Boolean, "bool"),
+    (Grammar.Ident, "name"),
+    (Grammar.Print, "unary"),
+    (Grammar.Val, "val"),
+    (Grammar.Add, "binary"),
+    (Grammar.Sub, "binary"),
+    (Grammar.Eq, "binary"),
+    (Grammar.NotEq, "binary"),
+    (Grammar.Gr, "binary"),
+    (Grammar.Ls, "binary"),
+    (Grammar.GrEq, "binary"),
+    (Grammar.LsEq, "binary"),
+]
+opcodes = {clas: opcode for opcode, (clas, _) in enumerate(node_kinds)}
+# the data types, with their code being the index (None for no specified type)
+type_codes = [None, Grammar.Integer, Grammar.Boolean]
+
+
+class ProgramWriter():
+    """
+    writes the commands of a program into the binary format as they come in
+    """
+    def __init__(self, file):
+        """
+        @input file: a file object opened for writing in binary ("wb"), which must be seekable
+        """
+        self.file = file
+        self.num_nodes = 0
+        self.strings = {}
+        # leave room for the header, which gets filled in once we know the counts
+        self.file.write(b"\0" * header_format.size)
+
+    def string_index(self, string):
+        if string not in self.strings:
+            self.strings[string] = len(self.strings)
+        return self.strings[string]
+
+    def write_node(self, command, children, flags=0, line_number=None):
+        """
+        writes a single node, whose children have already been written
+        @input command: the Command to write
+        @input children: a list of the node indices of its child Commands
+        @input flags: the node flags to set
+        @input line_number: the line the command came from, or None
+        @return: the index of the node
+        """
+        clas = type(command)
+        if clas not in opcodes:
+            raise ValueError(f"Unable to store command type {clas} in the binary grammar")
+        kind = node_kinds[opcodes[clas]][1]
+        tipe = 0
+        imm = 0
+        if kind == "int":
+            imm = command.value
+        elif kind == "bool":
+            imm = 1 if command.value else 0
+        elif kind == "name":
+            imm = self.string_index(command.name)
+        elif kind == "val":
+            tipe = type_codes.index(command.tipe)
+        child1 = children[0] if len(children) > 0 else -1
+        child2 = children[1] if len(children) > 1 else -1
+        line = line_number if line_number else 0
+        self.file.write(node_format.pack(opcodes[clas], flags, tipe, line, child1, child2, imm))
+        self.num_nodes += 1
+        return self.num_nodes - 1
+
+    def write_command(self, command):
+        """
+        writes a top level command, children first
+        done with a stack rather than recursion, so deep nesting doesn't hit python's recursion limit
+        @input command: the Command to write
+        @return: none
+        """
+        # each entry is (command, whether its children have been written yet)
+        stack = [(command, False)]
+        written = []
+        while len(stack) > 0:
+            comm, children_done = stack.pop()
+            kind = node_kinds[opcodes[type(comm)]][1] if type(comm) in opcodes else None
+            if kind == "unary": children = [comm.value]
+            elif kind == "binary": children = [comm.v1, comm.v2]
+            elif kind == "val": children = [comm.ident, comm.value]
+            else: children = []
+            if not children_done and len(children) > 0:
+                stack.append((comm, True))
+                stack += [(child, False) for child in reversed(children)]
+                continue
+            # the children are the most recently written nodes
+            child_ids = written[len(written) - len(children):]
+            del written[len(written) - len(children):]
+            is_root = len(stack) == 0
+            written.append(self.write_node(comm, child_ids,
+                flag_root if is_root else 0,
+                getattr(comm, "line_number", None) if is_root else None))
+
+    def finish(self):
+        """
+        writes the strings and fills in the header
+        @input: none
+        @return: none
+        """
+        strings_offset = self.file.tell()
+        for string in self.strings:
+            encoded = string.encode("utf-8")
+            self.file.write(string_length_format.pack(len(encoded)))
+            self.file.write(encoded)
+        self.file.seek(0)
+        self.file.write(header_format.pack(magic, format_version, 0, self.num_nodes, len(self.strings), strings_offset))
+        self.file.seek(0, 2)
+
+
+def write_program(commands, filename):
+    """
+    write a stream of commands to the given file in the binary format
+    @input commands: an iterable of Command objects
+    @input filename: the path of the file to write
+    @return count: the number of top level commands written
+    """
+    count = 0
+    with open(filename, "wb") as file:
+        writer = ProgramWriter(file)
+        for command in commands:
+            writer.write_command(command)
+            count += 1
+        writer.finish()
+    return count
+
+
+def read_program(filename):
+    """
+    read a program out of a file in the binary format, memory mapping it rather than reading it all in
+    @input filename: the path of the file to read
+    @return program: a Program object
+    @throw: ValueError if the file isn't in the binary grammar format
+    """
+    with open(filename, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if len(data) < header_format.size:
+                raise ValueError(f"{filename} is too short to be a binary grammar")
+            file_magic, version, _, num_nodes, num_strings, strings_offset = header_format.unpack_from(data, 0)
+            if file_magic != magic:
+                raise ValueError(f"{filename} is not a binary grammar")
+            if version != format_version:
+                raise ValueError(f"{filename} is binary grammar version {version}, but only version {format_version} is supported")
+
+            # the strings at the end
+            strings = []
+            offset = strings_offset
+            for _ in range(num_strings):
+                (length,) = string_length_format.unpack_from(data, offset)
+                offset += string_length_format.size
+                strings.append(str(data[offset:offset + length], "utf-8"))
+                offset += length
+
+            # then build the nodes, whose children always come before them
+            nodes = []
+            commands = []
+            nodes_end = header_format.size + num_nodes * node_format.size
+            view = memoryview(data)
+            try:
+                for opcode, flags, tipe, line, child1, child2, imm in node_format.iter_unpack(view[header_format.size:nodes_end]):
+                    clas, kind = node_kinds[opcode]
+                    if kind == "int": command = clas(imm)
+                    elif kind == "bool": command = clas(imm != 0)
+                    elif kind == "name": command = clas(strings[imm])
+                    elif kind == "unary": command = clas(nodes[child1])
+                    elif kind == "binary": command = clas(nodes[child1], nodes[child2])
+                    elif kind == "val": command = clas(type_codes[tipe], nodes[child1], nodes[child2])
+                    if flags & flag_root:
+                        command.line_number = line if line else None
+                        commands.append(command)
+                    nodes.append(command)
+            finally:
+                # the map can't be closed while there are views into it
+                del view
+    return Grammar.Program(commands)
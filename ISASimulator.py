@@ -0,0 +1,383 @@
+"""
+A functional simulator for the encoded Luka instructions, to run programs without iverilog
+It decodes the binary using the formats in Encodings.py, and runs each instruction in order against the register file,
+    giving back the values the processor would print
+The program is decoded once up front, so running it is just a loop over small tuples
+BatchSimulator runs many programs at once in lockstep, one instruction of each per step, using numpy arrays
+Run with `python ISASimulator.py <file>.hex` on a memory image from step 3 (or give more than one to run them as a batch)
+"""
+
+import argparse
+import sys
+import Encodings
+import step3encoder
+from params import default_decoder_output, luka_version
+
+# numpy is optional, the batch simulator is much faster with it but works without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# what each instruction does when run, besides the ones that just work out a value (see semantics)
+kind_value = 0
+kind_load = 1
+kind_store = 2
+kind_print = 3
+kind_print_imm = 4
+op_kinds = {"lw": kind_load, "sw": kind_store, "prnt": kind_print, "prnti": kind_print_imm}
+
+
+def signed_rows(values, value_w):
+    """@return: the unsigned values (an integer, or a numpy array of them) as signed ones"""
+    return values - ((values >> (value_w - 1)) & 1) * (1 << value_w)
+
+# what each of the instructions in Encodings.op_formats that works out a value does, on the unsigned register values
+# there aren't any python ifs, so they work the same on one value or a numpy array of them (a whole column at once)
+semantics = {
+    "addi": lambda a, b, imm, w: a + imm,
+    "subi": lambda a, b, imm, w: a - imm,
+    "xori": lambda a, b, imm, w: a ^ imm,
+    "slti": lambda a, b, imm, w: signed_rows(a, w) < imm,
+    "sltiu": lambda a, b, imm, w: a < imm % (1 << w),
+    "add": lambda a, b, imm, w: a + b,
+    "sub": lambda a, b, imm, w: a - b,
+    "xor": lambda a, b, imm, w: a ^ b,
+    "slt": lambda a, b, imm, w: signed_rows(a, w) < signed_rows(b, w),
+}
+# the processor's ALU (Verilog/Stages/stg_3_EX.sv) only adds, working out rs1 + rs2 + imm whatever the fn3 is,
+# so these are the only ones it runs as they're meant to, and hardware_semantics is what it does for the rest
+hardware_ops = {"add", "addi"}
+hardware_semantics = lambda a, b, imm, w: a + b + imm
+
+
+class ISASimulator():
+    """
+    the decoder for the instruction words, and the state of the processor to run them against
+    """
+    def __init__(self, specs=None, hardware=False):
+        """
+        @input specs: the processor specs, like from step3encoder.build_default_specs (the defaults if None)
+        @input hardware: True to run every value instruction like the processor's adding ALU does,
+            rather than as it's meant to (see hardware_ops)
+        """
+        self.specs = step3encoder.build_default_specs() if specs is None else specs
+        self.hardware = hardware
+        # the ops in the last programs loaded that the processor's ALU doesn't run as they're meant to
+        self.not_in_hardware = set()
+        self.instr_w = int(self.specs["INSTR_W"])
+        self.value_w = int(self.specs["VALUE_W"])
+        self.num_registers = int(self.specs["NUM_REG"])
+        self.num_data = int(self.specs["NUM_DATA"])
+
+        # each opcode's ops, as (how many fn3 bits, the fn3, op), with the longest fn3s checked first
+        self.ops_by_opcode = {}
+        for op, (tipe, fn3, opcode) in Encodings.op_formats.items():
+            self.ops_by_opcode.setdefault(int(opcode, 2), []).append((len(fn3), int(fn3, 2) if fn3 else 0, op))
+        for candidates in self.ops_by_opcode.values():
+            candidates.sort(reverse=True)
+        self.reset()
+
+    def reset(self):
+        """
+        clears the registers and data memory, like the processor's reset
+        @input: none
+        @return: none
+        """
+        self.registers = [0] * self.num_registers
+        self.memory = [0] * self.num_data
+
+    def decode(self, word):
+        """
+        decodes one instruction word, the reverse of Encodings.encode_table
+        @input word: the instruction as an integer
+        @return: a tuple (op, rd, rs1, rs2, imm), with None for the fields it doesn't have
+        @throw: ValueError if it isn't any known instruction
+        """
+        for fn3_w, fn3, op in self.ops_by_opcode.get(word & 0b111, []):
+            if fn3_w == 0 or word >> (self.instr_w - fn3_w) == fn3:
+                break
+        else:
+            raise ValueError(f"The word {word:0{self.instr_w}b} isn't a known instruction")
+        fields = {}
+        imm_w = 0
+        for field, start, width, to in Encodings.choose_type(op).layout:
+            fields[field] = fields.get(field, 0) | (((word >> to) & ((1 << width) - 1)) << start)
+            if field == "imm": imm_w += width
+        imm = fields.get("imm")
+        # sign extend the immediate if the processor does
+        allowed = Encodings.immediate_range(op, self.specs)
+        if imm is not None and allowed is not None and allowed.start < 0 and imm >= 1 << (imm_w - 1):
+            imm -= 1 << imm_w
+        return (op, fields.get("rd"), fields.get("rs1"), fields.get("rs2"), imm)
+
+    def load(self, words):
+        """
+        decodes a whole program into what run needs
+        @input words: an iterable of the instruction words as integers
+        @return program: a list of (kind, semantics, rd, rs1, rs2, imm) tuples, with 0 for missing fields
+        @throw: ValueError if a word isn't any known instruction, or isn't one the simulator can run
+        """
+        # programs use the same few words over and over, so each is only decoded once
+        self.not_in_hardware = set()
+        decoded = {}
+        fields = {}
+        program = []
+        # numpy integers (or anything else) hash differently than python ints, so they're all made ints first
+        words = [int(word) for word in words]
+        for word in words:
+            if word not in decoded:
+                fields[word] = op, rd, rs1, rs2, imm = self.decode(word)
+                if op not in semantics and op not in op_kinds:
+                    raise ValueError(f"The simulator can't run {op} instructions")
+                kind = op_kinds.get(op, kind_value)
+                if kind == kind_value and op not in hardware_ops: self.not_in_hardware.add(op)
+                does = hardware_semantics if self.hardware and kind == kind_value else semantics.get(op)
+                decoded[word] = (kind, does, rd or 0, rs1 or 0, rs2 or 0, imm or 0)
+            program.append(decoded[word])
+        self.fit_data_memory(fields, [words])
+        return program
+
+    def fit_data_memory(self, fields, programs):
+        """
+        grows the data memory to fit the values the programs spill, the same as step 3 sizes it for the processor
+        @input fields: a dict of each distinct word in the programs to its decoded (op, rd, rs1, rs2, imm)
+        @input programs: the programs, each a list (or array) of the words
+        @return: none
+        """
+        specs = dict(self.specs)
+        spills = [decoded for decoded in fields.values() if decoded[0] in ["lw", "sw"]]
+        if all([not rs1 for _, _, rs1, _, _ in spills]):
+            # all reached from x0, so the offsets are the addresses
+            step3encoder.size_data_memory(specs, spills)
+        else:
+            for words in programs:
+                step3encoder.size_data_memory(specs, [fields[int(word)] for word in words])
+        needed = int(specs["NUM_DATA"])
+        if needed > self.num_data:
+            self.memory += [0] * (needed - self.num_data)
+            self.num_data = needed
+
+    def run(self, program, max_instructions=None):
+        """
+        runs a loaded program from the start to the end, from the current registers and memory
+        @input program: the list from load
+        @input max_instructions: stop after this many instructions, or None to run all of them
+        @return printed: a list of the values printed, as signed values like the displays show them
+        @throw: ValueError if a load or store is past the end of the data memory
+        """
+        registers = self.registers
+        memory = self.memory
+        mask = (1 << self.value_w) - 1
+        sign = 1 << (self.value_w - 1)
+        value_w = self.value_w
+        printed = []
+        if max_instructions is not None: program = program[:max_instructions]
+        for kind, does, rd, rs1, rs2, imm in program:
+            if kind == kind_value:
+                if rd: registers[rd] = does(registers[rs1], registers[rs2], imm, value_w) & mask
+            elif kind == kind_print:
+                value = registers[rs1]
+                printed.append(value - (value & sign) * 2)
+            elif kind == kind_print_imm:
+                value = imm & mask
+                printed.append(value - (value & sign) * 2)
+            else:
+                address = (registers[rs1] + imm) & mask
+                if address >= self.num_data:
+                    raise ValueError(f"Data address {address} is past the {self.num_data} words of data memory")
+                if kind == kind_load:
+                    if rd: registers[rd] = memory[address]
+                else:
+                    memory[address] = registers[rs2]
+        return printed
+
+
+class BatchSimulator():
+    """
+    runs many programs side by side, like lots of small variants of the same program
+    the registers are kept as a (number of programs, NUM_REG) array, and each step runs the next instruction of every program,
+        doing all of the programs with the same instruction at once
+    programs that have finished are masked out of the rest of the steps
+    """
+    def __init__(self, specs=None, hardware=False):
+        """
+        @input specs: the processor specs, like from step3encoder.build_default_specs (the defaults if None)
+        @input hardware: True to run every value instruction like the processor's adding ALU does (see ISASimulator)
+        """
+        # the decoding (and the fallback without numpy) is the same as running them one at a time
+        self.simulator = ISASimulator(specs, hardware)
+        self.value_w = self.simulator.value_w
+
+    def load(self, programs):
+        """
+        decodes the programs into columns, one row per program, padded out to the longest
+        @input programs: a list of the programs, each a list (or array) of instruction words
+        @return: a dict of numpy arrays, "op" (the index in ops, -1 past the end), "rd", "rs1", "rs2", "imm", and "length",
+            along with "ops", the op names used
+        @throw: ValueError if a word isn't any known instruction, or isn't one the batch can run
+        """
+        lengths = numpy.array([len(words) for words in programs], dtype=numpy.int64)
+        longest = int(lengths.max()) if len(programs) > 0 else 0
+        # all of the words end to end, with each distinct word only decoded once
+        every_word = numpy.concatenate([numpy.asarray(words, dtype=numpy.int64) for words in programs] + [numpy.zeros(0, dtype=numpy.int64)])
+        distinct, which = numpy.unique(every_word, return_inverse=True)
+        ops = []
+        fields = numpy.zeros((len(distinct), 5), dtype=numpy.int64)
+        decoded = {}
+        self.simulator.not_in_hardware = set()
+        for ndx, word in enumerate(distinct.tolist()):
+            decoded[word] = op, rd, rs1, rs2, imm = self.simulator.decode(word)
+            if op not in semantics and op not in op_kinds:
+                raise ValueError(f"The batch simulator can't run {op} instructions")
+            if op in semantics and op not in hardware_ops: self.simulator.not_in_hardware.add(op)
+            if op not in ops: ops.append(op)
+            fields[ndx] = [ops.index(op), rd or 0, rs1 or 0, rs2 or 0, imm or 0]
+        self.simulator.fit_data_memory(decoded, programs)
+
+        # then spread them out into a row per program
+        rows = numpy.repeat(numpy.arange(len(programs)), lengths)
+        steps = numpy.arange(len(every_word)) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+        columns = {}
+        for column, name in enumerate(["op", "rd", "rs1", "rs2", "imm"]):
+            columns[name] = numpy.full((len(programs), longest), -1 if name == "op" else 0, dtype=numpy.int64)
+            columns[name][rows, steps] = fields[which, column]
+        columns["length"] = lengths
+        columns["ops"] = ops
+        return columns
+
+    def run(self, programs):
+        """
+        runs every program from the start to the end, each from cleared registers and memory
+        @input programs: a list of the programs, each a list (or array) of instruction words
+        @return printed: a list with the values each program printed, as signed values like the displays show them
+        @throw: ValueError if a word can't be run, or a load or store is past the end of the data memory
+        """
+        if numpy is None:
+            printed = []
+            for words in programs:
+                self.simulator.reset()
+                printed.append(self.simulator.run(self.simulator.load(words)))
+            return printed
+
+        columns = self.load(programs)
+        num_programs, longest = columns["op"].shape
+        mask = (1 << self.value_w) - 1
+        registers = numpy.zeros((num_programs, self.simulator.num_registers), dtype=numpy.int16)
+        memory = numpy.zeros((num_programs, self.simulator.num_data), dtype=numpy.int16)
+        # the prints of each program, and how many there are so far
+        outputs = numpy.zeros((num_programs, longest), dtype=numpy.int16)
+        num_printed = numpy.zeros(num_programs, dtype=numpy.int64)
+
+        def read(rows, regs):
+            """the unsigned values of the registers, one per row"""
+            return registers[rows, regs].view(numpy.uint16).astype(numpy.int64)
+
+        def write(rows, regs, values):
+            """writes the values into the registers, leaving x0 alone"""
+            keep = regs != 0
+            registers[rows[keep], regs[keep]] = (values[keep] & mask).astype(numpy.uint16).view(numpy.int16)
+
+        for step in range(longest):
+            step_ops = columns["op"][:, step]
+            # finished programs have -1, so they're never picked
+            for number in numpy.unique(step_ops[step_ops >= 0]).tolist():
+                op = columns["ops"][number]
+                rows = numpy.nonzero(step_ops == number)[0]
+                rd, rs1, rs2, imm = [columns[name][rows, step] for name in ["rd", "rs1", "rs2", "imm"]]
+                kind = op_kinds.get(op, kind_value)
+                if kind == kind_value:
+                    does = hardware_semantics if self.simulator.hardware else semantics[op]
+                    write(rows, rd, does(read(rows, rs1), read(rows, rs2), imm, self.value_w).astype(numpy.int64))
+                elif kind in [kind_print, kind_print_imm]:
+                    values = read(rows, rs1) if kind == kind_print else imm & mask
+                    outputs[rows, num_printed[rows]] = values.astype(numpy.uint16).view(numpy.int16)
+                    num_printed[rows] += 1
+                else:
+                    addresses = (read(rows, rs1) + imm) & mask
+                    if (addresses >= self.simulator.num_data).any():
+                        raise ValueError(f"Data address {addresses.max()} is past the {self.simulator.num_data} words of data memory")
+                    if kind == kind_load:
+                        write(rows, rd, memory[rows, addresses].view(numpy.uint16).astype(numpy.int64))
+                    else:
+                        memory[rows, addresses] = registers[rows, rs2]
+        return [outputs[row, :num_printed[row]].tolist() for row in range(num_programs)]
+
+
+def read_memory_image(filename):
+    """
+    reads the instructions back out of a memory image from step 3
+    the blank word step 3 puts at address 0 isn't part of the program, so it's left off
+    @input filename: the path of the .hex file
+    @return words: a list of the instruction words as integers
+    @throw: ValueError if the file isn't a memory image
+    """
+    words = []
+    length = None
+    address = 0
+    with open(filename) as file:
+        for line in file:
+            line = line.split("//")[0].strip()
+            if not line: continue
+            if line[0] == "@":
+                address = int(line[1:], 16)
+                continue
+            try:
+                value = int(line, 16)
+            except ValueError:
+                raise ValueError(f"{filename} has a line that isn't a hex word: {line}")
+            # the last word of the image is the program's length
+            if address == len(words): words.append(value)
+            else: length = value
+            address += 1
+    if length is None or length == 0 or length > len(words):
+        raise ValueError(f"{filename} doesn't say how long its program is")
+    return words[1:length]
+
+
+def main(args):
+    """
+    runs memory images and prints what they print
+    with more than one, they're all run together by the BatchSimulator
+    @input args: an argparse namespace of our command line arguments
+    @return: exit code, 0 if it's good
+    """
+    filenames = [filename if filename[-4:] == ".hex" else filename + ".hex" for filename in args.filenames]
+    try:
+        programs = [read_memory_image("output/" + filename) for filename in filenames]
+        if len(programs) == 1:
+            simulator = ISASimulator(hardware=args.hardware)
+            results = [simulator.run(simulator.load(programs[0]))]
+        else:
+            batch = BatchSimulator(hardware=args.hardware)
+            results = batch.run(programs)
+            simulator = batch.simulator
+    except (OSError, ValueError) as err:
+        print("ISA Simulator: Encountered the following fatal errors:")
+        print("X -", err)
+        return 1
+    for filename, words, printed in zip(filenames, programs, results):
+        if len(filenames) > 1: print(filename + ":")
+        for value in printed:
+            print(value)
+        if args.debug: print(f"Ran {len(words)} instructions")
+    if args.debug and len(programs) == 1: print("Registers:", simulator.registers)
+    if len(simulator.not_in_hardware) > 0 and not args.hardware:
+        print("\nEncountered the following warnings while simulating:")
+        print("The processor's ALU only adds, so it might print different values for the "
+            + ", ".join(sorted(simulator.not_in_hardware)) + " instructions (run with --hardware to see what it would print)")
+    return 0
+
+
+if __name__ == "__main__":
+    # to parse the command line arguments nicely
+    parser = argparse.ArgumentParser(description = "Runs encoded Luka programs without the processor")
+    parser.add_argument("--version", "-v", action='version', version='Luka version ' + luka_version, help="Gets the version info")
+    parser.add_argument("--debug", "-d", action='store_true', help="Turn on debugging mode to print more information")
+    parser.add_argument("--hardware", action='store_true',
+        help="Run every instruction like the processor's ALU does today (it only adds), rather than as it's meant to")
+    parser.add_argument("filenames", nargs="*", default=[default_decoder_output],
+        help="The memory images in the output folder to run (.hex files), more than one are run together as a batch")
+    args = parser.parse_args()
+
+    sys.exit(main(args))
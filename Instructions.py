@@ -12,6 +12,8 @@
 # bps <rs1>, <rs2>(<imm>) : branch if the item is positive == blt x0, <rs1>, <rs2>(imm)
 
 
+from array import array
+
 # a set of all possible instructions as we generate them
 # mostly for debugging purposes
 poss_instructions = set()
@@ -20,6 +22,8 @@ class Instruction():
     """
     a class representation of a risc-v assembly instruction
     """
+    # there can be a lot of these, so skip the per-object dict
+    __slots__ = ["op", "ref_ids", "imm", "tags", "rd", "rs1", "rs2"]
     def __init__(self, op, ref_ids=[], imm=None, tags=[]):
     # def __init__(self, op, ref_ids=[], imm=None, tags=[], ref_tags=[]):
         """
@@ -69,4 +73,122 @@ class Instruction():
         
         if self.imm is not None: output["imm"] = self.imm
 
-        return output
\ No newline at end of file
+        return output
+
+
+# each op as a small number, for the InstructionTable, with a new op getting the next one
+op_names = []
+op_ids = {}
+
+def op_id(op):
+    """
+    @input op: the operation name
+    @return: the number for it, giving it one if it doesn't have one yet
+    """
+    if op not in op_ids:
+        op_ids[op] = len(op_names)
+        op_names.append(op)
+    return op_ids[op]
+
+
+# what's stored for a field the instruction doesn't have
+no_register = -1
+no_immediate = -(1 << 63)
+
+
+class InstructionTable():
+    """
+    the instructions once their registers are found, stored as one array per field rather than an object each
+    so a big program is a handful of arrays of small numbers, and the encoder can pack straight from them
+    """
+    register_fields = ["rd", "rs1", "rs2"]
+
+    def __init__(self):
+        self.op = array("H")
+        self.rd = array("b")
+        self.rs1 = array("b")
+        self.rs2 = array("b")
+        self.imm = array("q")
+
+    def __len__(self):
+        return len(self.op)
+
+    def append(self, op, rd=None, rs1=None, rs2=None, imm=None):
+        """
+        adds an instruction onto the end
+        @input op: the operation name
+        @input rd, rs1, rs2, imm: the values of the fields, or None for ones it doesn't have
+        @return: none
+        @throw: ValueError if a value is too big to store
+        """
+        try:
+            self.rd.append(no_register if rd is None else rd)
+            self.rs1.append(no_register if rs1 is None else rs1)
+            self.rs2.append(no_register if rs2 is None else rs2)
+            self.imm.append(no_immediate if imm is None else imm)
+        except (OverflowError, TypeError) as err:
+            # keep the columns lined up
+            del self.rd[len(self.op):], self.rs1[len(self.op):], self.rs2[len(self.op):], self.imm[len(self.op):]
+            raise ValueError(f"Unable to store the {op} instruction: {err}")
+        self.op.append(op_id(op))
+
+    @classmethod
+    def from_instructions(cls, instructions):
+        """
+        @input instructions: a list of Instruction objects, with their registers found
+        @return: an InstructionTable of them
+        """
+        table = cls()
+        for instr in instructions:
+            table.append(instr.op, instr.rd, instr.rs1, instr.rs2, instr.imm)
+        return table
+
+    @classmethod
+    def from_dicts(cls, dicts):
+        """
+        @input dicts: a list of the instructions as dicts, in the format of Instruction.to_json
+        @return: an InstructionTable of them
+        @throw: ValueError if an instruction doesn't have an op, or has values that are too big to store
+        """
+        table = cls()
+        for ndx, dic in enumerate(dicts):
+            if "op" not in dic: raise ValueError(f"Instruction {ndx} does not contain op field")
+            table.append(dic["op"], dic.get("rd"), dic.get("rs1"), dic.get("rs2"), dic.get("imm"))
+        return table
+
+    def rows(self):
+        """
+        @return: a generator of each instruction as a tuple (op, rd, rs1, rs2, imm), with None for the fields it doesn't have,
+            like ISASimulator.decode gives back
+        """
+        for op, rd, rs1, rs2, imm in zip(self.op, self.rd, self.rs1, self.rs2, self.imm):
+            yield (op_names[op], None if rd == no_register else rd, None if rs1 == no_register else rs1,
+                None if rs2 == no_register else rs2, None if imm == no_immediate else imm)
+
+    def op_name(self, ndx):
+        return op_names[self.op[ndx]]
+
+    def to_json(self, ndx):
+        """
+        @input ndx: the index of the instruction
+        @return: a dict of it, in the same format as Instruction.to_json
+        """
+        output = {"op": op_names[self.op[ndx]]}
+        for field in self.register_fields:
+            value = getattr(self, field)[ndx]
+            if value != no_register: output[field] = value
+        if self.imm[ndx] != no_immediate: output["imm"] = self.imm[ndx]
+        return output
+
+    def to_json_list(self):
+        """
+        @return: a list of all of the instructions as dicts, ready to be stored as a json
+        """
+        return [self.to_json(ndx) for ndx in range(len(self))]
+
+    def describe(self, ndx):
+        """
+        @input ndx: the index of the instruction
+        @return: a string of it, like Instruction's
+        """
+        return " ".join([op_names[self.op[ndx]]] + [f"({field}: {value})" for field, value in self.to_json(ndx).items() if field != "op"])
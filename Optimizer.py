@@ -0,0 +1,468 @@
+"""
+Optimization passes for the assembler, to cut down on the instructions (and so the cycles) a program takes
+These are run by step 2 around finding the registers, unless --no-optimize is given
+Each one keeps the program printing the same values as it did before
+"""
+
+import copy
+import random
+import Grammar
+import Encodings
+import step3encoder
+from Instructions import Instruction
+
+specs = step3encoder.build_default_specs()
+# the registers there are, with x0 always 0
+num_registers = int(specs["NUM_REG"])
+# how many bits a literal has to fit in to be used in an instruction
+# an li or an immediate operand has IMM_W bits, and a prnti has VALUE_W
+imm_bits = int(specs["IMM_W"])
+value_bits = int(specs["VALUE_W"])
+
+
+def fits(value, bits):
+    """
+    @input value: an integer or boolean value
+    @input bits: the number of bits it has to fit into, as a signed number
+    @return: whether it fits (booleans always do)
+    """
+    if isinstance(value, bool): return True
+    return -(1 << (bits - 1)) <= value < (1 << (bits - 1))
+
+
+def wrap(value, bits=value_bits):
+    """
+    @input value: an integer or boolean value
+    @input bits: the number of bits the processor keeps it in
+    @return: the value it wraps around to as a signed number (booleans are left alone)
+    """
+    if isinstance(value, bool): return value
+    sign = 1 << (bits - 1)
+    return ((value + sign) & ((1 << bits) - 1)) - sign
+
+
+def to_literal(value):
+    """
+    @input value: an integer or boolean value
+    @return: the Integer or Boolean Command for it
+    """
+    if isinstance(value, bool): return Grammar.Boolean(value)
+    return Grammar.Integer(value)
+
+
+class ConstantFolder():
+    """
+    works out the parts of a program that are the same every time it's run, replacing them with their values
+    the values are found with each Command's own py_eval, so they always match running the program
+    """
+    def __init__(self):
+        # maps a Val's name to its value, for those that are known so far
+        self.constants = {}
+        # how many Commands have been replaced by a value
+        self.folded = 0
+
+    def fold(self, command, bits=imm_bits):
+        """
+        fold a single command, and everything inside it
+        a command is only replaced by its value if the value fits where it's used,
+            otherwise the value is still passed up, for the command around it to use
+        @input command: the Command to fold
+        @input bits: how many bits the value has to fit into to replace the command
+        @return (folded, value): the folded Command, and its value if it's known, or None
+        """
+        tipe = type(command)
+
+        # the values are wrapped to VALUE_W bits, like the processor's registers, so folding overflows the same way running does
+        if tipe in [Grammar.Integer, Grammar.Boolean]:
+            return command, wrap(command.value)
+
+        elif tipe == Grammar.Ident:
+            if command.name not in self.constants:
+                return command, None
+            value = self.constants[command.name]
+            if fits(value, bits):
+                self.folded += 1
+                return to_literal(value), value
+            return command, value
+
+        elif tipe == Grammar.Print:
+            value, _ = self.fold(command.value, value_bits)
+            return (command if value is command.value else Grammar.Print(value)), None
+
+        elif tipe == Grammar.Val:
+            value, known = self.fold(command.value, imm_bits)
+            # a new Val with the same name hides the old one, whether or not it's known
+            if known is None: self.constants.pop(command.ident.name, None)
+            else: self.constants[command.ident.name] = known
+            if value is command.value: return command, None
+            return Grammar.Val(command.tipe, command.ident, value), None
+
+        elif tipe in [Grammar.Add, Grammar.Sub] or isinstance(command, Grammar.Comparison):
+            v1, known1 = self.fold(command.v1, imm_bits)
+            v2, known2 = self.fold(command.v2, imm_bits)
+            if known1 is not None and known2 is not None:
+                value, _ = tipe(to_literal(known1), to_literal(known2)).py_eval({})
+                value = wrap(value)
+                if fits(value, bits):
+                    self.folded += 1
+                    return to_literal(value), value
+                return self.rebuild(command, v1, v2), value
+            if tipe in [Grammar.Add, Grammar.Sub] and known2 is not None:
+                combined = self.combine_offsets(tipe, v1, known2)
+                if combined is not None:
+                    return combined, None
+            return self.rebuild(command, v1, v2), None
+
+        # anything else is left for the assembler to complain about
+        return command, None
+
+    def rebuild(self, command, v1, v2):
+        """
+        @return: the command with its values swapped for v1 and v2, only making a new one if they changed
+        """
+        if v1 is command.v1 and v2 is command.v2: return command
+        return type(command)(v1, v2)
+
+    def combine_offsets(self, tipe, inner, offset):
+        """
+        turns (a + 1) + 2 into a + 3, so chains of adding and subtracting numbers become one instruction
+        @input tipe: the outer command's class, Add or Sub
+        @input inner: the already folded first value of the outer command
+        @input offset: the number the outer command adds or subtracts
+        @return: the combined Command, or None if they can't be combined
+        """
+        if type(inner) not in [Grammar.Add, Grammar.Sub]: return None
+        total = offset if tipe is Grammar.Add else -offset
+        if type(inner.v2) is Grammar.Integer:
+            rest = inner.v1
+            total += inner.v2.value if type(inner) is Grammar.Add else -inner.v2.value
+        elif type(inner) is Grammar.Add and type(inner.v1) is Grammar.Integer:
+            rest = inner.v2
+            total += inner.v1.value
+        else:
+            return None
+        if not fits(total, imm_bits): return None
+        self.folded += 1
+        if total < 0: return Grammar.Sub(rest, Grammar.Integer(-total))
+        return Grammar.Add(rest, Grammar.Integer(total))
+
+
+def fold_constants(program, warnings):
+    """
+    fold the constant parts of a program, and pass along the values of Vals that are known
+    ex: `val x = 2; print(x + 3 == 5);` becomes `val x = 2; print(true);`
+    @input program: a Program object, already type checked
+    @input warnings: a pre-existing list to append our warnings to
+    @return (program, stats): the folded Program, and a dict of {"folded": how many Commands were replaced}
+    """
+    folder = ConstantFolder()
+    commands = []
+    for command in program.commands:
+        folded, _ = folder.fold(command)
+        if folded is not command and hasattr(command, "line_number"):
+            folded.line_number = command.line_number
+        commands.append(folded)
+    return Grammar.Program(commands), {"folded": folder.folded}
+
+
+# the instructions whose result only depends on their inputs, so two of the same give the same value
+pure_instructions = {"li", "mv", "addi", "subi", "xori", "slti", "sltiu", "add", "sub", "xor", "slt"}
+# the ones where the order of the inputs doesn't matter
+commutative_instructions = {"add", "xor"}
+
+
+def number_values(instructions):
+    """
+    gives each distinct value a number, merging instructions that work out a value that's already been made
+    two pure instructions with the same op, inputs, and immediate always make the same value,
+        since values never change once made (a new Val of the same name is a new value)
+    a mv is just a copy, so anything using it uses the original instead
+    @input instructions: a list of Instruction objects with their references resolved to indices,
+        which has the merged ones removed from it
+    @return stats: a dict of {"merged": how many instructions were removed}
+    """
+    stats = {"merged": 0}
+    # maps an (op, inputs, immediate) to the index (in the new list) of the instruction that makes it
+    numbers = {}
+    # maps each old index to the index in the new list that holds its value
+    new_index = [None] * len(instructions)
+    output = []
+    for ndx, instr in enumerate(instructions):
+        refs = [new_index[ref] for ref in instr.ref_ids]
+        if instr.op == "mv":
+            new_index[ndx] = refs[0]
+            stats["merged"] += 1
+            continue
+        if instr.op in pure_instructions:
+            key = (instr.op, tuple(sorted(refs) if instr.op in commutative_instructions else refs), instr.imm)
+            if key in numbers:
+                new_index[ndx] = numbers[key]
+                stats["merged"] += 1
+                continue
+            numbers[key] = len(output)
+        instr.ref_ids = refs
+        new_index[ndx] = len(output)
+        output.append(instr)
+
+    instructions[:] = output
+    return stats
+
+
+# the instructions that do something other than make a value, so are always kept
+side_effect_instructions = {"prnt", "prnti"}
+
+
+def remove_dead_values(instructions):
+    """
+    removes the instructions whose values are never used, like a Val that's made again before it's read
+    going backwards, an instruction is live if it prints, or if a live instruction uses its value,
+        so anything that only feeds unused values goes too
+    @input instructions: a list of Instruction objects with their references resolved to indices,
+        which has the unused ones removed from it
+    @return stats: a dict of {"removed": how many instructions were removed}
+    """
+    live = [False] * len(instructions)
+    for ndx in range(len(instructions) - 1, -1, -1):
+        instr = instructions[ndx]
+        if instr.op in side_effect_instructions: live[ndx] = True
+        if live[ndx]:
+            for ref in instr.ref_ids: live[ref] = True
+
+    # shift the references down past the removed instructions
+    new_index = [None] * len(instructions)
+    output = []
+    for ndx, instr in enumerate(instructions):
+        if not live[ndx]: continue
+        instr.ref_ids = [new_index[ref] for ref in instr.ref_ids]
+        new_index[ndx] = len(output)
+        output.append(instr)
+
+    removed = len(instructions) - len(output)
+    instructions[:] = output
+    return {"removed": removed}
+
+
+# ---  PEEPHOLE  ---
+
+# the instructions the peephole pass can understand, and how to work each one out from (rs1, rs2, imm)
+# with 16 bit values, and slt comparing them as signed
+def to_signed(value):
+    return value - (1 << value_bits) if value & (1 << (value_bits - 1)) else value
+instruction_semantics = {
+    "li": lambda a, b, imm: imm,
+    "mv": lambda a, b, imm: a,
+    "addi": lambda a, b, imm: a + imm,
+    "subi": lambda a, b, imm: a - imm,
+    "xori": lambda a, b, imm: a ^ imm,
+    "slti": lambda a, b, imm: int(to_signed(a) < imm),
+    "sltiu": lambda a, b, imm: int(a < imm % (1 << value_bits)),
+    "add": lambda a, b, imm: a + b,
+    "sub": lambda a, b, imm: a - b,
+    "xor": lambda a, b, imm: a ^ b,
+    "slt": lambda a, b, imm: int(to_signed(a) < to_signed(b)),
+}
+# the furthest ahead a rewrite can look
+peephole_window = 32
+
+
+def reads(instr):
+    """@return: the registers an instruction (with its registers found) reads"""
+    return [reg for reg in [instr.rs1, instr.rs2] if reg]
+
+
+def writes(instr):
+    """@return: the register an instruction writes, or None (x0 is never written)"""
+    if instr.op in side_effect_instructions or instr.op == "sw": return None
+    return instr.rd if instr.rd else None
+
+
+def run_window(instructions, registers, memory):
+    """
+    runs a few straight line instructions, for checking that a rewrite doesn't change what they do
+    @input instructions: a list of Instruction objects with their registers found
+    @input registers: a list of the register values, which is updated
+    @input memory: a dict of the data memory values, which is updated
+    @return printed: a list of the values printed
+    """
+    mask = (1 << value_bits) - 1
+    printed = []
+    for instr in instructions:
+        a = registers[instr.rs1] if instr.rs1 else 0
+        b = registers[instr.rs2] if instr.rs2 else 0
+        if instr.op == "prnt": printed.append(a)
+        elif instr.op == "prnti": printed.append(instr.imm & mask)
+        elif instr.op == "sw": memory[(a + instr.imm) & mask] = b
+        elif instr.op == "lw": value = memory.get((a + instr.imm) & mask, 0)
+        else: value = instruction_semantics[instr.op](a, b, instr.imm)
+        if writes(instr): registers[instr.rd] = value & mask
+    return printed
+
+
+def equivalent(before, after, live, trials=16):
+    """
+    the equivalence check for the peephole rewrites
+    runs both lists of instructions from the same random starting registers and memory,
+        checking they print the same, store the same, and leave the same values in the registers used afterwards
+    @input before: the original instructions
+    @input after: what they'd be replaced with
+    @input live: the set of registers read after them
+    @input trials: how many random starting states to try
+    @return: whether they did the same thing every time
+    """
+    # the same random states every run, starting with the values most likely to find a difference
+    rand = random.Random(0)
+    edges = [0, 1, (1 << value_bits) - 1, 1 << (value_bits - 1)]
+    for trial in range(trials):
+        start = [edges[trial % len(edges)] if trial < len(edges) else rand.getrandbits(value_bits) for _ in range(num_registers)]
+        start[0] = 0
+        memory = {addr: rand.getrandbits(value_bits) for addr in range(32)}
+        regs1, regs2 = list(start), list(start)
+        mem1, mem2 = dict(memory), dict(memory)
+        if run_window(before, regs1, mem1) != run_window(after, regs2, mem2): return False
+        if mem1 != mem2: return False
+        if any([regs1[reg] != regs2[reg] for reg in live]): return False
+    return True
+
+
+def copy_with(instr, **fields):
+    """@return: a copy of the instruction with the given fields changed"""
+    new = copy.copy(instr)
+    for name, value in fields.items(): setattr(new, name, value)
+    return new
+
+
+def is_move(instr):
+    """@return: whether the instruction just copies rs1 into rd"""
+    return instr.op == "mv" or (instr.op in ["addi", "subi", "xori"] and instr.imm == 0)
+
+
+# each rule looks at the instructions starting at ndx, and gives back (end, replacement) to replace instructions[ndx:end] with,
+# or None if it doesn't apply
+# live_after[i] is the set of registers read after instruction i before being written again
+
+def rule_useless_move(instructions, ndx, live_after):
+    """addi x1, x1, 0 -> nothing"""
+    instr = instructions[ndx]
+    if is_move(instr) and instr.rd == instr.rs1:
+        return ndx + 1, []
+    return None
+
+def rule_dead_write(instructions, ndx, live_after):
+    """a register that's written but never read -> nothing"""
+    instr = instructions[ndx]
+    if instr.op in instruction_semantics and instr.rd and instr.rd not in live_after[ndx]:
+        return ndx + 1, []
+    return None
+
+def rule_cancel_pair(instructions, ndx, live_after):
+    """xori x2, x1, 1; xori x3, x2, 1 -> addi x3, x1, 0 (if x2 isn't needed), and the same for addi/subi undoing each other"""
+    if ndx + 1 >= len(instructions): return None
+    first, second = instructions[ndx], instructions[ndx + 1]
+    if second.rs1 != first.rd or not first.rd: return None
+    if first.rd != second.rd and first.rd in live_after[ndx + 1]: return None
+    undoes = (first.op == "xori" and second.op == "xori" and first.imm == second.imm) or \
+             (first.op == "addi" and second.op == "subi" and first.imm == second.imm) or \
+             (first.op == "subi" and second.op == "addi" and first.imm == second.imm)
+    if not undoes: return None
+    return ndx + 2, [copy_with(second, op="addi", rs1=first.rs1, imm=0)]
+
+def rule_combine_offsets(instructions, ndx, live_after):
+    """addi x2, x1, 3; addi x3, x2, 4 -> addi x3, x1, 7 (if x2 isn't needed and it fits)"""
+    if ndx + 1 >= len(instructions): return None
+    first, second = instructions[ndx], instructions[ndx + 1]
+    if first.op not in ["addi", "subi"] or second.op not in ["addi", "subi"]: return None
+    if second.rs1 != first.rd or not first.rd: return None
+    if first.rd != second.rd and first.rd in live_after[ndx + 1]: return None
+    total = (first.imm if first.op == "addi" else -first.imm) + (second.imm if second.op == "addi" else -second.imm)
+    op, imm = ("addi", total) if total >= 0 else ("subi", -total)
+    if imm not in Encodings.immediate_range(op, specs): return None
+    return ndx + 2, [copy_with(second, op=op, rs1=first.rs1, imm=imm)]
+
+def rule_forward_move(instructions, ndx, live_after):
+    """addi x2, x1, 0; add x3, x2, x4 -> add x3, x1, x4, for every later read of x2 until x1 or x2 changes"""
+    move = instructions[ndx]
+    if not is_move(move) or not move.rd or move.rd == move.rs1: return None
+    end = ndx + 1
+    forwarded = []
+    while end < len(instructions) and end - ndx <= peephole_window:
+        instr = instructions[end]
+        forwarded.append(copy_with(instr,
+            rs1=move.rs1 if instr.rs1 == move.rd else instr.rs1,
+            rs2=move.rs1 if instr.rs2 == move.rd else instr.rs2))
+        end += 1
+        # past here, the copy isn't needed (or can't be forwarded any further)
+        if move.rd not in live_after[end - 1]: return end, forwarded
+        if writes(instr) in [move.rd, move.rs1]: return None
+    return None
+
+
+# the rules to try, by the op of the first instruction they look at
+peephole_rules = {
+    "li": [rule_dead_write],
+    "mv": [rule_useless_move, rule_dead_write, rule_forward_move],
+    "addi": [rule_useless_move, rule_dead_write, rule_cancel_pair, rule_combine_offsets, rule_forward_move],
+    "subi": [rule_useless_move, rule_dead_write, rule_cancel_pair, rule_combine_offsets, rule_forward_move],
+    "xori": [rule_useless_move, rule_dead_write, rule_cancel_pair, rule_forward_move],
+    "sltiu": [rule_dead_write],
+    "slti": [rule_dead_write],
+    "add": [rule_dead_write],
+    "sub": [rule_dead_write],
+    "xor": [rule_dead_write],
+    "slt": [rule_dead_write],
+}
+
+
+def find_live_after(instructions):
+    """
+    @input instructions: a list of Instruction objects with their registers found
+    @return live_after: a list of the set of registers read after each instruction before being written again
+    """
+    live = set()
+    live_after = [None] * len(instructions)
+    for ndx in range(len(instructions) - 1, -1, -1):
+        live_after[ndx] = set(live)
+        live.discard(writes(instructions[ndx]))
+        live.update(reads(instructions[ndx]))
+    return live_after
+
+
+def peephole(instructions, warnings, verify=True):
+    """
+    rewrites short runs of instructions into fewer ones, using the rules in peephole_rules, in place
+    run once the registers are found, just before convert_pseudo turns li and mv into the real instructions
+    goes over the instructions until no more rules apply
+    @input instructions: a list of Instruction objects with their registers found
+    @input warnings: a pre-existing list to append our warnings to
+    @input verify: whether to check every rewrite with equivalent before making it
+    @return stats: a dict of {"rewrites": how many rewrites were made}
+    """
+    stats = {"rewrites": 0}
+    changed = True
+    while changed:
+        changed = False
+        live_after = find_live_after(instructions)
+        output = []
+        ndx = 0
+        while ndx < len(instructions):
+            rewrite = None
+            for rule in peephole_rules.get(instructions[ndx].op, []):
+                rewrite = rule(instructions, ndx, live_after)
+                if rewrite is None: continue
+                end, replacement = rewrite
+                if verify and not equivalent(instructions[ndx:end], replacement, live_after[end - 1]):
+                    warnings.append(f"Peephole rule {rule.__name__} would change what instruction {ndx} does, so it was skipped")
+                    rewrite = None
+                    continue
+                break
+            if rewrite is None:
+                output.append(instructions[ndx])
+                ndx += 1
+                continue
+            # skip past the rewritten instructions, the liveness after them is still right
+            end, replacement = rewrite
+            output += replacement
+            ndx = end
+            stats["rewrites"] += 1
+            changed = True
+        instructions[:] = output
+    return stats
@@ -0,0 +1,206 @@
+"""
+A cycle by cycle model of the processor's 5 stage pipeline (Verilog/Processor.sv), for timing programs without iverilog
+Each stage holds one instruction (or a bubble) between clock edges, like the r_id_*, r_ex_*, r_me_*, and r_wb_* registers
+The register file is read as an instruction moves into EX, and written halfway through the cycle its instruction is in WB,
+    so an instruction reading a register written 1 or 2 instructions before it is a data hazard
+
+How the hazards are handled is picked with the hazards option:
+    "none":    like the processor today, which has no hazard detection, so the stale value is read (and counted as a hazard)
+    "stall":   holds the instruction in ID until the value is written back
+    "forward": passes the value straight from EX or ME, only stalling to wait on a load right before
+Run with `python PipelineModel.py <file>.hex` on a memory image from step 3
+"""
+
+import argparse
+import sys
+from ISASimulator import ISASimulator, read_memory_image, kind_value, kind_load, kind_store, kind_print, kind_print_imm
+from params import default_decoder_output, luka_version
+
+stages = ["IF", "ID", "EX", "ME", "WB"]
+hazard_policies = ["none", "stall", "forward"]
+
+
+def reads(instr):
+    """
+    @input instr: a loaded instruction, from ISASimulator.load
+    @return: the registers it reads (besides x0)
+    """
+    kind, _, _, rs1, rs2, _ = instr
+    if kind in [kind_value, kind_store]: return [reg for reg in [rs1, rs2] if reg]
+    if kind in [kind_load, kind_print]: return [rs1] if rs1 else []
+    return []
+
+
+def writes(instr):
+    """
+    @input instr: a loaded instruction, from ISASimulator.load
+    @return: the register it writes, or 0 if none
+    """
+    kind, _, rd, _, _, _ = instr
+    return rd if kind in [kind_value, kind_load] else 0
+
+
+class PipelineModel():
+    """
+    the pipeline's stages and the processor's state, stepped one clock edge at a time
+    """
+    def __init__(self, specs=None, hazards="none"):
+        """
+        @input specs: the processor specs, like from step3encoder.build_default_specs (the defaults if None)
+        @input hazards: how data hazards are handled, one of hazard_policies
+        @throw: ValueError if the hazard policy isn't known
+        """
+        if hazards not in hazard_policies:
+            raise ValueError(f"Unknown hazard policy {hazards}, it should be one of {', '.join(hazard_policies)}")
+        self.hazards = hazards
+        # the decoding and the registers are the same as the ISA simulator's
+        self.simulator = ISASimulator(specs)
+
+    def run(self, words):
+        """
+        runs a program through the pipeline once, from the first fetch until the last instruction is written back
+        @input words: a list (or array) of the instruction words
+        @return stats: a dict of {
+            "instructions": how many ran,
+            "cycles": how many clock cycles it took,
+            "cpi": the cycles per instruction,
+            "stalls": how many cycles an instruction was held in ID,
+            "hazards": how many register reads got a stale value (only with "none"),
+            "occupancy": a dict of the fraction of cycles each stage held an instruction,
+            "printed": the values printed, in order}
+        @throw: ValueError if a word isn't any known instruction, or a load or store is past the end of the data memory
+        """
+        program = self.simulator.load(words)
+        self.simulator.reset()
+        registers = self.simulator.registers
+        memory = self.simulator.memory
+        mask = (1 << self.simulator.value_w) - 1
+        sign = 1 << (self.simulator.value_w - 1)
+
+        # what's in each stage, as a dict of the instruction and the values it's worked out so far, or None for a bubble
+        slots = {stage: None for stage in stages}
+        busy = {stage: 0 for stage in stages}
+        stats = {"instructions": len(program), "cycles": 0, "stalls": 0, "hazards": 0, "printed": []}
+        next_pc = 0
+
+        while next_pc < len(program) or any([slots[stage] is not None for stage in stages]):
+            stats["cycles"] += 1
+
+            # ME -> WB: the data memory is read or written, and prints show up on the display
+            moving = slots["ME"]
+            if moving is not None:
+                kind, _, rd, rs1, rs2, imm = moving["instr"]
+                if kind in [kind_load, kind_store]:
+                    address = moving["result"]
+                    if address >= self.simulator.num_data:
+                        raise ValueError(f"Data address {address} is past the {self.simulator.num_data} words of data memory")
+                    if kind == kind_load: moving["result"] = memory[address]
+                    else: memory[address] = moving["b"]
+                elif kind in [kind_print, kind_print_imm]:
+                    stats["printed"].append(moving["result"] - (moving["result"] & sign) * 2)
+            slots["WB"] = moving
+
+            # EX -> ME: the ALU works out the value (or the address, for loads and stores)
+            moving = slots["EX"]
+            if moving is not None:
+                kind, semantics, rd, rs1, rs2, imm = moving["instr"]
+                if kind == kind_value: moving["result"] = semantics(moving["a"], moving["b"], imm, self.simulator.value_w) & mask
+                elif kind == kind_print_imm: moving["result"] = imm & mask
+                elif kind == kind_print: moving["result"] = moving["a"]
+                else: moving["result"] = (moving["a"] + imm) & mask
+            slots["ME"] = moving
+
+            # ID -> EX: the registers are read, unless it has to wait on one
+            moving = slots["ID"]
+            stalled = False
+            if moving is not None:
+                # the instructions that haven't written back yet, closest first
+                pending = [slots[stage] for stage in ["ME", "WB"] if slots[stage] is not None]
+                values = {}
+                for reg in reads(moving["instr"]):
+                    producer = next((entry for entry in pending if writes(entry["instr"]) == reg), None)
+                    if producer is None:
+                        values[reg] = registers[reg]
+                    elif self.hazards == "none":
+                        stats["hazards"] += 1
+                        values[reg] = registers[reg]
+                    elif self.hazards == "forward" and not (producer is slots["ME"] and producer["instr"][0] == kind_load):
+                        values[reg] = producer["result"]
+                    else:
+                        stalled = True
+                if stalled:
+                    stats["stalls"] += 1
+                    slots["EX"] = None
+                else:
+                    _, _, _, rs1, rs2, _ = moving["instr"]
+                    moving["a"] = values.get(rs1, 0) if rs1 else 0
+                    moving["b"] = values.get(rs2, 0) if rs2 else 0
+                    slots["EX"] = moving
+            else:
+                slots["EX"] = None
+
+            # IF -> ID, and fetching the next instruction
+            if not stalled:
+                slots["ID"] = slots["IF"]
+                slots["IF"] = None
+                if next_pc < len(program):
+                    slots["IF"] = {"instr": program[next_pc]}
+                    next_pc += 1
+
+            for stage in stages:
+                if slots[stage] is not None: busy[stage] += 1
+
+            # the instruction in WB writes its register halfway through the cycle, before the next one reads it
+            done = slots["WB"]
+            if done is not None and writes(done["instr"]):
+                registers[writes(done["instr"])] = done["result"]
+            slots["WB"] = None
+
+        stats["cpi"] = stats["cycles"] / stats["instructions"] if stats["instructions"] else 0
+        stats["occupancy"] = {stage: busy[stage] / stats["cycles"] if stats["cycles"] else 0 for stage in stages}
+        return stats
+
+
+def print_report(name, stats):
+    """
+    prints the timing of a program
+    @input name: what to call the program
+    @input stats: the dict from PipelineModel.run
+    @return: none
+    """
+    print(f"{name}: {stats['instructions']} instructions in {stats['cycles']} cycles (CPI {stats['cpi']:.3f})")
+    print(f"  stall cycles: {stats['stalls']}, stale reads: {stats['hazards']}")
+    print("  occupancy: " + ", ".join([f"{stage} {stats['occupancy'][stage] * 100:.1f}%" for stage in stages]))
+
+
+def main(args):
+    """
+    times memory images through the pipeline and prints the reports
+    @input args: an argparse namespace of our command line arguments
+    @return: exit code, 0 if it's good
+    """
+    try:
+        model = PipelineModel(hazards=args.hazards)
+        for filename in args.filenames:
+            filename = filename if filename[-4:] == ".hex" else filename + ".hex"
+            stats = model.run(read_memory_image("output/" + filename))
+            print_report(filename, stats)
+            if args.debug: print("  printed:", stats["printed"])
+    except (OSError, ValueError) as err:
+        print("Pipeline Model: Encountered the following fatal errors:")
+        print("X -", err)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    # to parse the command line arguments nicely
+    parser = argparse.ArgumentParser(description = "Times encoded Luka programs through a model of the processor's pipeline")
+    parser.add_argument("--version", "-v", action='version', version='Luka version ' + luka_version, help="Gets the version info")
+    parser.add_argument("--debug", "-d", action='store_true', help="Turn on debugging mode to print more information")
+    parser.add_argument("--hazards", choices=hazard_policies, default="none",
+        help="How data hazards are handled: none (like the processor today), stall, or forward")
+    parser.add_argument("filenames", nargs="*", default=[default_decoder_output], help="The memory images in the output folder to time (.hex files)")
+    args = parser.parse_args()
+
+    sys.exit(main(args))
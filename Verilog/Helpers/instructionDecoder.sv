@@ -10,7 +10,7 @@ module instructionDecoder(
     output reg [REG_ADDR_W-1:0] rs1, rs2, rd,
     output reg [ALU_OP_W-1:0] alu_op,
     output reg [VALUE_W-1:0] imm,
-    output reg RegWrite, PrintValue
+    output reg RegWrite, PrintValue, MemRead, MemWrite
 );
 
 // defining some parameters
@@ -39,7 +39,7 @@ assign tempRs2 = instr[RS2_END -1: RS1_END];
 
 // breaking off the immediate
 
-logic [IMM_W -1:0] Iimm; //, Simm, Bimm;
+logic [IMM_W -1:0] Iimm, Simm; //, Bimm;
 logic [UIMM_W -1:0] Aimm; // Uimm, JALimm, Aimm;
 logic [VALUE_W -1:0] Pimm;
 
@@ -48,6 +48,9 @@ logic [VALUE_W -1:0] IimmFull;
 assign Iimm = instr[INSTR_W -4:RS1_END];
 // if fn3[2] is a 1, then it's unsigned, otherwise, sign extend
 assign IimmFull = {(fn3[2] | ~Iimm[IMM_W-1])? 11'b0 : 11'h7ff, Iimm};
+// the store's immediate is split, with the top bit before rs2 and the rest where rd would be
+// (loads and stores are always unsigned, as offsets into the data memory)
+assign Simm = {instr[INSTR_W -4], instr[RD_END -1: OPTYPE_W]};
 assign Aimm = {instr[VALUE_W -2: RS1_END], instr[RD_END -1: OPTYPE_W]};
 assign Pimm = instr[INSTR_W -1: OPTYPE_W];
 
@@ -56,6 +59,8 @@ assign Pimm = instr[INSTR_W -1: OPTYPE_W];
 assign PrintValue = (optype == 3'b000) | (optype == 3'b111);
 
 always_comb begin
+    MemRead = 0;
+    MemWrite = 0;
     case (optype)
         // R-type: Register
         3'b001: begin
@@ -73,14 +78,26 @@ always_comb begin
             rs2 = 0;
             imm = IimmFull;
             alu_op = e_ALU_add;
-        // S-type: Store
+        // S-type: Store, or Load (told apart by the last bit of fn3)
         end 3'b011: begin
-            RegWrite = 0;
-            rd = 0;
-            rs1 = tempRs1;
-            rs2 = tempRs2;
-            imm = 0;
-            alu_op = e_ALU_noop;
+            if (fn3[0]) begin
+                // store rs2 into the address rs1 + imm
+                RegWrite = 0;
+                rd = 0;
+                rs1 = tempRs1;
+                rs2 = tempRs2;
+                imm = {11'b0, Simm};
+                MemWrite = 1;
+            end else begin
+                // load from the address rs1 + imm into rd
+                RegWrite = 1;
+                rd = tempRd;
+                rs1 = tempRs1;
+                rs2 = 0;
+                imm = {11'b0, Iimm};
+                MemRead = 1;
+            end
+            alu_op = e_ALU_add;
         // B-type: Branch
         end 3'b100: begin
             RegWrite = 0;
@@ -55,7 +55,7 @@ logic [ALU_OP_W-1:0] r_ex_aluop;
 logic [REG_ADDR_W-1:0] s_id_rs1, s_id_rs2, r_ex_rd;
 logic [VALUE_W-1:0] r_ex_imm;
 logic [VALUE_W-1:0] r_ex_read1, r_ex_read2;
-logic r_ex_RegWrite, r_ex_PrintValue;
+logic r_ex_RegWrite, r_ex_PrintValue, r_ex_MemRead, r_ex_MemWrite;
 
 // EX stage
 logic [REG_ADDR_W-1:0] r_me_rd;
@@ -63,6 +63,8 @@ logic [VALUE_W-1:0] r_me_aluout;
 logic r_me_aluzero;
 logic r_me_RegWrite;
 logic r_me_PrintValue;
+logic r_me_MemRead, r_me_MemWrite;
+logic [VALUE_W-1:0] r_me_storedat;
 
 // ME stage
 logic [REG_ADDR_W-1:0] r_wb_rd;
@@ -97,7 +99,9 @@ stg_2_ID Stage2(
   .r_ex_rd,
   .r_ex_imm,
   .r_ex_RegWrite,
-  .r_ex_PrintValue
+  .r_ex_PrintValue,
+  .r_ex_MemRead,
+  .r_ex_MemWrite
   );
 
 
@@ -113,12 +117,17 @@ stg_3_EX Stage3(
   .r_ex_imm,
   .r_ex_RegWrite,
   .r_ex_PrintValue,
+  .r_ex_MemRead,
+  .r_ex_MemWrite,
 
   .r_me_rd,
   .r_me_aluout,
   .r_me_aluzero,
   .r_me_RegWrite,
-  .r_me_PrintValue
+  .r_me_PrintValue,
+  .r_me_MemRead,
+  .r_me_MemWrite,
+  .r_me_storedat
   );
 
 
@@ -132,6 +141,9 @@ stg_4_ME Stage4(
   .r_me_aluzero,
   .r_me_RegWrite,
   .r_me_PrintValue,
+  .r_me_MemRead,
+  .r_me_MemWrite,
+  .r_me_storedat,
 
   .r_wb_aluout,
   .r_wb_rd,
@@ -7,7 +7,8 @@ parameter NUM_REG = 16; // the number of registers
 parameter REG_ADDR_W = 4; // the number of bits to address a register
 parameter IMM_W = 5; // the length of an immediate
 parameter UIMM_W = 11; // the length of an upper immediate
-parameter NUM_INSTRS = 21; // how many instructions we have
-parameter INSTR_ADDR_W = 5; // how many bits the address of the instruction is (pc length)
+parameter NUM_DATA = 32; // the number of words of data memory (for spilled registers), sized to fit the program's spills
+parameter INSTR_MEM_SIZE = 1024; // how many words of instruction memory there are (the last holds how many instructions are loaded), sized to fit the program
+parameter INSTR_ADDR_W = 10; // how many bits the address of the instruction is (pc length)
 
 `endif
@@ -17,6 +17,26 @@ logic [INSTR_ADDR_W-1:0] s_if_nextaddr;
 logic [INSTR_ADDR_W-1:0] s_if_nextpc;
 
 
+// Instruction Memory
+
+// the program is loaded from the memory image step 3 writes, rather than compiled in
+// running the simulation with +program=<file> picks the image, so one compiled processor can run any program
+`ifndef INSTR_MEM_FILE
+    `define INSTR_MEM_FILE "../output/binary.hex"
+`endif
+logic [INSTR_W-1:0] instr_mem [0:INSTR_MEM_SIZE-1];
+string program_file;
+initial begin
+    if (!$value$plusargs("program=%s", program_file))
+        program_file = `INSTR_MEM_FILE;
+    $readmemh(program_file, instr_mem);
+end
+
+// the last word of the image holds how many instructions were loaded
+logic [INSTR_ADDR_W-1:0] num_instrs;
+assign num_instrs = instr_mem[INSTR_MEM_SIZE-1][INSTR_ADDR_W-1:0];
+
+
 
 // Combinational Logic
 
@@ -29,7 +49,7 @@ assign s_if_instr = instr_mem[r_if_pc];
 
 assign s_if_nextaddr = r_if_pc + 1;
 
-assign s_if_nextpc = (s_if_nextaddr == NUM_INSTRS)? 0 : s_if_nextaddr;
+assign s_if_nextpc = (s_if_nextaddr == num_instrs)? 0 : s_if_nextaddr;
 
 assign LEDR = r_if_pc;
 
@@ -14,12 +14,12 @@ module stg_2_ID(
     output reg [REG_ADDR_W-1:0] s_id_rs1, s_id_rs2, r_ex_rd,
     output reg [VALUE_W-1:0] r_ex_imm,
     output reg [INSTR_W-1:0] r_ex_instr,
-    output reg r_ex_RegWrite, r_ex_PrintValue
+    output reg r_ex_RegWrite, r_ex_PrintValue, r_ex_MemRead, r_ex_MemWrite
 );
 
 
 wire [REG_ADDR_W-1:0] s_id_rd;
-wire s_id_RegWrite, s_id_PrintValue;
+wire s_id_RegWrite, s_id_PrintValue, s_id_MemRead, s_id_MemWrite;
 wire [VALUE_W-1:0] s_id_imm;
 
 
@@ -33,7 +33,9 @@ instructionDecoder instrDecode(
     .alu_op(s_id_aluop),
     .imm(s_id_imm),
     .RegWrite(s_id_RegWrite),
-    .PrintValue(s_id_PrintValue)
+    .PrintValue(s_id_PrintValue),
+    .MemRead(s_id_MemRead),
+    .MemWrite(s_id_MemWrite)
 );
 
 
@@ -48,12 +50,16 @@ always_ff @ (posedge clock, negedge reset) begin
         r_ex_imm <= 0;
         r_ex_RegWrite <= 0;
         r_ex_PrintValue <= 0;
+        r_ex_MemRead <= 0;
+        r_ex_MemWrite <= 0;
     end else begin
         r_ex_aluop <= s_id_aluop;
         r_ex_rd <= s_id_rd;
         r_ex_imm <= s_id_imm;
         r_ex_RegWrite <= s_id_RegWrite;
         r_ex_PrintValue <= s_id_PrintValue;
+        r_ex_MemRead <= s_id_MemRead;
+        r_ex_MemWrite <= s_id_MemWrite;
     end
 end
 
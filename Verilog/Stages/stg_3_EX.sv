@@ -12,18 +12,24 @@ module stg_3_EX(
     input [VALUE_W-1:0] r_ex_imm,
     input r_ex_RegWrite,
     input r_ex_PrintValue,
+    input r_ex_MemRead,
+    input r_ex_MemWrite,
 
     output reg [REG_ADDR_W-1:0] r_me_rd,
     output reg [VALUE_W-1:0] r_me_aluout,
     output reg r_me_aluzero,
     output reg r_me_RegWrite,
-    output reg r_me_PrintValue
+    output reg r_me_PrintValue,
+    output reg r_me_MemRead,
+    output reg r_me_MemWrite,
+    output reg [VALUE_W-1:0] r_me_storedat
 );
 
 // --- ALU ---
 
 wire [VALUE_W-1:0] s_ex_aluout;
-assign s_ex_aluout = r_ex_read1 + r_ex_read2 + r_ex_imm;
+// a store's rs2 is the data to store, not part of the address
+assign s_ex_aluout = r_ex_read1 + (r_ex_MemWrite? 0 : r_ex_read2) + r_ex_imm;
 
 wire s_ex_aluzero;
 assign s_ex_aluzero = (s_ex_aluout == 0)? 1'b1 : 1'b0;
@@ -38,12 +44,18 @@ always_ff @ (posedge clock, negedge reset) begin
         r_me_aluzero <= 0;
         r_me_RegWrite <= 0;
         r_me_PrintValue <= 0;
+        r_me_MemRead <= 0;
+        r_me_MemWrite <= 0;
+        r_me_storedat <= 0;
     end else begin
         r_me_rd <= r_ex_rd;
         r_me_aluout <= s_ex_aluout;
         r_me_aluzero <= s_ex_aluzero;
         r_me_RegWrite <= r_ex_RegWrite;
         r_me_PrintValue <= r_ex_PrintValue;
+        r_me_MemRead <= r_ex_MemRead;
+        r_me_MemWrite <= r_ex_MemWrite;
+        r_me_storedat <= r_ex_read2;
     end 
 end
 
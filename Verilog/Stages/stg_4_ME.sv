@@ -10,6 +10,9 @@ module stg_4_ME(
     input r_me_aluzero,
     input r_me_RegWrite,
     input r_me_PrintValue,
+    input r_me_MemRead,
+    input r_me_MemWrite,
+    input [VALUE_W-1:0] r_me_storedat,
 
     output reg [VALUE_W-1:0] r_wb_aluout,
     output reg [REG_ADDR_W-1:0] r_wb_rd,
@@ -23,6 +26,24 @@ module stg_4_ME(
 //
 
 
+// ---  DATA MEMORY ---
+
+// where registers are spilled to when they run out
+logic [NUM_DATA-1:0][VALUE_W-1:0] dataMem;
+
+always_ff @ (posedge clock, negedge reset) begin
+    if (!reset) begin
+        dataMem <= 0;
+    end else if (r_me_MemWrite) begin
+        dataMem[r_me_aluout] <= r_me_storedat;
+    end
+end
+
+// a load gives the memory's value instead of the address
+wire [VALUE_W-1:0] s_me_result;
+assign s_me_result = r_me_MemRead? dataMem[r_me_aluout] : r_me_aluout;
+
+
 // ---  PRINTING ---
 
 // sending it to the hex display
@@ -41,7 +62,7 @@ always_ff @ (posedge clock, negedge reset) begin
         r_wb_rd <= 0;
         r_wb_RegWrite <= 0;
     end else begin
-        r_wb_aluout <= r_me_aluout;
+        r_wb_aluout <= s_me_result;
         r_wb_rd <= r_me_rd;
         r_wb_RegWrite <= r_me_RegWrite;
     end 
@@ -1,3 +1,5 @@
-// This file is dynamically generated to just point to the file where our binary is stored
-// the include path should be relative to the location of this file
-`include "../output/binary.vh"
\ No newline at end of file
+// This file is dynamically generated to just point to the file where our memory image is stored
+// the path is relative to where the simulation runs (the output folder), or the Verilog folder
+`ifndef INSTR_MEM_FILE
+`define INSTR_MEM_FILE "../output/binary.hex"
+`endif
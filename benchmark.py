@@ -0,0 +1,221 @@
+"""
+Microbenchmarks for the different steps of the process
+These generate larger Luka programs from the example files and time how long the pieces take on them
+Run with the name of a benchmark, ex: `python benchmark.py encode`
+"""
+
+import argparse
+import sys
+import time
+from params import luka_version
+
+
+def scale_lines(filename, num_lines):
+    """
+    reads an example luka file and repeats its lines until there are num_lines of them
+    @input filename: the name or path of the .luka file to scale up
+    @input num_lines: how many lines the result should have
+    @return lines: a list of the lines of the scaled program
+    """
+    with open(filename) as file:
+        base = file.read().split("\n")
+    lines = []
+    while len(lines) < num_lines:
+        lines += base
+    return lines[:num_lines]
+
+
+def time_it(name, function, repeats=1):
+    """
+    runs the function and prints the best time it took
+    @input name: what to call this timing when printing it
+    @input function: a function taking no inputs to time
+    @input repeats: how many times to run it, keeping the fastest
+    @return: the result of the last run
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        took = time.perf_counter() - start
+        best = took if best is None else min(best, took)
+    print(f"  {name}: {best * 1000:.2f} ms")
+    return result
+
+
+def bench_parse(args):
+    """
+    times compiling test5A.luka, scaled up, where every command is scanned once by the tokenizer,
+        rather than searched for each comparison symbol in turn
+    @input args: the argparse command line arguments
+    @return: none
+    """
+    import Grammar
+    from step1compiler import decode_lines
+
+    lines = scale_lines("test5A.luka", args.lines)
+    print(f"Parsing {len(lines)} lines of test5A.luka:")
+    commands = [comm.strip() for line in lines for comm in line.split("//")[0].split(";") if comm.strip()]
+    tokens = time_it("tokenize", lambda: [Grammar.tokenize(comm) for comm in commands], args.repeats)
+    print(f"  {sum([len(toks) for toks in tokens])} tokens in {len(commands)} commands")
+    time_it("decode_lines", lambda: decode_lines(lines, [], []), args.repeats)
+
+
+def scale_instructions(filename, num_instrs):
+    """
+    assembles an example luka file (without optimizing), and repeats its instructions until there are num_instrs of them
+    @input filename: the name or path of the .luka file to assemble
+    @input num_instrs: how many instructions the result should have
+    @return instructions: a list of the instructions as dicts, like step 3 reads in
+    """
+    import step2assembler
+    from step1compiler import decode_lines
+    from Instructions import InstructionTable
+
+    errors = []
+    with open(filename) as file:
+        program = decode_lines(file.read().split("\n"), [], errors)
+    program.type_check(errors, False)
+    instructions = step2assembler.get_instrs_from_program(program, errors, [])
+    step2assembler.select_immediates(instructions, errors)
+    step2assembler.find_registers(instructions, errors, [])
+    table = InstructionTable.from_instructions(instructions)
+    step2assembler.convert_pseudo(table, errors, [])
+    base = table.to_json_list()
+    scaled = []
+    while len(scaled) < num_instrs:
+        scaled += base
+    return scaled[:num_instrs]
+
+
+def bench_encode(args):
+    """
+    times encoding instructions by building strings (convert_all_instructions) against packing integers from an InstructionTable (encode_instructions)
+    @input args: the argparse command line arguments
+    @return: none
+    """
+    import step3encoder
+    import Encodings
+    from Instructions import InstructionTable
+
+    instructions = scale_instructions("test5A.luka", args.lines)
+    specs = step3encoder.size_instruction_memory(step3encoder.build_default_specs(), len(instructions))
+    print(f"Encoding {len(instructions)} instructions from test5A.luka ({'with' if Encodings.numpy else 'without'} numpy):")
+
+    def by_strings():
+        binary = step3encoder.convert_all_instructions(instructions, [], [])
+        return step3encoder.convert_binary_to_memory(binary, dict(specs), [], [])
+    def by_words():
+        words = step3encoder.encode_instructions(InstructionTable.from_dicts(instructions), specs, [], [])
+        return step3encoder.convert_words_to_memory(words, dict(specs), [], [])
+    strings_lines = time_it("convert_all_instructions + convert_binary_to_memory", by_strings, args.repeats)
+    words_lines = time_it("encode_instructions + convert_words_to_memory", by_words, args.repeats)
+    table = InstructionTable.from_dicts(instructions)
+    time_it("encode_instructions alone", lambda: step3encoder.encode_instructions(table, specs, [], []), args.repeats)
+    print("  outputs match" if strings_lines == words_lines else "  OUTPUTS DIFFER")
+
+
+def bench_isa(args):
+    """
+    times decoding and running an encoded program with the python ISA simulator
+    @input args: the argparse command line arguments
+    @return: none
+    """
+    import Encodings
+    from ISASimulator import ISASimulator
+
+    words = Encodings.encode_words(scale_instructions("test5A.luka", args.lines))
+    simulator = ISASimulator()
+    print(f"Simulating {len(words)} instructions from test5A.luka:")
+    program = time_it("load (decode)", lambda: simulator.load(words), args.repeats)
+    start = time.perf_counter()
+    printed = time_it("run", lambda: simulator.run(program), args.repeats)
+    print(f"  {len(program) * args.repeats / (time.perf_counter() - start) / 1e6:.2f} million instructions per second, printing {len(printed)} values")
+
+
+def bench_batch(args):
+    """
+    times running many variants of a program with the batch simulator, against running them one at a time
+    the variants are test5A.luka with its immediates picked at random
+    @input args: the argparse command line arguments
+    @return: none
+    """
+    import random
+    import Encodings
+    from ISASimulator import ISASimulator, BatchSimulator, numpy
+
+    base = scale_instructions("test5A.luka", args.lines)
+    rand = random.Random(0)
+    programs = []
+    for _ in range(args.programs):
+        variant = [dict(instr) for instr in base]
+        for instr in variant:
+            if instr["op"] in ["addi", "subi"]: instr["imm"] = rand.randrange(32)
+            elif instr["op"] == "prnti": instr["imm"] = rand.randrange(1 << 15)
+        programs.append(Encodings.encode_words(variant))
+    print(f"Simulating {len(programs)} variants of {len(base)} instructions from test5A.luka ({'with' if numpy else 'without'} numpy):")
+
+    def one_at_a_time():
+        simulator = ISASimulator()
+        printed = []
+        for words in programs:
+            simulator.reset()
+            printed.append(simulator.run(simulator.load(words)))
+        return printed
+    single = time_it("ISASimulator, one at a time", one_at_a_time, args.repeats)
+    batch = time_it("BatchSimulator", lambda: BatchSimulator().run(programs), args.repeats)
+    print("  outputs match" if single == batch else "  OUTPUTS DIFFER")
+
+
+def bench_execute(args):
+    """
+    times type checking a program, and running it in python by walking the tree (py_run) against compiling it into a function first (py_compile)
+    on test5A.luka, and on a program storing to 1000 different variables, where py_run's copying of the environment adds up
+    the request was for 100k statements, so try it with `-l 100000`
+    @input args: the argparse command line arguments
+    @return: none
+    """
+    import contextlib
+    import io
+    from step1compiler import decode_lines
+
+    def printed_by(function):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            function()
+        return output.getvalue()
+
+    variables = [f"val x{ndx % 1000} = x{(ndx - 1) % 1000} + 1;" if ndx >= 1000 else f"val x{ndx} = {ndx};" for ndx in range(args.lines)]
+    variables += [f"print(x{ndx});" for ndx in range(0, 1000, 100)]
+    for name, lines in [("test5A.luka", scale_lines("test5A.luka", args.lines)), ("1000 variables", variables)]:
+        errors = []
+        program = decode_lines(lines, [], errors)
+        print(f"Executing {len(program.commands)} commands from {name}:")
+        time_it("type_check", lambda: program.type_check(errors, False), args.repeats)
+        walked = time_it("py_run", lambda: printed_by(program.py_run), args.repeats)
+        run = time_it("py_compile", program.py_compile, args.repeats)
+        compiled = time_it("compiled run", lambda: printed_by(run), args.repeats)
+        print("  outputs match" if walked == compiled else "  OUTPUTS DIFFER")
+
+
+benchmarks = {
+    "parse": bench_parse,
+    "encode": bench_encode,
+    "isa": bench_isa,
+    "batch": bench_batch,
+    "execute": bench_execute,
+}
+
+
+if __name__ == "__main__":
+    # to parse the command line arguments nicely
+    parser = argparse.ArgumentParser(description = "Benchmarks for the Luka compilation steps")
+    parser.add_argument("--version", "-v", action='version', version='Luka version ' + luka_version, help="Gets the version info")
+    parser.add_argument("--lines", "-l", type=int, default=10_000, help="How many lines to scale the example programs up to")
+    parser.add_argument("--programs", "-n", type=int, default=1000, help="How many programs to run at once, for the batch benchmark")
+    parser.add_argument("--repeats", "-r", type=int, default=3, help="How many times to run each timing, keeping the fastest")
+    parser.add_argument("benchmark", choices=list(benchmarks.keys()), help="Which benchmark to run")
+    args = parser.parse_args()
+
+    benchmarks[args.benchmark](args)
+    sys.exit(0)
@@ -0,0 +1,209 @@
+"""
+Runs the compilation steps all together in one process
+Rather than each step writing its results to a file for the next one to read back in,
+    the results are passed along in memory, and the in-between files are only written if asked for
+Run with `python luka.py build <file>.luka`
+"""
+
+import argparse
+import sys
+import time
+from params import default_compiler_output, default_assembler_output, default_decoder_output, luka_version
+from BuildCache import BuildCache
+import step1compiler
+import step2assembler
+import step3encoder
+import Optimizer
+from Instructions import InstructionTable
+
+
+class StageTimer():
+    """
+    keeps track of how long each stage of the build takes
+    """
+    def __init__(self):
+        # a list of (stage name, seconds) in the order they ran
+        self.timings = []
+
+    def run(self, name, function, *args, **kwargs):
+        """
+        runs one stage of the build, timing it
+        @input name: what to call the stage when reporting
+        @input function: the function to run for the stage
+        @input args, kwargs: the inputs to pass to the function
+        @return: whatever the function returns
+        """
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.timings.append((name, time.perf_counter() - start))
+        return result
+
+    def report(self):
+        """
+        prints how long each stage took, and the total
+        @input: none
+        @return: none
+        """
+        width = max([len(name) for name, _ in self.timings] + [len("total")])
+        print("Stage timings:")
+        for name, seconds in self.timings:
+            print(f"  {name.ljust(width)}  {seconds * 1000:10.2f} ms")
+        total = sum([seconds for _, seconds in self.timings])
+        print(f"  {'total'.ljust(width)}  {total * 1000:10.2f} ms")
+
+
+def check_errors(stage, errors):
+    """
+    check if there are any errors in the list, printing them if yes, returning whether there were or not
+    @input stage: the name of the stage the errors came from
+    @input errors: a list of all of the errors encountered
+    @return: a boolean of whether there were errors (True) or not (False)
+    """
+    if len(errors) > 0:
+        print(f"Build: Encountered the following fatal errors while {stage}:")
+        for err in errors:
+            print("X -", err)
+        return True
+    return False
+
+
+def print_warnings(warnings):
+    """
+    prints out the warnings from the build, if there are any
+    @input warnings: the list of warnings
+    @return: none
+    """
+    if len(warnings) > 0:
+        print("Encountered the following warnings during the build:")
+        for warn in warnings:
+            print(warn)
+
+
+def build(args):
+    """
+    compiles, assembles, and encodes a luka file into the binary for the processor
+    @input args: the argparse command line arguments, stored as a Namespace
+    @return: the final status of the build, 0 if okay
+    """
+    errors = []
+    warnings = []
+    timer = StageTimer()
+
+    lines = step1compiler.get_file_contents(args.filename, warnings, errors)
+    if check_errors("opening the file", errors): return 1
+
+    # an unchanged file can just reuse the last outputs
+    cache = BuildCache(enabled=not args.no_cache, debug=args.debug)
+    luka_filename = args.filename if args.filename[-5:] == ".luka" else args.filename + ".luka"
+    output_paths = [
+        "output/" + (args.o if args.o[-4:] == ".hex" else args.o + ".hex"),
+        "Verilog/Specs/specs.vh",
+        "Verilog/Specs/opcodes.vh",
+    ]
+    if args.save_grammar is not None:
+        output_paths.append("output/" + step1compiler.output_filename(args.save_grammar, args.save_grammar.endswith(".py")))
+    if args.save_assembly is not None:
+        output_paths.append("output/" + step2assembler.output_filename(args.save_assembly, args.save_assembly.endswith(".json")))
+    grammar_format = None if args.save_grammar is None else args.save_grammar.endswith(".py")
+    assembly_format = None if args.save_assembly is None else args.save_assembly.endswith(".json")
+    cache_key = cache.key("build", [luka_filename], [grammar_format, assembly_format, args.no_optimize])
+    if timer.run("cache lookup", cache.restore, cache_key, output_paths, warnings):
+        print_warnings(warnings)
+        if args.time: timer.report()
+        if args.debug: print("Done!")
+        return 0
+
+    # step 1: compile
+    program = timer.run("compile", step1compiler.decode_lines, lines, warnings, errors, args.debug, args.jobs)
+    if check_errors("compiling", errors): return 1
+    timer.run("type check", program.type_check, errors, args.debug)
+    if check_errors("checking the data types", errors): return 1
+    if args.save_grammar is not None:
+        def save_grammar():
+            python = args.save_grammar.endswith(".py")
+            step1compiler.stream_to_file(program.commands, args.save_grammar, python)
+            step1compiler.finish_output(args.save_grammar, True, python)
+        timer.run("write grammar", save_grammar)
+
+    # step 2: assemble
+    if not args.no_optimize:
+        program, fold_stats = timer.run("fold constants", Optimizer.fold_constants, program, warnings)
+        if args.debug: print(f"Folded {fold_stats['folded']} commands into constants")
+    instructions = timer.run("assemble", step2assembler.get_instrs_from_program, program, errors, warnings)
+    if check_errors("assembling", errors): return 1
+    selected = timer.run("select immediates", step2assembler.select_immediates, instructions, errors)
+    if check_errors("selecting the immediates", errors): return 1
+    if args.debug: print(f"Swapped out {selected['selected']} instructions whose immediates didn't fit")
+    if not args.no_optimize:
+        before = len(instructions)
+        opt_stats = timer.run("optimize", step2assembler.optimize_instructions, instructions, errors)
+        if check_errors("optimizing", errors): return 1
+        if args.debug:
+            print(f"Merged {opt_stats['merged']} repeated values and removed {opt_stats['removed']} unused ones")
+            print(f"Optimized from {before} instructions down to {len(instructions)}")
+    spill_stats = timer.run("find registers", step2assembler.find_registers, instructions, errors, warnings)
+    if check_errors("finding registers", errors): return 1
+    if args.debug:
+        print(f"Spilled {spill_stats['spills']} values to memory and reloaded {spill_stats['reloads']}")
+    if not args.no_optimize:
+        peep_stats = timer.run("peephole", Optimizer.peephole, instructions, warnings)
+        if args.debug: print(f"Made {peep_stats['rewrites']} peephole rewrites, leaving {len(instructions)} instructions")
+    table = timer.run("to table", InstructionTable.from_instructions, instructions)
+    timer.run("convert pseudo", step2assembler.convert_pseudo, table, errors, warnings)
+    if args.debug:
+        print("Instructions with their registers:")
+        for ndx in range(len(table)):
+            print(" - " + table.describe(ndx))
+    if args.save_assembly is not None:
+        timer.run("write assembly", step2assembler.write_output, args.save_assembly, table, errors, warnings, assembly_format)
+        if check_errors("writing the assembly", errors): return 1
+
+    # step 3: encode
+    specs = step3encoder.size_instruction_memory(step3encoder.build_default_specs(), len(table))
+    step3encoder.size_data_memory(specs, table.rows())
+    words = timer.run("encode", step3encoder.encode_instructions, table, specs, errors, warnings)
+    if check_errors("encoding", errors): return 1
+    image = timer.run("to memory image", step3encoder.convert_words_to_memory, words, specs, errors, warnings, args.debug)
+    if check_errors("making the memory image", errors): return 1
+
+    def write_verilog():
+        step3encoder.write_output("output/" + args.o, image, errors, warnings, args.debug, ".hex")
+        specs_file = step3encoder.build_parameters_file(specs, "PARAMETERS", errors, warnings)
+        step3encoder.write_output("Verilog/Specs/specs.vh", specs_file, errors, warnings, args.debug)
+        opcodes_lines = step3encoder.build_parameters_file(step3encoder.get_opcode_values(), "opcodes", errors, warnings)
+        step3encoder.write_output("Verilog/Specs/opcodes.vh", opcodes_lines, errors, warnings, args.debug)
+    timer.run("write verilog", write_verilog)
+    if check_errors("writing the verilog", errors): return 1
+    timer.run("cache store", cache.store, cache_key, output_paths, warnings)
+
+    print_warnings(warnings)
+
+    if args.time: timer.report()
+    if args.debug: print("Done!")
+    return 0
+
+
+commands = {
+    "build": build,
+}
+
+
+if __name__ == "__main__":
+    # to parse the command line arguments nicely
+    parser = argparse.ArgumentParser(description = "Runs the Luka compilation steps together")
+    parser.add_argument("--version", "-v", action='version', version='Luka version ' + luka_version, help="Gets the version info")
+    parser.add_argument("--debug", "-d", action='store_true', help="Turn on debugging mode to print more information")
+    parser.add_argument("--time", "-t", action='store_true', help="Report how long each stage took")
+    parser.add_argument("--no-cache", action='store_true', help="Always build, rather than reusing the results from an unchanged file")
+    parser.add_argument("--no-optimize", action='store_true', help="Assemble the grammar as it is, without the optimization passes")
+    parser.add_argument("--jobs", "-j", metavar="N", type=int, default=1, help="How many processes to decode the lines with")
+    parser.add_argument("--save-grammar", metavar="file", nargs="?", const=default_compiler_output, default=None,
+        help="Also write the compiled grammar (.lkg, or .py for the python format) into the output folder")
+    parser.add_argument("--save-assembly", metavar="file", nargs="?", const=default_assembler_output, default=None,
+        help="Also write the assembly (.lka, or .json for the json format) into the output folder")
+    parser.add_argument("-o", metavar="output", action='store', default=default_decoder_output, help="The file name or path to store the memory image into")
+    parser.add_argument("command", choices=list(commands.keys()), help="What to do")
+    parser.add_argument("filename", action='store', help="The name or relative path to a file to build (.luka file)")
+    args = parser.parse_args()
+
+    sys.exit(commands[args.command](args))
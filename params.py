@@ -1,7 +1,9 @@
 luka_version = "0.4"
-default_compiler_output = "grammar.py"
-default_assembler_output = "assembly.json"
-default_decoder_output = "binary.vh"
+default_compiler_output = "grammar.lkg"
+default_assembler_output = "assembly.lka"
+default_decoder_output = "binary.hex"
 processor_inputs_file = "inputs.vh"     # also set manually in Processor.sv
 default_outfile = "simulation.out"
-default_vcdfile = "simulation.vcd"
\ No newline at end of file
+default_vcdfile = "simulation.vcd"
+default_cache_folder = "output/cache"
+default_cache_size = 64 * 1024 * 1024   # bytes, the least recently used results are thrown out past this
@@ -2,13 +2,21 @@
 The compiler is the first step in the process
 It compiles luka code into their Grammar representaions,
     where the program is stored in a nested-object way
-This compiler takes in Luka (.luka) files and outputs python (.py) files
+This compiler takes in Luka (.luka) files and outputs binary grammar (.lkg) files (see GrammarIR.py)
+    or, for debugging, python (.py) files
+Each line is read, decoded, type checked, and written out before the next one is read,
+    so the whole program never has to be held in memory at once
 """
 
+import os
 import sys
 import argparse
-from Grammar import decode_command, Program, print_specs
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from Grammar import decode_command, Program, print_specs, type_check_commands, py_run_commands, py_run_compiled_commands, command_classes
 from params import default_compiler_output, luka_version
+from BuildCache import BuildCache
+import GrammarIR
 
 def get_file_contents(filename, warnings, errors):
     """
@@ -17,78 +25,180 @@ def get_file_contents(filename, warnings, errors):
     @input filename: the name or path of the file to read from
     @input - warning: the existing list of warnings to append our warnings to
     @input - errors: the existing list of errors to append ours to
-    @return lines: a list of the lines of the file
+    @return lines: a generator of the lines of the file, read as they are needed
     """
     # check if it's a .luka extension
     if filename[-5:] != ".luka":
         warnings.append("Given file name does not end in .luka")
         filename += ".luka"
     try:
-        with open(filename) as file:
-            lines = file.read().split("\n")
+        file = open(filename)
     except FileNotFoundError:
         errors.append(f"Failed to find the file {filename}")
         return None
     except:
         errors.append(f"Failed to open the file {filename}")
         return None
-    return lines
+    return read_lines(file)
 
 
-def decode_lines(lines, warnings, errors, debugMode=False):
+def read_lines(file):
     """
-    decodes the given lines into a grammar style program
-    @input - lines: a list of the lines of a program
+    reads the lines from an open file one by one, closing it once they've all been read
+    @input file: an open file object
+    @return lines: a generator of the lines of the file, without their newlines
+    """
+    with file:
+        for line in file:
+            yield line.rstrip("\n")
+
+
+# how many lines each worker decodes at once when running with multiple jobs
+decode_chunk_size = 500
+
+
+def decode_line(i, line, warnings):
+    """
+    decodes a single line of a program, which doesn't depend on any of the other lines
+    @input i: the line number (starting at 1)
+    @input line: the string of the line
+    @input warnings: the existing list of warnings to append our warnings to
+    @return (decoded, error): a list of the Command objects in the line, and an error string if one failed to decode (None if not)
+    """
+    # check for line comments
+    comment = line.split("//")
+    if len(comment) > 1: line = comment[0]
+    # remove white space
+    line = line.strip()
+    # ignore if empty
+    if len(line) == 0:
+        # commands.append(Noop())
+        return [], None
+
+    # split the line into the commands by semicolons, warning if it doesn't end with one
+    commands_in_line = line.split(";")
+    if commands_in_line[-1] != "":
+        warnings.append(f"Line {i} does not end in a semicolon")
+    else:
+        commands_in_line = commands_in_line[:-1]
+
+    # decode each command in that line
+    decode_hist = []
+    for command in commands_in_line:
+        command = command.strip()
+        try:
+            decoded = decode_command(command)
+        except Exception as err:
+            return decode_hist, f"Error decoding command '{command}' (line {i}): {err}"
+        decode_hist.append(decoded)
+    
+    # give them all line numbers
+    for command in decode_hist:
+        command.line_number = i
+    return decode_hist, None
+
+
+def decode_chunk(chunk):
+    """
+    decodes a chunk of lines, stopping at the first one that fails (run by the worker processes)
+    @input chunk: a list of (line number, line) tuples
+    @return results: a list of (line number, decoded commands, warnings, error) tuples, one per line decoded
+    """
+    results = []
+    for i, line in chunk:
+        line_warnings = []
+        decoded, error = decode_line(i, line, line_warnings)
+        results.append((i, decoded, line_warnings, error))
+        if error is not None: break
+    return results
+
+
+def decode_in_series(lines):
+    """
+    decodes the lines one by one in this process
+    @input lines: an iterable of the lines of a program
+    @return: a generator of the (line number, decoded commands, warnings, error) tuples, in line order
+    """
+    for i, line in enumerate(lines):
+        yield from decode_chunk([(i+1, line)])
+
+
+def decode_in_parallel(lines, jobs):
+    """
+    fans chunks of lines out to a pool of worker processes, and collects the results back in order
+    only a couple chunks per worker are in flight at once, so the lines are still read as they are needed
+    @input lines: an iterable of the lines of a program
+    @input jobs: how many worker processes to use
+    @return: a generator of the (line number, decoded commands, warnings, error) tuples, in line order
+    """
+    def chunks():
+        chunk = []
+        for i, line in enumerate(lines):
+            chunk.append((i+1, line))
+            if len(chunk) == decode_chunk_size:
+                yield chunk
+                chunk = []
+        if len(chunk) > 0: yield chunk
+
+    executor = ProcessPoolExecutor(max_workers=jobs)
+    try:
+        in_flight = deque()
+        for chunk in chunks():
+            in_flight.append(executor.submit(decode_chunk, chunk))
+            if len(in_flight) >= 2 * jobs:
+                yield from in_flight.popleft().result()
+        while len(in_flight) > 0:
+            yield from in_flight.popleft().result()
+    finally:
+        # if we stopped early, don't bother decoding the rest
+        executor.shutdown(cancel_futures=True)
+
+
+def decode_commands(lines, warnings, errors, debugMode=False, jobs=1):
+    """
+    decodes the given lines into a stream of grammar style commands
+    @input - lines: an iterable of the lines of a program
     @input - warning: the existing list of warnings to append our warnings to
     @input - errors: the existing list of errors to append ours to
     @input showLines: whether the compiler should print its decision for each line or not
-    @return (prog): a Program object representing the final program
+    @input jobs: how many processes to decode the lines with, 1 to decode them all here
+    @return: a generator of the Command objects, which stops early at the first line that fails to decode
     """
-    commands = []
-    for i, line in enumerate(lines):
-        # the line numbers usually start at 1
-        i = i+1
-        # check for line comments
-        comment = line.split("//")
-        if len(comment) > 1: line = comment[0]
-        # remove white space
-        line = line.strip()
-        # ignore if empty
-        if len(line) == 0:
-            # commands.append(Noop())
-            continue
-
-        # split the line into the commands by semicolons, warning if it doesn't end with one
-        commands_in_line = line.split(";")
-        if commands_in_line[-1] != "":
-            warnings.append(f"Line {i} does not end in a semicolon")
-        else:
-            commands_in_line = commands_in_line[:-1]
-
-        # decode each command in that line
-        decode_hist = []
-        for command in commands_in_line:
-            command = command.strip()
-            try:
-                decoded = decode_command(command)
-            except Exception as err:
-                errors.append(f"Error decoding command '{command}' (line {i}): {err}")
-                return None
-            decode_hist.append(decoded)
-        
-        # give them all line numbers
-        for command in decode_hist:
-            command.line_number = i
-        
-        # add the commands for that line into our total list
-        commands += decode_hist
+    if jobs > 1:
+        results = decode_in_parallel(lines, jobs)
+    else:
+        results = decode_in_series(lines)
 
-        if debugMode:
-            decode_hist = " ".join([(str(dec)+";") for dec in decode_hist])
-            print(f"Line {i}: {decode_hist}")
+    for i, decoded, line_warnings, error in results:
+        warnings += line_warnings
+        if error is not None:
+            errors.append(error)
+            # closing the results stops any other workers
+            results.close()
+            return
+
+        if debugMode and len(decoded) > 0:
+            decoded_line = " ".join([(str(dec)+";") for dec in decoded])
+            print(f"Line {i}: {decoded_line}")
+        
+        # pass the commands for that line along
+        yield from decoded
     
     if debugMode: print()
-    return Program(commands)
+
+
+def decode_lines(lines, warnings, errors, debugMode=False, jobs=1):
+    """
+    decodes the given lines into a grammar style program
+    @input - lines: an iterable of the lines of a program
+    @input - warning: the existing list of warnings to append our warnings to
+    @input - errors: the existing list of errors to append ours to
+    @input showLines: whether the compiler should print its decision for each line or not
+    @input jobs: how many processes to decode the lines with, 1 to decode them all here
+    @return (prog): a Program object representing the final program, or None if a line failed to decode
+    """
+    program = Program(decode_commands(lines, warnings, errors, debugMode, jobs))
+    return None if len(errors) > 0 else program
 
 
 def output_to_file(program, filename, classes_needed):
@@ -106,6 +216,75 @@ def output_to_file(program, filename, classes_needed):
         # poi
 
 
+def output_filename(filename, python=False):
+    """
+    puts the right extension on the name of the file to write our grammar to
+    @input filename: the file name or path given for the output
+    @input python: True for the python (.py) format, False for the binary (.lkg) format
+    @return: the file name with the extension for that format
+    """
+    for extension in [".py", ".lkg"]:
+        if filename.endswith(extension): filename = filename[:-len(extension)]
+    return filename + (".py" if python else ".lkg")
+
+
+def stream_to_file(commands, filename, python=False):
+    """
+    write a stream of commands to the given file as they come in
+    in python format, it's the same as output_to_file, but imports all of the grammar's classes
+    since we don't know which ones are used until the end
+    it's written to a .partial file first, which finish_output puts in place, so a failed compile doesn't leave half a program
+    @input commands: an iterable of Command objects representing our compiled program's grammar
+    @input filename: the location to write our grammar to
+    @input python: True to write the python (.py) format, False for the binary (.lkg) format
+    @return count: the number of commands written
+    """
+    partial_filename = "output/" + output_filename(filename, python) + ".partial"
+    if not python:
+        return GrammarIR.write_program(commands, partial_filename)
+
+    classes_needed = sorted([str(item)[16:-2] for item in command_classes()])
+    count = 0
+    with open(partial_filename, 'w') as outFile:
+        outFile.write("from Grammar import " + ", ".join(classes_needed))
+        outFile.write("\nprogram = Program([")
+        for command in commands:
+            outFile.write((",\n\t" if count > 0 else "\n\t") + str(command))
+            count += 1
+        outFile.write("\n])\n")
+    return count
+
+
+def finish_output(filename, keep, python=False):
+    """
+    puts the file written by stream_to_file in place, or throws it out
+    @input filename: the location we wrote our grammar to
+    @input keep: True if the compile succeeded and the file should be kept, False to delete it
+    @input python: True if it was written in the python (.py) format, False for the binary (.lkg) format
+    @return: none
+    """
+    filename = "output/" + output_filename(filename, python)
+    partial_filename = filename + ".partial"
+    if not os.path.exists(partial_filename): return
+    if keep:
+        os.replace(partial_filename, filename)
+    else:
+        os.remove(partial_filename)
+
+
+def print_warnings(warnings):
+    """
+    prints out the warnings from compiling, if there are any
+    @input warnings: the list of warnings
+    @return: none
+    """
+    if len(warnings) > 0:
+        print("Encountered the following warnings during compilation:")
+        for warn in warnings:
+            print(warn)
+        print()
+
+
 def main(args):
     """
     performs all of the main functionality of the compiler
@@ -131,50 +310,62 @@ def main(args):
             print(err)
         return 1
     
+    # an unchanged file can just reuse the last output (unless it needs to run)
+    cache = BuildCache(enabled=not (args.no_cache or args.execute), debug=args.debug)
+    luka_filename = args.filename if args.filename[-5:] == ".luka" else args.filename + ".luka"
+    output_path = "output/" + output_filename(args.o, args.py)
+    cache_key = cache.key("compile", [luka_filename], [args.py])
+    if cache.restore(cache_key, [output_path], warnings):
+        print_warnings(warnings)
+        if args.debug: print("Done!")
+        return 0
+
     if args.debug:
         print()
-        print("Compiling...")
-    
-    program = decode_lines(lines, warnings, errors, args.debug)
+        print("Compiling, checking the data types, and outputting the results into a file...")
+
+    # chain each step together, so each line goes all the way through before the next is read
+    type_errors = []
+    # decoding can be split across processes, but type checking has to go in order since it carries the environment
+    commands = decode_commands(lines, warnings, errors, args.debug, args.jobs)
+    commands = type_check_commands(commands, type_errors, args.debug)
+    executing = False
+    if args.execute:
+        # nothing runs until the whole program has been decoded and type checked
+        commands = list(commands)
+        executing = len(errors) == 0 and len(type_errors) == 0
+    if executing:
+        if args.debug: print("Executing...")
+        print("Execution results:\n---")
+        commands = py_run_compiled_commands(commands) if args.compiled else py_run_commands(commands)
+    try:
+        count = stream_to_file(commands, args.o, args.py)
+    except Exception as err:
+        errors.append(f"Error while compiling: {err}")
+    if executing:
+        print("---\n")
+    finish_output(args.o, len(errors) == 0 and len(type_errors) == 0, args.py)
+
     if len(errors) > 0:
         print("Encountered the following errors in compiling:")
         for err in errors:
             print(err)
         return 1
 
-    if args.debug:
-        print("Checking the data types...")
-
-    if not program.type_check(errors, args.debug):
+    if len(type_errors) > 0:
         print("Type error encountered during compilation:")
-        for err in errors:
+        for err in type_errors:
             print(err)
         return 1
     
     if args.debug:
         print()
-        print("Final grammar:")
-        print(str(program))
+        print(f"Wrote {count} commands")
         print()
 
-    if args.execute:
-        if args.debug: print("Executing...")
-        print("Execution results:\n---")
-        program.py_run()
-        print("---\n")
-    
-    if args.debug: print("Outputting results into a file...")
-    classes_needed = program.classes_used()
-    # convert them to a string and cut off the beginning <class 'Grammar. and ending '>
-    classes_needed = [str(item)[16:-2] for item in classes_needed]
-    output_to_file(program, args.o, classes_needed)
-    if args.debug: print()
+    cache.store(cache_key, [output_path], warnings)
 
-    if len(warnings) > 0:
-        print("Encountered the following warnings during compilation:")
-        for warn in warnings:
-            print(warn)
-        print()
+    print_warnings(warnings)
     
     if args.debug: print("Done!")
     return 0
@@ -185,6 +376,10 @@ if __name__ == "__main__":
     parser.add_argument("--version", "-v", action='version', version='Luka version ' + luka_version, help="Gets the version info")
     parser.add_argument("--debug", "-d", action='store_true', help="Turn on debugging mode to print more information")
     parser.add_argument("--execute", "-e", action='store_true', help="Execute the code in python to test its functionality")
+    parser.add_argument("--compiled", action='store_true', help="With --execute, compile the program into a python function to run, rather than walking the tree")
+    parser.add_argument("--no-cache", action='store_true', help="Always compile, rather than reusing the results from an unchanged file")
+    parser.add_argument("--py", action='store_true', help="Output the grammar as python source (for debugging) instead of the binary format")
+    parser.add_argument("--jobs", "-j", metavar="N", type=int, default=1, help="How many processes to decode the lines with")
     parser.add_argument("-o", metavar="output", action='store', default=default_compiler_output, help="The file name or path to store the results into")
     parser.add_argument("filename", action='store', help="The name or relative path to a file to compile (.luka file)")
     args = parser.parse_args()
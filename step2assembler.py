@@ -1,13 +1,24 @@
 """
 The assembler is the second step in the process
 It assembles the grammar into a list of machine instructions
-This assembler takes in Python (.py) files and outputs JSON (.json) files
+This assembler takes in binary grammar (.lkg) or Python (.py) files and outputs binary assembly (.lka) files (see AssemblyIR.py)
+    or, for debugging, JSON (.json) files
 """
 
 import Grammar
-from Instructions import Instruction, poss_instructions
+import GrammarIR
+import AssemblyIR
+import Optimizer
+import Encodings
+import step3encoder
+from Instructions import Instruction, InstructionTable, op_id, poss_instructions
 from params import default_compiler_output, default_assembler_output, luka_version
+from BuildCache import BuildCache
+import os
+import bisect
+import heapq
 import json
+import math
 import argparse
 import sys
 
@@ -57,6 +68,25 @@ def import_program_grammar(filename, errors, warnings):
         return None
 
 
+def open_program_grammar(filename, errors, warnings):
+    """
+    read the program's grammar from step 1's output, in either format
+    binary grammar files are memory mapped, and python files are imported
+    @input filename: the name or path of the file to open (.lkg by default, or .py)
+    @input errors: a pre-existing list of errors to append our errors to
+    @input warnings: a pre-existing list of warnings to append our issues to
+    @return program: a Program object representing the program grammar
+    """
+    if filename[-3:] == ".py":
+        return import_program_grammar(filename, errors, warnings)
+    if filename[-4:] != ".lkg": filename += ".lkg"
+    try:
+        return GrammarIR.read_program("output/" + filename)
+    except Exception as err:
+        errors.append(f"Error reading the grammar: {err}")
+        return None
+
+
 def get_instrs_from_program(program, errors, warnings):
     """
     take in a program's grammar and fake execute it, getting a queue of the operations
@@ -394,210 +424,486 @@ def get_instrs_from_command(command, errors, warnings):
         return None
 
 
-def find_open_reg(registers, scopes, curr_ndx):
+# for each instruction, (how many register inputs it reads, whether it writes a register)
+register_usage = {
+    "li": (0, True),
+    "mv": (1, True),
+    "prnti": (0, False),
+    "prnt": (1, False),
+    "addi": (1, True), "subi": (1, True), "xori": (1, True), "slti": (1, True), "sltiu": (1, True),
+    "add": (2, True), "sub": (2, True), "xor": (2, True), "slt": (2, True),
+}
+# register 0 is always 0, so the rest are the ones we can use
+num_registers = 16
+# how many words of data memory a load or store can reach from x0 (its offset is 0 to 31)
+num_spill_slots = 32
+# once a program spills more than that, this register is kept aside to point at the rest, num_spill_slots words at a time
+spill_base_register = num_registers - 1
+# a spill's address is a VALUE_W bit value, so that's as far as the data memory can go
+max_spill_slots = 1 << int(step3encoder.build_default_specs()["VALUE_W"])
+
+
+def resolve_tags(instructions, errors):
     """
-    goes through the registers and finds the first open one
-    @input registers: a list that maps the register number to the index of an instruction,
-        the one which generated the number now stored in that register
-    @input scopes: a list that maps an instruction index to the index of the last instruction
-        that uses its value
-    @input curr_ndx: the current instruction index we are on to know where the scope is
-    @return reg_num: the register number of the first one that is open for storing data
+    converts the tag (variable name) references into index references, in place
+    each tag refers to the latest instruction before it with that tag, so just keep track of those going forward
+    @input instructions: a list of Instruction objects
+    @input errors: a pre-existing list to append our errors to
+    @return: none
     """
-    # loop through each register number (skipping 0)
-    # could use enumerate, but this is clearer to me
-    for reg_num in range(1, len(registers)):
-        # get the source of the value there
-        instr_source = registers[reg_num]
-        # get the last time this value is needed
-        final_ref = scopes[instr_source]
-        # is the last time we needed that value already passed
-        # if this is '<' : doesn't allow for register into register writing, ex addi x1, x1, 4 
-        if final_ref <= curr_ndx: return reg_num
-    # if none of the registers are available, throw an error
-    raise RuntimeError("No registers left!")
+    # maps a tag to the index of the latest instruction with it
+    latest = {}
+    for ndx, instr in enumerate(instructions):
+        new_ids = [latest.get(tag) if type(tag) is str else tag for tag in instr.ref_ids]
+        if not all([noo is not None for noo in new_ids]):
+            broken = [str(old_id) for (old_id, new_id) in zip(instr.ref_ids, new_ids) if new_id is None]
+            errors.append("Unable to find a needed reference tag(s) " + ", ".join(broken) + " for instruction number " + str(ndx))
+            return
+        instr.ref_ids = new_ids
+        # only update after, so that an instruction can't reference itself
+        for tag in instr.tags:
+            if type(tag) is str: latest[tag] = ndx
 
 
-def find_in_list(lst, item):
+class ImmediateSelector():
     """
-    finds the index of a list where some item is located
-    @input lst: a list to search through
-    @input item: the item to search for (any type, as long as it matches lst)
-    @return ndx: the index of the item
+    picks the instructions for the immediates, so that every immediate fits in the instruction holding it
+    the widths come from the processor specs, so changing IMM_W there changes what's picked here
+    constants too big for an li are built up by doubling (add x, x) and adding small immediates on,
+        which is the cheapest way there is without shifts or an lui
     """
-    for ndx, val in enumerate(lst):
-        if val == item:
-            return ndx
-    raise RuntimeError(f"Unable to find item {str(item)}")
+    def __init__(self, specs=None):
+        """
+        @input specs: the processor specs, or None for step3encoder.build_default_specs
+        """
+        if specs is None: specs = step3encoder.build_default_specs()
+        self.ranges = {op: Encodings.immediate_range(op, specs) for ops in Encodings.instr_types.values() for op in ops}
+        # the biggest offset a single addi or subi can do
+        self.max_offset = min(self.ranges["addi"][-1], self.ranges["subi"][-1])
+        # the best steps found for each constant so far
+        self.plans = {}
+        self.value_w = int(specs["VALUE_W"])
+
+    def fits_li(self, value):
+        """li becomes an addi from x0, or a subi from x0 for negatives"""
+        return value in self.ranges["addi"] or -value in self.ranges["subi"]
+
+    def offset_op(self, offset):
+        """@return: the (op, imm) that adds the offset on, for offsets that fit"""
+        return ("addi", offset) if offset >= 0 else ("subi", -offset)
+
+    def plan(self, value):
+        """
+        finds the fewest steps to build a constant, where value = 2 * smaller + offset
+        @input value: the integer to build
+        @return steps: a list of ("li", value), ("double",) or ("offset", amount)
+        """
+        # the registers wrap around, so 65535 is the same as -1
+        half_range = 1 << (self.value_w - 1)
+        value = (value + half_range) % (1 << self.value_w) - half_range
+        if self.fits_li(value): return [("li", value)]
+        if value in self.plans: return self.plans[value]
+        best = None
+        for offset in range(-self.max_offset, self.max_offset + 1):
+            if (value - offset) % 2 != 0: continue
+            half = (value - offset) // 2
+            # always get closer to something an li can do
+            if abs(half) >= abs(value): continue
+            steps = self.plan(half) + [("double",)] + ([("offset", offset)] if offset != 0 else [])
+            if best is None or len(steps) < len(best): best = steps
+        self.plans[value] = best
+        return best
+
+    def build_constant(self, value, output):
+        """
+        adds the instructions to make a constant onto the output
+        @input value: the integer to build
+        @input output: the list of Instruction objects being made, with index references
+        @return: none, the last instruction added holds the value
+        """
+        for step in self.plan(value):
+            if step[0] == "li":
+                output.append(Instruction("li", imm=step[1]))
+            elif step[0] == "double":
+                output.append(Instruction("add", ref_ids=[len(output) - 1, len(output) - 1]))
+            else:
+                op, imm = self.offset_op(step[1])
+                output.append(Instruction(op, ref_ids=[len(output) - 1], imm=imm))
+
+    def add_offset(self, ref, offset, output):
+        """
+        adds the instructions to add a number of any size onto a value, picking the shorter of
+            a chain of addis or subis, or building the number and adding it
+        @input ref: the index of the value to add onto
+        @input offset: the integer to add (negative to subtract)
+        @input output: the list of Instruction objects being made, with index references
+        @return: none, the last instruction added holds the result
+        """
+        chain = -(-abs(offset) // self.max_offset)
+        if chain <= len(self.plan(offset)) + 1:
+            remaining = offset
+            while remaining != 0:
+                step = max(-self.max_offset, min(self.max_offset, remaining))
+                op, imm = self.offset_op(step)
+                output.append(Instruction(op, ref_ids=[ref], imm=imm))
+                ref = len(output) - 1
+                remaining -= step
+        else:
+            self.build_constant(offset, output)
+            output.append(Instruction("add", ref_ids=[ref, len(output) - 1]))
+
+    def select(self, instr, refs, output, errors):
+        """
+        adds the instructions for one instruction onto the output, swapping it out if its immediate doesn't fit
+        @input instr: the Instruction to select for
+        @input refs: its references, as indices in the output
+        @input output: the list of Instruction objects being made, with index references
+        @input errors: a pre-existing list to append our errors to
+        @return: none, the last instruction added holds its value
+        """
+        op, imm = instr.op, instr.imm
+        if op == "li":
+            if not self.fits_li(imm): return self.build_constant(imm, output)
+        elif op in ["addi", "subi"] and imm not in self.ranges[op]:
+            return self.add_offset(refs[0], imm if op == "addi" else -imm, output)
+        elif op in ["xori", "slti"] and imm not in self.ranges[op]:
+            # the register version does the same, once the constant is built
+            self.build_constant(imm, output)
+            return output.append(Instruction(op[:-1], ref_ids=[refs[0], len(output) - 1]))
+        elif op in self.ranges and self.ranges[op] is not None and imm is not None and imm not in self.ranges[op]:
+            errors.append(f"The immediate {imm} doesn't fit in {op}, which holds {self.ranges[op][0]} to {self.ranges[op][-1]}")
+            return
+        instr.ref_ids = refs
+        output.append(instr)
+
+
+def select_immediates(instructions, errors):
+    """
+    swaps out the instructions with immediates that don't fit for ones that do, in place
+    @input instructions: a list of Instruction objects, with their references resolved to indices afterwards
+    @input errors: a pre-existing list to append our errors to
+    @return stats: a dict of {"selected": how many instructions were swapped out}
+    """
+    resolve_tags(instructions, errors)
+    if check_errors(errors): return {"selected": 0}
+    selector = ImmediateSelector()
+    # maps each old index to the index in the new list that holds its value
+    new_index = [None] * len(instructions)
+    output = []
+    selected = 0
+    for ndx, instr in enumerate(instructions):
+        start = len(output)
+        selector.select(instr, [new_index[ref] for ref in instr.ref_ids], output, errors)
+        if check_errors(errors): return {"selected": selected}
+        if len(output) - start != 1 or output[-1] is not instr:
+            selected += 1
+            output[-1].tags = instr.tags
+        new_index[ndx] = len(output) - 1
+    instructions[:] = output
+    return {"selected": selected}
+
+
+def optimize_instructions(instructions, errors):
+    """
+    runs the optimization passes over the instructions, in place
+    @input instructions: a list of Instruction objects, with their references resolved to indices afterwards
+    @input errors: a pre-existing list to append our errors to
+    @return stats: a dict of how much each pass removed
+    """
+    stats = {}
+    # the passes need the references as indices to compare them
+    resolve_tags(instructions, errors)
+    if check_errors(errors): return stats
+    stats.update(Optimizer.number_values(instructions))
+    stats.update(Optimizer.remove_dead_values(instructions))
+    return stats
+
+
+def find_uses(instructions):
+    """
+    find every instruction where each value is used, to know when to let it go out of scope
+    and which values are needed soonest
+    @input instructions: a list of Instruction objects, with their references already resolved to indices
+    @return uses: a list that maps the instruction index to a sorted list of the instruction indices that use its return value
+    """
+    uses = [[] for _ in instructions]
+    # by starting at the beginning and going to the end, each list ends up in order
+    for ndx, instr in enumerate(instructions):
+        for ref in instr.ref_ids:
+            if len(uses[ref]) == 0 or uses[ref][-1] != ndx:
+                uses[ref].append(ndx)
+    return uses
 
 
 def find_registers(instructions, errors, warnings):
     """
     given a list of Instruction objects, line up register values for them
     and store this in each instruction
-    @input instructions: a list of Instruction objects
+    this is a linear scan over the live intervals of the values: each value lives from the instruction that
+    makes it to the last one that uses it, and takes the lowest numbered register that's free by then
+    if there are none free, the value in a register that's needed furthest in the future is spilled to memory
+    (with an sw), and loaded back into a register (with an lw) right before it's needed again
+    the first num_spill_slots words are reached straight from x0, and if that isn't enough, the registers are found again
+        with spill_base_register kept aside to point at the rest of the data memory
+    @input instructions: a list of Instruction objects, which has the loads and stores added into it
     @input errors: a pre-existing list to append our errors to
     @input warnings: a pre-existing list to append our warnings to
-    @return: none
+    @return stats: a dict of {"spills": the number of stores added, "reloads": the number of loads added,
+        "slots": how many words of data memory the spills use}
     """
-    # strip the tags out from the instructions
-    tags = [[ref for ref in instr.tags if type(ref) is str] for instr in instructions]
-    # create a helper function
-    def last_tag(tag, index):
-        """find the latest tag of a certain name before a certain index"""
-        for ndx in reversed(range(index)):
-            if tag in tags[ndx]: return ndx
-        return None
-    # convert the tag references into index references
-    for ndx, instr in enumerate(instructions):
-        new_ids = [last_tag(tag, ndx) if type(tag) is str else tag for tag in instr.ref_ids]
-        if not all([noo is not None for noo in new_ids]):
-            broken = [str(old_id) for (old_id, new_id) in zip(instr.ref_ids, new_ids) if not new_id]
-            errors.append("Unable to find a needed reference tag(s) " + ", ".join(broken) + " for instruction number " + str(ndx))
-            return
-        instr.ref_ids = new_ids
+    resolve_tags(instructions, errors)
+    if check_errors(errors): return {"spills": 0, "reloads": 0, "slots": 0}
+    uses = find_uses(instructions)
+    stats = allocate_registers(instructions, uses, errors, False)
+    if stats is None:
+        stats = allocate_registers(instructions, uses, errors, True)
+    return stats
 
-    # find the final instruction where we use a value to know when to let it go out of scope
-    # will map the instruction index to the instruction index where the return value is last used
-    scopes = [-1 for _ in instructions]
-    # go through and update the scopes and tags according to the references
-    # by starting at the beginning and going to the end, we overwrite any scope values with the last time they're needed
-    for ndx, instr in enumerate(instructions):
-        refs = instr.ref_ids
-        if refs is not None and len(refs) > 0:
-            for ref in refs:
-                # # str ref: references an ident/tag
-                # if type(ref) is str:
-                #     ref_id = last_tag(ref, ndx)
-                #     if not ref_id:
-                #         errors.append(f"Can't find tag {ref} before where it's needed for instruction number {ndx}")
-                #         return
-                #     scopes[ref_id] = ndx
-                # # int ref: references an index
-                # else:
-                scopes[ref] = ndx
-    
-    # a list that maps register number to the reference index of which instruction generated the number stored in it
-    registers = [-1 for _ in range(16)]
-    registers[0] = len(instructions) # never goes out of scope
 
-    # can use both scopes and registers to get an array that maps the register to its latest scope
-    # this is changing though and a waste to update, so just calculate as needed
-    # reg2scope = [scope[instr_ndx] for instr_ndx in registers]
+def allocate_registers(instructions, uses, errors, paged):
+    """
+    the linear scan for find_registers
+    @input instructions: a list of Instruction objects, with their references resolved to indices
+    @input uses: the uses of each value, from find_uses
+    @input errors: a pre-existing list to append our errors to
+    @input paged: whether to keep spill_base_register aside to reach past the first num_spill_slots words
+    @return stats: the stats for find_registers, or None if it isn't paged and ran out of spill slots
+    """
+    stats = {"spills": 0, "reloads": 0, "slots": 0}
+
+    # the registers and memory addresses that are free to be written, lowest first
+    free = list(range(1, spill_base_register if paged else num_registers))
+    free_slots = []
+    # maps an instruction index to the values (by the index of the instruction that made them) that free up once we reach it
+    expiring = {}
+    # maps a value to the register that holds it, and back
+    in_reg = {}
+    reg_value = {}
+    # maps a value to the memory address it's been spilled to
+    # values never change once made, so a spilled value doesn't need storing again
+    in_slot = {}
+    # the instructions with the loads and stores added in
+    output = []
+    # which num_spill_slots words spill_base_register points at, once it's been set
+    base_page = None
+    selector = ImmediateSelector()
+
+    def next_use(value, ndx):
+        """the first instruction after ndx that uses the value, or infinity if none do"""
+        after = bisect.bisect_right(uses[value], ndx)
+        return uses[value][after] if after < len(uses[value]) else math.inf
+
+    def address(slot):
+        """the (base register, offset) of a spill slot, pointing spill_base_register at its page first if it has to"""
+        nonlocal base_page
+        page, offset = divmod(slot, num_spill_slots)
+        if page == 0: return 0, offset
+        if page != base_page:
+            steps = []
+            selector.build_constant(page * num_spill_slots, steps)
+            for step in steps:
+                # each step builds on the last, all in the base register
+                step.ref_ids = []
+                step.rd = spill_base_register
+                if step.op != "li": step.rs1 = spill_base_register
+                if step.op == "add": step.rs2 = spill_base_register
+            output.extend(steps)
+            base_page = page
+        return spill_base_register, offset
+
+    def take_register(ndx, keep):
+        """find a register to write to at instruction ndx, spilling one (not in keep) if none are free"""
+        if len(free) > 0: return heapq.heappop(free)
+        candidates = [value for value in in_reg if value not in keep]
+        if len(candidates) == 0: return None
+        # the value needed furthest in the future
+        victim = max(candidates, key=lambda value: (next_use(value, ndx), in_reg[value]))
+        if victim not in in_slot and next_use(victim, ndx) != math.inf:
+            if len(free_slots) > 0:
+                in_slot[victim] = heapq.heappop(free_slots)
+            elif stats["slots"] < (max_spill_slots if paged else num_spill_slots):
+                in_slot[victim] = stats["slots"]
+                stats["slots"] += 1
+            else:
+                return None
+            store = Instruction("sw")
+            store.rs1, store.imm = address(in_slot[victim])
+            store.rs2 = in_reg[victim]
+            output.append(store)
+            stats["spills"] += 1
+        reg = in_reg.pop(victim)
+        del reg_value[reg]
+        return reg
 
     # go through the instructions and link them up
     for i, instr in enumerate(instructions):
-        # set a bunch of flags to show what parts we need to decode/store
-        # does the instruction have a return value to store in a register rd
-        hasReturn = False
-        # does the instruction take in an input value from rs1
-        hasInput = False
-        # does the instruction have a second value from rs2
-        hasInput2 = False
-        # the immediate should already be stored in the instruction
-        op = instr.op
-        if op is "li":
-            hasReturn = True
-        elif op is "mv":
-            hasInput = True
-            hasReturn = True
-        elif op is "prnti":
-            pass
-        elif op is "prnt":
-            hasInput = True
-        elif op in ["addi", "subi", "xori", "slti", "sltiu"]:
-            hasInput = True
-            hasReturn = True
-        elif op in ["add", "sub", "xor", "slt"]:
-            hasInput = True
-            hasInput2 = True
-            hasReturn = True
-        else:
+        if instr.op not in register_usage:
             errors.append("Unrecognized instruction " + instr.op)
-            return
+            return stats
+        num_inputs, hasReturn = register_usage[instr.op]
+        inputs = instr.ref_ids[:num_inputs]
+
+        # load any of the input values that were spilled
+        for val_ref in inputs:
+            if val_ref in in_reg: continue
+            if val_ref not in in_slot:
+                errors.append(RuntimeError(f"Unable to find item {str(val_ref)}"))
+                return stats
+            reg = take_register(i, set(inputs))
+            if reg is None:
+                if not paged: return None
+                errors.append(f"Error while decoding instruction {str(instr)}: No registers left, and more than {max_spill_slots} values spilled to memory!")
+                return stats
+            load = Instruction("lw")
+            load.rs1, load.imm = address(in_slot[val_ref])
+            load.rd = reg
+            output.append(load)
+            stats["reloads"] += 1
+            in_reg[val_ref] = reg
+            reg_value[reg] = val_ref
+
+        # find which registers hold the input values
+        sources = [in_reg[val_ref] for val_ref in inputs]
+        if num_inputs >= 1: instr.rs1 = sources[0]
+        if num_inputs >= 2: instr.rs2 = sources[1]
+
+        # any values last used here can have their registers written to,
+        # which allows for register into register writing, ex addi x1, x1, 4
+        for value in expiring.pop(i, []):
+            if value in in_reg:
+                reg = in_reg.pop(value)
+                del reg_value[reg]
+                heapq.heappush(free, reg)
+            if value in in_slot:
+                heapq.heappush(free_slots, in_slot.pop(value))
 
-        if hasInput:
-            # get the reference to the input value
-            val_ref1 = instr.ref_ids[0]
-            # find which register holds a value generated by this reference
-            try:
-                src1 = find_in_list(registers, val_ref1)
-            except Exception as e:
-                errors.append(e)
-                return
-            # set the rs1 to this register we found
-            instr.rs1 = src1
-        if hasInput2:
-            # same as for rs1
-            try:
-                instr.rs2 = find_in_list(registers, instr.ref_ids[1])
-            except Exception as e:
-                errors.append(e)
-                return
         # check the return last so we don't overwrite anything
         if hasReturn:
-            # find an open register (can fail and throw if there are none)
-            try:
-                open_reg = find_open_reg(registers, scopes, i)
-            except Exception as err:
-                errors.append(f"Error while decoding instruction {str(instr)}: {err}")
-                return
+            open_reg = take_register(i, set())
+            if open_reg is None:
+                if not paged: return None
+                errors.append(f"Error while decoding instruction {str(instr)}: No registers left, and more than {max_spill_slots} values spilled to memory!")
+                return stats
             # set this as the output
             instr.rd = open_reg
-            # log that this register holds this instruction
-            registers[open_reg] = i
+            in_reg[i] = open_reg
+            reg_value[open_reg] = i
+            # values that are never used are free for the very next instruction
+            end = uses[i][-1] if len(uses[i]) > 0 else i + 1
+            expiring.setdefault(end, []).append(i)
+
+        output.append(instr)
     
-    # nothing to return, instructions are updated in place
+    # the instructions are updated in place
+    instructions[:] = output
+    return stats
 
 
-def convert_pseudo(instructions, errors, warnings):
+def convert_pseudo(table, errors, warnings):
     """
-    converts the pseudo instructions in the instructions list into
+    converts the pseudo instructions in the instruction table into
     their real instructions (in place)
-    @input instructions: a list of Instruction objects with registers already set
+    @input table: an InstructionTable of the instructions, with registers already set
     @input errors: a pre-existing list to append our errors to
     @input warnings: a pre-existing list to append our warnings to
     @return: none
     """
-    for instr in instructions:
+    li, mv, addi, subi = op_id("li"), op_id("mv"), op_id("addi"), op_id("subi")
+    for ndx, op in enumerate(table.op):
         # TODO: replace the "addi" with "ori" to increase proportion of simple commands
-        if instr.op == "li":
+        if op == li:
             # li <rd>, <imm> : loads the immediate into rs1 == addi <rd>, x0, <imm>
-            instr.op = "addi"
-            instr.rs1 = 0
-        elif instr.op == "mv":
+            table.op[ndx] = addi
+            table.rs1[ndx] = 0
+            # (or subi <rd>, x0, -<imm> for negatives, since addi's immediate is unsigned)
+            if table.imm[ndx] < 0:
+                table.op[ndx] = subi
+                table.imm[ndx] = -table.imm[ndx]
+        elif op == mv:
             # mv <rd>, <rs1> : copies (moves) the value is rs1 into rd == addi <rd>, <rs1>, 0x0
-            instr.op = "addi"
-            instr.imm = 0
+            table.op[ndx] = addi
+            table.imm[ndx] = 0
         # won't hit every case, only those that are pseudo
     # no returns, updated in place
 
 
-def write_output(filename, instructions, errors, warnings):
+def output_filename(filename, as_json=False):
     """
-    open the file and output the instructions as a json there
-    @input filename: the file name or path of where to save our data (should end in .json)
-    @input instructions: a list of dicts, each dict representing one single risc-v instruction
+    puts the right extension on the name of the file to write our assembly to
+    @input filename: the file name or path given for the output
+    @input as_json: True for the json (.json) format, False for the binary (.lka) format
+    @return: the file name with the extension for that format
+    """
+    for extension in [".json", ".lka"]:
+        if filename.endswith(extension): filename = filename[:-len(extension)]
+    return filename + (".json" if as_json else ".lka")
+
+
+def write_output(filename, table, errors, warnings, as_json=False):
+    """
+    open the file and output the instructions there
+    @input filename: the file name or path of where to save our data (the extension is put on for the format)
+    @input table: an InstructionTable of the instructions
     @input errors: a pre-existing list of errors to append ours to
     @input warnings: a pre-existing list of warnings to append ours to
+    @input as_json: True to write them as a json list of dicts, False for the binary format
     @return: none
     """
-    if filename[-5:] != ".json": filename += ".json"
+    filename = "output/" + output_filename(filename, as_json)
     try:
-        with open("output/" + filename, "w") as outFile:
-            json.dump(instructions, outFile, indent=2)
+        if as_json:
+            with open(filename, "w") as outFile:
+                json.dump(table.to_json_list(), outFile, indent=2)
+        else:
+            AssemblyIR.write_table(table, filename)
     except Exception as err:
         errors.append(f"Error during writing the output: {err}")
 
 
+def print_warnings(warnings):
+    """
+    prints out the warnings from assembling, if there are any
+    @input warnings: the list of warnings
+    @return: none
+    """
+    if len(warnings) > 0:
+        print("\nEncountered the following warnings during assembly:")
+        for warn in warnings:
+            print(warn)
+
+
+def grammar_path(filename):
+    """
+    @input filename: the name of the grammar file given on the command line
+    @return: the path of the file in the output folder, with its extension
+    """
+    if filename[-3:] == ".py" or filename[-4:] == ".lkg": return "output/" + filename
+    return "output/" + filename + ".lkg"
+
+
 def main(args):
     errors = []
     warnings = []
 
-    if args.debug: print("Importing the grammar...")
-    program = import_program_grammar(args.filename, errors, warnings)
+    # an unchanged grammar can just reuse the last output
+    cache = BuildCache(enabled=not args.no_cache, debug=args.debug)
+    input_path = grammar_path(args.filename)
+    output_path = "output/" + output_filename(args.o, args.json)
+    cache_key = cache.key("assemble", [input_path], [args.no_optimize, args.json]) if os.path.exists(input_path) else None
+    if cache_key and cache.restore(cache_key, [output_path], warnings):
+        print_warnings(warnings)
+        if args.debug: print("Done!")
+        return 0
+
+    if args.debug: print("Reading the grammar...")
+    program = open_program_grammar(args.filename, errors, warnings)
     if check_errors(errors, True): return 1
 
+    if not args.no_optimize:
+        if args.debug: print("\nFolding the constants...")
+        program, fold_stats = Optimizer.fold_constants(program, warnings)
+        if args.debug: print(f"Folded {fold_stats['folded']} commands into constants")
+
     if args.debug: print("\nConverting the grammar into a list of instructions...")
     instructions = get_instrs_from_program(program, errors, warnings)
     if check_errors(errors, True): return 1
@@ -608,35 +914,47 @@ def main(args):
         for i, instr in enumerate(instructions):
             print(str(i).zfill(fill) + " - " + str(instr))
 
+    selected = select_immediates(instructions, errors)
+    if check_errors(errors, True): return 1
+    if args.debug: print(f"Swapped out {selected['selected']} instructions whose immediates didn't fit")
+
+    if not args.no_optimize:
+        if args.debug: print("\nOptimizing the instructions...")
+        before = len(instructions)
+        opt_stats = optimize_instructions(instructions, errors)
+        if check_errors(errors, True): return 1
+        if args.debug:
+            print(f"Merged {opt_stats['merged']} repeated values and removed {opt_stats['removed']} unused ones")
+            print(f"Optimized from {before} instructions down to {len(instructions)}")
+
     if args.debug:
         print("\nFound instructions types:", ", ".join(poss_instructions))
         print()
         print("Linking the instructions to registers...")
-    find_registers(instructions, errors, warnings)
+    spill_stats = find_registers(instructions, errors, warnings)
     if check_errors(errors, True): return 1
+    if args.debug:
+        print(f"Spilled {spill_stats['spills']} values to memory and reloaded {spill_stats['reloads']}")
 
+    if not args.no_optimize:
+        peep_stats = Optimizer.peephole(instructions, warnings)
+        if args.debug: print(f"Made {peep_stats['rewrites']} peephole rewrites, leaving {len(instructions)} instructions")
+
+    # from here on the instructions only need their fields, so they go into the compact table
+    table = InstructionTable.from_instructions(instructions)
     if args.debug: print("\nConverting pseudo instructions to real ones")
-    convert_pseudo(instructions, errors, warnings)
+    convert_pseudo(table, errors, warnings)
 
     if args.debug:
         print("Instructions with their registers:")
-        for instr in instructions:
-            print(" - " + str(instr))
-        print("\nCreating the dict format for each instruction")
-    json_ready = [instr.to_json() for instr in instructions]
-
-    if args.debug:
-        print("The dicts are:")
-        for instr in json_ready:
-            print(instr)
+        for ndx in range(len(table)):
+            print(" - " + table.describe(ndx))
         print("\nWriting the output to a file...")
-    write_output(args.o, json_ready, errors, warnings)
+    write_output(args.o, table, errors, warnings, args.json)
     if check_errors(errors, True): return 1
+    if cache_key: cache.store(cache_key, [output_path], warnings)
     
-    if len(warnings) > 0:
-        print("\nEncountered the following warnings during assembly:")
-        for warn in warnings:
-            print(warn)
+    print_warnings(warnings)
     
     if args.debug: print("Done!")
     return 0
@@ -647,8 +965,11 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description = "Assembler for Luka code files")
     parser.add_argument("--version", "-v", action='version', version='Luka version ' + luka_version, help="Gets the version info")
     parser.add_argument("--debug", "-d", action='store_true', help="Turn on debugging mode to print more information")
+    parser.add_argument("--no-cache", action='store_true', help="Always assemble, rather than reusing the results from an unchanged grammar")
+    parser.add_argument("--no-optimize", action='store_true', help="Assemble the grammar as it is, without the optimization passes")
+    parser.add_argument("--json", action='store_true', help="Output the assembly as json (for debugging) instead of the binary format")
     parser.add_argument("-o", metavar="output", action='store', default=default_assembler_output, help="The file name or path to store the results into")
-    parser.add_argument("filename", action='store', help="The name or relative path to a file to assemble (.py file)")
+    parser.add_argument("filename", action='store', help="The name or relative path to a file to assemble (.lkg file, or .py file)")
     args = parser.parse_args()
 
     sys.exit(main(args))
\ No newline at end of file
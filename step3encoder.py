@@ -1,16 +1,20 @@
 """
 The encoder is the third step in the process
 It encodes the assembly instructions as binary for the processor
-This assembler takes in JSON (.json) files and outputs System Verilog Header (.vh) files
+This encoder takes in binary assembly (.lka) or JSON (.json) files and outputs memory image (.hex) files,
+    which the processor loads with $readmemh
 """
 
 import Instructions
+import AssemblyIR
 from params import default_assembler_output, default_decoder_output, luka_version
-from Encodings import choose_type, get_all_defined_instrs
+from BuildCache import BuildCache
+from Encodings import choose_type, opcode_of, get_all_defined_instrs, encode_table, numpy
 import json
 import argparse
 import sys
 import math
+import os
 
 
 def check_errors(errors, printIt=False):
@@ -47,11 +51,69 @@ def build_default_specs():
         "IMM_W": "5",
         "UIMM_W": "11",
 
-        "NUM_INSTRS": "0",
-        "INSTR_ADDR_W": "0",
+        "NUM_DATA": "32",
+
+        # the smallest the instruction memory is made, see size_instruction_memory for bigger programs
+        "INSTR_MEM_SIZE": "1024",
+        "INSTR_ADDR_W": "10",
     }
 
 
+def size_instruction_memory(specs, num_words):
+    """
+    grows the instruction memory to fit a program, if it's too big for the default
+    the size is rounded up to a power of two, so the processor (and the specs file) only changes
+        when a program crosses into the next size, rather than with every program
+    there's no limit besides that, only that a processor compiled for a smaller memory can't load a bigger program
+    @input specs: a dict mapping "PARAM_NAME":"PARAM_VALUE" (both strings) of specs for our program, changed in place
+    @input num_words: how many instructions the program has
+    @return specs: the same dict, for chaining
+    """
+    # the noop at the start, the program, and its length in the last word
+    needed = num_words + 2
+    addr_w = int(specs["INSTR_ADDR_W"])
+    while (1 << addr_w) < needed:
+        addr_w += 1
+    if (1 << addr_w) > int(specs["INSTR_MEM_SIZE"]):
+        specs["INSTR_MEM_SIZE"] = str(1 << addr_w)
+        specs["INSTR_ADDR_W"] = str(addr_w)
+    return specs
+
+
+def size_data_memory(specs, instructions):
+    """
+    grows the data memory to fit the values a program spills, if they go past the default
+    the loads and stores reach it from x0, or from a register built up from constants (step 2's spill_base_register),
+        so following the constants through the program finds every address
+    @input specs: a dict mapping "PARAM_NAME":"PARAM_VALUE" (both strings) of specs for our program, changed in place
+    @input instructions: an iterable of (op, rd, rs1, rs2, imm) tuples, with None for missing fields,
+        like from InstructionTable.rows or ISASimulator.decode
+    @return specs: the same dict, for chaining
+    """
+    # the simulator imports this file, so it's only imported once it's needed
+    from ISASimulator import semantics
+    value_w = int(specs["VALUE_W"])
+    mask = (1 << value_w) - 1
+    # the registers holding a known value, with x0 always 0
+    known = {0: 0}
+    needed = 0
+    for op, rd, rs1, rs2, imm in instructions:
+        rs1, rs2, imm = rs1 or 0, rs2 or 0, imm or 0
+        if op in ["lw", "sw"] and rs1 in known:
+            needed = max(needed, ((known[rs1] + imm) & mask) + 1)
+        if not rd: continue
+        if op in semantics and rs1 in known and rs2 in known:
+            known[rd] = semantics[op](known[rs1], known[rs2], imm, value_w) & mask
+        else:
+            known.pop(rd, None)
+    # rounded up to a power of two like the instruction memory, so the processor doesn't change with every program
+    num_data = int(specs["NUM_DATA"])
+    while num_data < needed:
+        num_data *= 2
+    specs["NUM_DATA"] = str(num_data)
+    return specs
+
+
 def get_opcode_values():
     """
     generates the default specification variables for our Processor
@@ -62,10 +124,7 @@ def get_opcode_values():
     all_instrs = get_all_defined_instrs()
     
     # get the fn3 and opcode values for each
-    def choose_and_get(instr):
-        tipe = choose_type(instr)
-        return tipe.get_opcode(tipe, instr)
-    opcodes = {instr: choose_and_get(instr) for instr in all_instrs}
+    opcodes = {instr: opcode_of(instr) for instr in all_instrs}
 
     # get the first instruction opcode to know how long each one should be
     op_w = len(opcodes[all_instrs[0]][1])
@@ -106,7 +165,8 @@ def build_parameters_file(params, definition, errors, warnings):
         "REG_ADDR_W": "the number of bits to address a register",
         "IMM_W": "the length of an immediate",
         "UIMM_W": "the length of an upper immediate",
-        "NUM_INSTRS": "how many instructions we have",
+        "NUM_DATA": "the number of words of data memory (for spilled registers), sized to fit the program's spills",
+        "INSTR_MEM_SIZE": "how many words of instruction memory there are (the last holds how many instructions are loaded), sized to fit the program",
         "INSTR_ADDR_W": "how many bits the address of the instruction is (pc length)",
         "INSTR_W": "the length of an instruction",
         "OPTYPE_W": "how many bits to describe the type of instruction",
@@ -124,35 +184,40 @@ def build_parameters_file(params, definition, errors, warnings):
         return [line for line in normal_lines.values()]
 
 
+def assembly_path(filename):
+    """
+    @input filename: the name of the assembly file given on the command line
+    @return: the path of the file in the output folder, with its extension
+    """
+    if filename[-5:] == ".json" or filename[-4:] == ".lka": return "output/" + filename
+    return "output/" + filename + ".lka"
+
+
 def open_instructions(filename, errors, warnings):
     """
-    open the json file at the location and retrieve the instructions list
-    the instructions will take the form {"op": "<command>", "rd:":<val>, "rs1":<val>, "rs2":<val>, "imm":<val>}
+    open the assembly file at the location and retrieve the instructions
+    it's read as json if it ends with .json, otherwise as the binary format (see AssemblyIR.py)
+    the json instructions take the form {"op": "<command>", "rd:":<val>, "rs1":<val>, "rs2":<val>, "imm":<val>}
     @input filename: the name or path of the file to open
     @input errors: a pre-existing list of errors to append our errors to
     @input warnings: a pre-existing list of warnings to append our issues to
-    @input debug: if we are in debugging mode or not
-    @return instructions: a list of dicts representing the program instructions
+    @return table: an InstructionTable of the program instructions
     """
-    # remove .json from the file name
-    if filename[-5:] != ".json":
-        warnings.append("Given filename doesn't end with .json")
-        filename += ".json"
-
     # look in the right folder
-    filename = "output/" + filename
+    filename = assembly_path(filename)
 
-    # load the json
     try:
-        with open(filename) as file:
-            instructions = json.load(file)
+        if filename[-5:] == ".json":
+            with open(filename) as file:
+                return Instructions.InstructionTable.from_dicts(json.load(file))
+        return AssemblyIR.read_table(filename)
     except FileNotFoundError as err:
         errors.append(f"Failed to find the file {filename}: {err}")
-        return None
+    except ValueError as err:
+        errors.append(f"Value Error in reading the instructions: {err}")
     except Exception as err:
         errors.append(f"Failed to open or load the file {filename}: {err}")
-        return None
-    return instructions
+    return None
 
 
 def convert_instruction(instruction, errors, warnings, debug=False):
@@ -203,65 +268,112 @@ def convert_all_instructions(instructions, errors, warnings, debug=False):
     return binary
 
 
-def convert_binary_to_verilog(binaries, specs, errors, warnings, debug=False):
+def convert_binary_to_memory(binaries, specs, errors, warnings, debug=False):
     """
-    given all of the binary instructions, convert it to a format that
-    system verilog can recognize in the form of a .vh file
+    given all of the binary instructions, convert them into a memory image
+    that system verilog can load with $readmemh
     @input binaries: a list of strings for the binaries
     @input specs: a dict mapping "PARAM_NAME":"PARAM_VALUE" (both strings) of specs for our program
     @input errors: a pre-existing list to append our errors to
     @input warnings: a pre-existing list to append our warnings to
     @input debug: if we are in debugging mode or not
-    @return lines: a list of strings for the lines of our system verilog header file
+    @return lines: a list of strings for the lines of the memory image
     """
-    # the size of one instruction
-    bnry_len = len(binaries[0])
-    
-    # start with a noop
-    noop_binary = "".join(["0" * bnry_len])
-    noop = "    " + str(bnry_len) + "'b" + noop_binary
-    lines = [noop]
-
-    # check that they all are the same length and add commas to the lines
+    # check that they all are the length of an instruction
     for i, bnry in enumerate(binaries):
-        if len(bnry) != bnry_len:
-            errors.append("Binary instruction number " + str(i) + " is not the same length as the ones so far")
+        if len(bnry) != int(specs["INSTR_W"]):
+            errors.append("Binary instruction number " + str(i) + " is not " + specs["INSTR_W"] + " bits long")
             return []
-        lines.append("    " + str(bnry_len) + "'b" + bnry + ",") # ex:    32'b0010010011...010100100,
-    
-    # reverse them, as the first instruction will be last in the list due to [max:0] ordering
-    lines = [line for line in reversed(lines)]
+    return build_memory_lines([int(bnry, 2) for bnry in binaries], specs, errors)
 
-    # define some parameters for the instructions
-    define_lines = ["`ifndef INSTRUCTIONS", "`define INSTRUCTIONS", "", '`include "Specs/specs.vh"']
 
-    
-    # update our specs
-    num_instrs = len(lines)
-    specs["NUM_INSTRS"] = str(num_instrs)
+def build_memory_lines(words, specs, errors):
+    """
+    puts the encoded instructions into the memory image's lines, for convert_binary_to_memory and convert_words_to_memory
+    the image is one word per line in hex, starting from address 0
+    the program's length goes into the last word of the memory, so the processor doesn't need it compiled in,
+        and changing the program doesn't mean compiling the processor again
+    @input words: a list (or array) of the encoded instructions as integers
+    @input specs: a dict mapping "PARAM_NAME":"PARAM_VALUE" (both strings) of specs for our program
+    @input errors: a pre-existing list to append our errors to
+    @return lines: a list of strings for the lines of the memory image
+    """
+    mem_size = int(specs["INSTR_MEM_SIZE"])
+    digits = int(math.ceil(int(specs["INSTR_W"]) / 4))
 
-    instr_w = str(bnry_len)
-    specs["INSTR_W"] = instr_w
+    # start with a noop
+    num_instrs = len(words) + 1
+    if num_instrs > mem_size - 1:
+        errors.append(f"The program has {num_instrs} instructions, but the instruction memory only fits {mem_size - 1}")
+        return []
 
-    instr_addr_w = str(int(math.ceil(math.log2(num_instrs))))
-    specs["INSTR_ADDR_W"] = instr_addr_w
+    lines = [f"// {num_instrs} instructions, loaded with $readmemh", "0" * digits]
+    lines += [format(word, "0" + str(digits) + "x") for word in (words.tolist() if hasattr(words, "tolist") else words)]
+    # and the length at the end
+    lines += ["@" + format(mem_size - 1, "x"), format(num_instrs, "0" + str(digits) + "x")]
+    return lines
 
-    var_def_line = "logic [NUM_INSTRS-1:0][INSTR_W-1:0] instr_mem = {"
-    
-    # close and return the variable
-    return define_lines + ["", var_def_line] + lines + ["};", "", "`endif"]
+
+def encode_instructions(table, specs, errors, warnings):
+    """
+    encodes all of the instructions at once into integers (see Encodings.encode_table)
+    this is the faster version of convert_all_instructions
+    @input table: an InstructionTable of all of the instructions
+    @input specs: a dict mapping "PARAM_NAME":"PARAM_VALUE" (both strings) of specs for our program
+    @input errors: a pre-existing list to append our errors to
+    @input warnings: a pre-existing list to append our warnings to
+    @return words: an array of the encoded instructions
+    """
+    try:
+        return encode_table(table, int(specs["INSTR_W"]))
+    except ValueError as err:
+        errors.append("Value Error in converting the instructions: " + str(err))
+    except Exception as err:
+        errors.append("Unrecognized error in instruction conversion: " + str(err))
+    return []
+
+
+def render_binary(words, instr_w):
+    """
+    @input words: an array of the encoded instructions
+    @input instr_w: how many bits an instruction is
+    @return: a list of each instruction as a string of 1s and 0s
+    """
+    if numpy is not None and isinstance(words, numpy.ndarray):
+        # pull every bit out at once, as the characters "0" and "1"
+        shifts = numpy.arange(instr_w - 1, -1, -1, dtype=numpy.uint32)
+        bits = ((words[:, None] >> shifts) & 1).astype(numpy.uint8) + ord("0")
+        text = bits.tobytes().decode("ascii")
+        return [text[start:start + instr_w] for start in range(0, len(text), instr_w)]
+    form = "0" + str(instr_w) + "b"
+    return [format(word, form) for word in words]
+
+
+def convert_words_to_memory(words, specs, errors, warnings, debug=False):
+    """
+    the same as convert_binary_to_memory, but from the encoded integers,
+        which are all the right length already so don't need checking
+    @input words: an array of the encoded instructions
+    @input specs: a dict mapping "PARAM_NAME":"PARAM_VALUE" (both strings) of specs for our program
+    @input errors: a pre-existing list to append our errors to
+    @input warnings: a pre-existing list to append our warnings to
+    @input debug: if we are in debugging mode or not
+    @return lines: a list of strings for the lines of the memory image
+    """
+    return build_memory_lines(words, specs, errors)
 
 
-def write_output(filename, lines, errors, warnings, debug=False):
+def write_output(filename, lines, errors, warnings, debug=False, extension=".vh"):
     """
-    open the file and write the binary there
-    @input filename: the file name or path of where to save our data (should end in .vh)
+    open the file and write the lines there
+    @input filename: the file name or path of where to save our data (should end in the extension)
     @input lines: a list of strings to print to the file (with no newlines at the end)
     @input errors: a pre-existing list of errors to append ours to
     @input warnings: a pre-existing list of warnings to append ours to
+    @input extension: what the file should end in, .vh for the specs or .hex for the memory image
     @return: none
     """
-    if filename[-3:] != ".vh": filename += ".vh"
+    if filename[-len(extension):] != extension: filename += extension
 
     # add new-lines to each line
     lines = [line + "\n" for line in lines]
@@ -273,39 +385,65 @@ def write_output(filename, lines, errors, warnings, debug=False):
         errors.append(f"Error while writing the output: {err}")
 
 
+def print_warnings(warnings):
+    """
+    prints out the warnings from encoding, if there are any
+    @input warnings: the list of warnings
+    @return: none
+    """
+    if len(warnings) > 0:
+        print("Encountered the following warnings during decoding:")
+        for warn in warnings:
+            print(warn)
+
+
 def main(args):
     errors = []
     warnings = []
 
+    # an unchanged assembly can just reuse the last outputs
+    cache = BuildCache(enabled=not args.no_cache, debug=args.debug)
+    input_path = assembly_path(args.filename)
+    output_paths = [
+        "output/" + (args.o if args.o[-4:] == ".hex" else args.o + ".hex"),
+        "Verilog/Specs/specs.vh",
+        "Verilog/Specs/opcodes.vh",
+    ]
+    cache_key = cache.key("encode", [input_path]) if os.path.exists(input_path) else None
+    if cache_key and cache.restore(cache_key, output_paths, warnings):
+        print_warnings(warnings)
+        if args.debug: print("Done!")
+        return 0
+
     if args.debug: print("Reading the instructions...")
-    instruction_dicts = open_instructions(args.filename, errors, warnings)
+    table = open_instructions(args.filename, errors, warnings)
     if check_errors(errors, True): return 1
     if args.debug:
         print("\nGot the following instructions:")
-        for instr in instruction_dicts:
-            print(" -", str(instr))
+        for ndx in range(len(table)):
+            print(" -", table.describe(ndx))
 
     if args.debug: print("\nGetting the default specs values...")
-    specs = build_default_specs()
+    specs = size_data_memory(size_instruction_memory(build_default_specs(), len(table)), table.rows())
 
     if args.debug: print("\nConverting the instructions into binary...")
-    binary = convert_all_instructions(instruction_dicts, errors, warnings, args.debug)
+    words = encode_instructions(table, specs, errors, warnings)
     if check_errors(errors, True): return 1
     if args.debug:
         print("The binary is:")
-        for bnry in binary:
+        for bnry in render_binary(words, int(specs["INSTR_W"])):
             print(" -", bnry)
 
-    if args.debug: print("\nConverting into System Verilog format...")
-    verilog = convert_binary_to_verilog(binary, specs, errors, warnings, args.debug)
+    if args.debug: print("\nConverting into a memory image...")
+    image = convert_words_to_memory(words, specs, errors, warnings, args.debug)
     if check_errors(errors, True): return 1
 
     if args.debug:
-        print("\nWriting the verilog binary to a file...")
-        print("Got verilog lines:")
-        for line in verilog:
+        print("\nWriting the memory image to a file...")
+        print("Got memory lines:")
+        for line in image:
             print(line)
-    write_output("output/" + args.o, verilog, errors, warnings, args.debug)
+    write_output("output/" + args.o, image, errors, warnings, args.debug, ".hex")
     if check_errors(errors, True): return 1
 
     if args.debug: print("\nWriting the specs file...")
@@ -324,12 +462,11 @@ def main(args):
     write_output("Verilog/Specs/opcodes.vh", opcodes_lines, errors, warnings, args.debug)
     if check_errors(errors, True): return 1
 
+    if cache_key: cache.store(cache_key, output_paths, warnings)
+
     if args.debug: print()
     
-    if len(warnings) > 0:
-        print("Encountered the following warnings during decoding:")
-        for warn in warnings:
-            print(warn)
+    print_warnings(warnings)
     
     if args.debug: print("Done!")
     return 0
@@ -340,8 +477,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description = "Encoder for Luka code files")
     parser.add_argument("--version", "-v", action='version', version='Luka version ' + luka_version, help="Gets the version info")
     parser.add_argument("--debug", "-d", action='store_true', help="Turn on debugging mode to print more information")
+    parser.add_argument("--no-cache", action='store_true', help="Always encode, rather than reusing the results from an unchanged assembly")
     parser.add_argument("-o", metavar="output", action='store', default=default_decoder_output, help="The file name or path to store the results into")
-    parser.add_argument("filename", action='store', help="The name or relative path to a file to encode (.json file)")
+    parser.add_argument("filename", action='store', help="The name or relative path to a file to encode (.lka file, or .json file)")
     args = parser.parse_args()
 
     sys.exit(main(args))
\ No newline at end of file
@@ -22,22 +22,24 @@ def check_errors(errors, printIt=False):
 
 def build_inputs_file(filename, errors, warnings):
     """
-    re/creates the inputs.vh file to import whatever our binary file is called
-    allows us to keep our verilog files the same, and just change the 3 lines in this file
-    the processor will import from the vh_params_file, which should be a single import of our binary filename
-    @input filename: the file name or path that stores our binary verilog
+    re/creates the inputs.vh file to point to whatever our memory image is called
+    allows us to keep our verilog files the same, and just change the lines in this file
+    the instruction fetch stage loads the file named by INSTR_MEM_FILE with $readmemh
+    @input filename: the file name or path that stores our memory image
     @input errors: a pre-existing list to append our errors to
     @input warnings: a pre-existing list to append our warnings to
     @return: none
     """
-    # check the ending to make sure it's a .vh file
-    if filename[-3:] != ".vh":
-        warnings.append("Binary file's name does not end in .vh")
-        filename += ".vh"
+    # check the ending to make sure it's a .hex file
+    if filename[-4:] != ".hex":
+        warnings.append("Memory image's name does not end in .hex")
+        filename += ".hex"
     return  [
-        "// This file is dynamically generated to just point to the file where our binary is stored",
-        "// the include path should be relative to the location of this file",
-        f'`include "../output/{filename}"'
+        "// This file is dynamically generated to just point to the file where our memory image is stored",
+        "// the path is relative to where the simulation runs (the output folder), or the Verilog folder",
+        "`ifndef INSTR_MEM_FILE",
+        f'`define INSTR_MEM_FILE "../output/{filename}"',
+        "`endif"
         ]
 
 
@@ -98,7 +100,7 @@ def main(args):
 
     # writes the file out
     if args.debug: print("Writing the linking inputs file")
-    write_output(processor_inputs_file, input_lines, errors, warnings, args.debug)
+    write_output("Verilog/" + processor_inputs_file, input_lines, errors, warnings, args.debug)
     if check_errors(errors, True): return 1
 
     # builds the enums file, which enumerates our internal control signal enums for us
@@ -121,10 +123,10 @@ def main(args):
 
 if __name__ == "__main__":
     # to parse the command line arguments nicely
-    parser = argparse.ArgumentParser(description = "Link our binary vh file into the Processor for Luka")
+    parser = argparse.ArgumentParser(description = "Link our memory image into the Processor for Luka")
     parser.add_argument("--version", "-v", action='version', version='Luka version ' + luka_version, help="Gets the version info")
     parser.add_argument("--debug", "-d", action='store_true', help="Turn on debugging mode to print more information")
-    parser.add_argument("filename", action='store', help="The name or relative path to a file with the binary instructions (.vh file)")
+    parser.add_argument("filename", action='store', help="The name or relative path to a file with the memory image of the instructions (.hex file)")
     args = parser.parse_args()
 
     sys.exit(main(args))
\ No newline at end of file
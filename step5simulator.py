@@ -1,5 +1,6 @@
 import os
 from params import processor_inputs_file, default_outfile, luka_version
+from BuildCache import BuildCache
 import argparse
 import os
 import subprocess
@@ -108,7 +109,67 @@ def compile_code(files_list_filename, out_filename, errors, warnings, debug=Fals
         errors.append("Error compiling processor/simulator: " + str(e))
 
 
-def simulate_code(out_filename, txt_filename, errors, warnings, debug=False):
+def program_plusarg(program):
+    """
+    @input program: the memory image to load the program from, or None
+    @return: the plusarg to pass to vvp for it (with a space in front), or nothing
+    """
+    if program is None: return ""
+    if program[-4:] != ".hex": program += ".hex"
+    return f" +program={program}"
+
+
+def linked_program(inputs_filename, errors):
+    """
+    finds the memory image step 4 linked in, so it can be given to the simulation with +program= like any other
+    @input inputs_filename: the path of the inputs file step 4 writes
+    @input errors: a pre-existing list to append our errors to
+    @return: the path of the memory image, relative to the output folder, or None if it isn't there
+    """
+    try:
+        with open(inputs_filename) as file:
+            for line in file:
+                if line.startswith("`define INSTR_MEM_FILE"):
+                    return line.split('"')[1]
+    except Exception as e:
+        errors.append(f"Error reading {inputs_filename}: {e}")
+        return None
+    errors.append(f"{inputs_filename} doesn't link in a memory image, run step 4 with one first")
+    return None
+
+
+def check_program_fits(program, specs_filename, errors):
+    """
+    checks that a memory image fits in the instruction and data memories the processor is compiled with
+    step 3 grows the memories for bigger programs, so an image made for bigger ones needs its specs file to compile with
+    @input program: the memory image (.hex) in the output folder
+    @input specs_filename: the path of the specs file the processor is compiled with
+    @input errors: a pre-existing list to append our errors to
+    @return: none
+    """
+    from ISASimulator import ISASimulator, read_memory_image
+    if program[-4:] != ".hex": program += ".hex"
+    try:
+        with open(specs_filename) as file:
+            sizes = {line.split()[1]: int(line.split("=")[1].split(";")[0]) for line in file if line.startswith("parameter ")}
+        with open("output/" + program) as file:
+            # the program's length is written at the last address of the memory it was made for
+            last = max([int(line.strip()[1:], 16) for line in file if line.startswith("@")], default=0)
+        # loading it sizes the data memory for its spills, the same as step 3 does
+        simulator = ISASimulator()
+        simulator.load(read_memory_image("output/" + program))
+    except Exception as e:
+        errors.append(f"Error checking the size of {program}: {e}")
+        return
+    if last >= sizes["INSTR_MEM_SIZE"]:
+        errors.append(f"{program} was made for an instruction memory of {last + 1} words, but the processor has {sizes['INSTR_MEM_SIZE']}, "
+            + "encode it again with step 3 (which sizes the specs for it) and compile the processor with those specs")
+    if simulator.num_data > sizes["NUM_DATA"]:
+        errors.append(f"{program} spills into {simulator.num_data} words of data memory, but the processor has {sizes['NUM_DATA']}, "
+            + "encode it again with step 3 (which sizes the specs for it) and compile the processor with those specs")
+
+
+def simulate_code(out_filename, txt_filename, errors, warnings, debug=False, program=None):
     """
     run the command to simulate the compiled processor, both capturing the result into a file and generating a vcd
     @input out_filename: the name of our processor and simulator compiled by Iverilog, as a .out file
@@ -116,6 +177,8 @@ def simulate_code(out_filename, txt_filename, errors, warnings, debug=False):
     @input errors: a pre-existing list to append our errors to
     @input warnings: a pre-existing list to append our warnings to
     @input debug: whether we are in debug mode or not (to print more information)
+    @input program: the memory image (.hex) to load the program from, or None for the one in inputs.vh
+        it's given to the simulation as +program=<file>, so the same compiled processor can run any program
     @return: none
     """
     # check the ending to make sure it's a .out file
@@ -130,10 +193,10 @@ def simulate_code(out_filename, txt_filename, errors, warnings, debug=False):
             txt_filename += ".txt"
 
         # run the command
-        command = f"vvp {out_filename} > {txt_filename}"
+        command = f"vvp {out_filename}{program_plusarg(program)} > {txt_filename}"
     # if txt_filename is None:
     else:
-        command = f"vvp {out_filename}"
+        command = f"vvp {out_filename}{program_plusarg(program)}"
 
     if debug: print(">", command)
 
@@ -213,14 +276,30 @@ def main(args):
     write_output("./Verilog/" + s_necessary_files, files_list, errors, warnings, args.debug)
     if check_errors(errors, True): return 1
 
-    # compile the code to a .out file
-    if args.debug: print("Compiling the processor/simulator")
-    compile_code(s_necessary_files, args.o, errors, warnings, args.debug)
+    # the program is always given to the simulation with +program=, so the one inputs.vh links in isn't compiled in
+    program = args.program if args.program is not None else linked_program("./Verilog/" + processor_inputs_file, errors)
+    if program is not None and program[-4:] != ".hex": program += ".hex"
+    if check_errors(errors, True): return 1
+    check_program_fits(program, "Verilog/Specs/specs.vh", errors)
     if check_errors(errors, True): return 1
 
+    # compile the code to a .out file, unless the same processor has been compiled before
+    # the key is only the hardware (its sources and specs) and the program it runs, not inputs.vh or the python steps
+    cache = BuildCache(enabled=not args.no_cache, debug=args.debug)
+    out_filename = args.o if args.o[-4:] == ".out" else args.o + ".out"
+    hardware_files = ["Verilog/" + filename for filename in files_list + ["Simulator.sv"] if filename != processor_inputs_file]
+    cache_key = cache.key("simulator", hardware_files + ["output/" + program], fingerprint=False)
+    if cache.restore(cache_key, ["output/" + out_filename], warnings):
+        if args.debug: print("Reusing the compiled processor/simulator")
+    else:
+        if args.debug: print("Compiling the processor/simulator")
+        compile_code(s_necessary_files, out_filename, errors, warnings, args.debug)
+        if check_errors(errors, True): return 1
+        cache.store(cache_key, ["output/" + out_filename], warnings)
+
     # run the .out file with vvp to generate a .vcd and a .txt of the printing
     if args.debug: print("Running the simulation")
-    simulate_code(args.o, args.save, errors, warnings, args.debug)
+    simulate_code(out_filename, args.save, errors, warnings, args.debug, program)
     if check_errors(errors, True): return 1
 
     # print the results
@@ -246,6 +325,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description = "Simulate the Processor for Luka")
     parser.add_argument("--version", "-v", action='version', version='Luka version ' + luka_version, help="Gets the version info")
     parser.add_argument("--debug", "-d", action='store_true', help="Turn on debugging mode to print more information")
+    parser.add_argument("--no-cache", action='store_true', help="Always compile the processor, rather than reusing it when the verilog hasn't changed")
+    parser.add_argument("--program", "-p", metavar="file", action='store', default=None,
+        help="The memory image (.hex file) in the output folder to run, rather than the one linked in by step 4")
     parser.add_argument("-o", metavar="output", action='store', default=default_outfile, help="The file name or path to store the .out file")
     parser.add_argument("--gtkwave", "-g", action='store_true', help="Open gtkwave on the simulation results")
     parser.add_argument("--save", "-s", action='store', default=None, help="The name of the file to store the text-based simulation outputs")